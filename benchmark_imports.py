@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Every module of the project, timed on its own in a fresh interpreter
+MODULES = (
+    'config',
+    'lazy_imports',
+    'instrumentation',
+    'employee_objects',
+    'employee_table',
+    'employee_snapshot',
+    'bulk_insert',
+    'storage_backend',
+    'sharding',
+    'data_version',
+    'query_trace',
+    'database_connection',
+    'http_cache',
+    'fetch_employees',
+    'update_table_structure',
+    'create_mysql_employees',
+    'insert_employees_with_class',
+    'quarantine_loader',
+    'parallel_loader',
+    'pipeline',
+    'generate_employees',
+    'benchmark_suite',
+    'test_api',
+    'export_employees',
+    'payroll',
+    'payroll_summary',
+    'check_table',
+    'employee_api',
+)
+
+# Dependencies that must not be loaded merely by importing a module; they are
+# only allowed to load once something actually talks to MySQL or HTTP, or runs
+# a column operation
+HEAVY_MODULES = ('mysql.connector', 'requests', 'numpy')
+
+REPEAT = 5
+DEFAULT_TOLERANCE = 0.25   # allowed slowdown against a baseline (25%)
+
+# Prints which heavy modules were really executed (a lazy module stays a
+# subclass of ModuleType until its first attribute access)
+_PROBE = """
+import sys, types, json
+import {module}
+loaded = [name for name in {heavy!r}
+          if name in sys.modules and type(sys.modules[name]) is types.ModuleType]
+print(json.dumps(loaded))
+"""
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def measure(module, python=sys.executable):
+    """
+    Import module once in a fresh interpreter.
+    Returns (cumulative import time in microseconds, heavy modules it loaded).
+    """
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()[-2000:]}")
+
+    cumulative = None
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        # The module itself is the only top-level (unindented) entry with its name
+        if match and match.group(3) == module and not match.group(2):
+            cumulative = int(match.group(1))
+    return cumulative, json.loads(result.stdout)
+
+
+def run_benchmark(modules=MODULES, repeat=REPEAT):
+    """
+    Best-of-repeat import time for each module, in milliseconds, plus the
+    heavy dependencies each one pulled in. Returns {module: {'ms', 'heavy'}}.
+    """
+    results = {}
+    for module in modules:
+        timings = []
+        heavy = []
+        for _ in range(repeat):
+            micros, heavy = measure(module)
+            timings.append(micros)
+        results[module] = {'ms': min(timings) / 1000, 'heavy': heavy}
+    return results
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE, slack_ms=1.0):
+    """
+    Modules that got slower than baseline by more than tolerance (and by
+    more than slack_ms, so sub-millisecond noise is ignored), plus every
+    module that imports a heavy dependency eagerly
+    """
+    problems = []
+    for module, result in results.items():
+        if result['heavy']:
+            problems.append(f"{module} eagerly imports {', '.join(result['heavy'])}")
+        before = baseline.get(module, {}).get('ms')
+        if before is not None and result['ms'] > before * (1 + tolerance) and result['ms'] - before > slack_ms:
+            problems.append(f"{module} import time {result['ms']:.1f} ms (baseline {before:.1f} ms)")
+    return problems
+
+
+def main():
+    """
+    Time the import of every module and fail on regressions.
+
+    Exits with status 1 when a module eagerly imports mysql.connector,
+    requests or numpy, or (with --compare) is slower than the baseline.
+    """
+    parser = argparse.ArgumentParser(description="Import-time regression benchmark")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="fresh interpreters per module (best is kept)")
+    parser.add_argument('--save', metavar='PATH', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="fail if slower than this baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'module':<30} {'import ms':>10}  heavy deps loaded")
+        for module, result in results.items():
+            print(f"{module:<30} {result['ms']:>10.1f}  {', '.join(result['heavy']) or '-'}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    problems = find_regressions(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from generate_employees import write_dataset, DEFAULT_SEED
+
+# Measured operations, each run on its own in a fresh interpreter
+BENCHMARKS = (
+    'json_load_envelope',   # stream-decode the employees.json envelope
+    'json_load_ndjson',     # stream-decode the same records as NDJSON
+    'employee_objects',     # decode and build a list of Employee objects
+    'payroll_math',         # yearly_salary() and promotion() over Employee objects
+    'payroll_columnar',     # the same figures from an EmployeeTable
+    'bulk_insert',          # load the dataset into the storage backend
+    'export',               # stream the table back out as NDJSON
+)
+
+DEFAULT_SIZES = (1000, 100000)
+REPEAT = 3
+DEFAULT_TOLERANCE = 0.25   # allowed slowdown / memory growth against a baseline (25%)
+DATA_DIR = '.bench_data'
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def dataset_paths(size, data_dir=DATA_DIR, seed=DEFAULT_SEED):
+    """
+    Envelope and NDJSON files of size synthetic employees, generated on first
+    use and reused afterwards (the generator is deterministic for a seed)
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for format, suffix in (('envelope', 'json'), ('ndjson', 'ndjson')):
+        path = os.path.join(data_dir, f"employees_{size}_{seed}.{suffix}")
+        if not os.path.exists(path):
+            write_dataset(path, size, format, seed)
+        paths[format] = path
+    return paths
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _scratch_backend(name, work_dir):
+    from storage_backend import get_backend
+    if name == 'sqlite':
+        path = os.path.join(work_dir, 'bench.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        backend = get_backend('sqlite', path=path)
+    else:
+        backend = get_backend(name)
+    backend.ensure_schema()
+    backend.clear()
+    return backend
+
+
+def _run_benchmark(name, paths, backend_name, work_dir):
+    """
+    Set up and run one benchmark in this process.
+    Returns (seconds spent in the measured section, rows processed).
+    """
+    from employee_objects import iter_employee_records, iter_employees
+
+    if name in ('json_load_envelope', 'json_load_ndjson'):
+        path = paths['envelope' if name == 'json_load_envelope' else 'ndjson']
+        start = time.perf_counter()
+        rows = sum(1 for _ in iter_employee_records(path))
+        return time.perf_counter() - start, rows
+
+    if name == 'employee_objects':
+        start = time.perf_counter()
+        employees = list(iter_employees(paths['envelope']))
+        return time.perf_counter() - start, len(employees)
+
+    if name == 'payroll_math':
+        employees = list(iter_employees(paths['envelope']))
+        start = time.perf_counter()
+        sum(emp.yearly_salary() for emp in employees)
+        sum(emp.promotion() for emp in employees)
+        return time.perf_counter() - start, len(employees)
+
+    if name == 'payroll_columnar':
+        from employee_table import EmployeeTable
+        table = EmployeeTable.from_json(paths['envelope'], use_snapshot=False)
+        table.promotion()   # warm-up: numpy is imported on first use
+        start = time.perf_counter()
+        table.total_yearly_salary()
+        sum(table.promotion())
+        return time.perf_counter() - start, len(table)
+
+    from bulk_insert import employee_rows
+    backend = _scratch_backend(backend_name, work_dir)
+
+    if name == 'bulk_insert':
+        start = time.perf_counter()
+        stats = backend.bulk_insert(employee_rows(iter_employees(paths['envelope'])))
+        return time.perf_counter() - start, stats['rows']
+
+    if name == 'export':
+        from export_employees import export_employees
+        backend.bulk_insert(employee_rows(iter_employees(paths['envelope'])))
+        start = time.perf_counter()
+        rows = export_employees(os.path.join(work_dir, 'export.ndjson'), 'ndjson', backend=backend)
+        return time.perf_counter() - start, rows
+
+    raise ValueError(f"Unknown benchmark '{name}', expected one of {BENCHMARKS}")
+
+
+def measure(name, size, backend='sqlite', data_dir=DATA_DIR, python=sys.executable):
+    """
+    Run one benchmark on a dataset of size rows in a fresh interpreter, so
+    its peak RSS is its own. Returns {'seconds', 'rows', 'peak_rss_mb'}.
+    """
+    paths = dataset_paths(size, data_dir)
+    env = dict(os.environ, LOG_LEVEL='WARNING')
+    # The child's metrics would be appended to the run's own files
+    env.pop('METRICS_JSON_FILE', None)
+    env.pop('METRICS_PROM_FILE', None)
+    with tempfile.TemporaryDirectory() as work_dir:
+        result = subprocess.run(
+            [python, os.path.abspath(__file__), '--run-one', name, '--backend', backend,
+             '--envelope', os.path.abspath(paths['envelope']), '--ndjson', os.path.abspath(paths['ndjson']),
+             '--work-dir', work_dir],
+            capture_output=True, text=True, cwd=_HERE, env=env,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark {name}[{size}] failed:\n{result.stderr.strip()[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_suite(benchmarks=BENCHMARKS, sizes=DEFAULT_SIZES, backend='sqlite', repeat=REPEAT, data_dir=DATA_DIR):
+    """
+    Best-of-repeat time and peak RSS of every benchmark at every size.
+    Returns {'meta': {...}, 'results': {'name[size]': {'seconds', 'rows',
+    'rows_per_sec', 'peak_rss_mb'}}}.
+    """
+    results = {}
+    for size in sizes:
+        for name in benchmarks:
+            runs = [measure(name, size, backend, data_dir) for _ in range(repeat)]
+            seconds = min(run['seconds'] for run in runs)
+            rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+            results[f"{name}[{size}]"] = {
+                'seconds': seconds,
+                'rows': runs[0]['rows'],
+                'rows_per_sec': runs[0]['rows'] / seconds if seconds > 0 else 0.0,
+                'peak_rss_mb': min(rss) if rss else None,
+            }
+    return {'meta': _metadata(backend, repeat), 'results': results}
+
+
+def _metadata(backend, repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=_HERE).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'repeat': repeat,
+        'seed': DEFAULT_SEED,
+        'timestamp': time.time(),
+    }
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE, slack_seconds=0.005, slack_mb=2.0):
+    """
+    Benchmarks that got slower, or used more memory, than baseline by more
+    than tolerance (ignoring differences under slack_seconds / slack_mb)
+    """
+    problems = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if (result['seconds'] > before['seconds'] * (1 + tolerance)
+                and result['seconds'] - before['seconds'] > slack_seconds):
+            problems.append(f"{key} took {result['seconds']:.3f}s (baseline {before['seconds']:.3f}s)")
+        if (result['peak_rss_mb'] is not None and before.get('peak_rss_mb') is not None
+                and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance)
+                and result['peak_rss_mb'] - before['peak_rss_mb'] > slack_mb):
+            problems.append(f"{key} peak RSS {result['peak_rss_mb']:.1f} MiB "
+                            f"(baseline {before['peak_rss_mb']:.1f} MiB)")
+    return problems
+
+
+def _run_one(args):
+    """Child side of measure(): run one benchmark and print its result as JSON"""
+    paths = {'envelope': args.envelope, 'ndjson': args.ndjson}
+    seconds, rows = _run_benchmark(args.run_one, paths, args.backend, args.work_dir)
+    print(json.dumps({'seconds': seconds, 'rows': rows, 'peak_rss_mb': _peak_rss_mb()}))
+    return 0
+
+
+def main():
+    """
+    Run the benchmark suite and fail on regressions.
+
+    Exits with status 1 when (with --compare) a benchmark is slower or uses
+    more memory than the baseline by more than --tolerance.
+    """
+    parser = argparse.ArgumentParser(description="Loader, payroll and export benchmarks on synthetic data")
+    parser.add_argument('benchmarks', nargs='*', default=BENCHMARKS)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="dataset sizes in rows (e.g. 1000 100000 10000000)")
+    parser.add_argument('--backend', default='sqlite',
+                        help="storage backend for bulk_insert/export; 'mysql' empties the configured table")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="fresh interpreters per benchmark (best is kept)")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated datasets are kept")
+    parser.add_argument('--save', metavar='PATH', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="fail if slower or larger than this baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    # Used by measure() to run a single benchmark in a child interpreter
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--envelope', help=argparse.SUPPRESS)
+    parser.add_argument('--ndjson', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        return _run_one(args)
+
+    suite = run_suite(args.benchmarks, args.sizes, args.backend, args.repeat, args.data_dir)
+    results = suite['results']
+
+    if args.json:
+        print(json.dumps(suite, indent=2))
+    else:
+        print(f"{'benchmark':<32} {'seconds':>10} {'rows/sec':>14} {'peak RSS MiB':>13}")
+        for key, result in results.items():
+            rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else '-'
+            print(f"{key:<32} {result['seconds']:>10.4f} {result['rows_per_sec']:>14,.0f} {rss:>13}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(suite, f, indent=2)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    problems = find_regressions(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import tempfile
+import time
+from itertools import islice
+
+from config import env
+from instrumentation import increment, timer
+
+# Columns written for each employee row, in the order rows are supplied.
+# yearly_salary is a generated column, so it is never sent over the wire.
+EMPLOYEE_COLUMNS = ('source_id', 'name', 'monthly_salary', 'age', 'row_hash')
+
+# Columns refreshed when an upsert finds an existing row for the same source_id
+EMPLOYEE_UPDATE_COLUMNS = ('name', 'monthly_salary', 'age', 'row_hash')
+
+# Columns used by the hand-written sample data, which has no source ids
+SAMPLE_COLUMNS = ('name', 'monthly_salary', 'age')
+
+# Defaults (can be overridden in .env)
+DEFAULT_BATCH_SIZE = env('INSERT_BATCH_SIZE', 1000, int)
+DEFAULT_COMMIT_EVERY = env('INSERT_COMMIT_EVERY', 50000, int)
+DEFAULT_METHOD = env('INSERT_METHOD', 'values')
+
+INSERT_METHODS = ('values', 'executemany', 'load_data')
+
+
+def upsert_method(method=DEFAULT_METHOD):
+    """
+    The insert method to upsert with: load_data cannot upsert, so it falls back to 'values'
+    """
+    return 'values' if method == 'load_data' else method
+
+
+def employee_rows(employees):
+    """
+    Convert Employee objects to row tuples matching EMPLOYEE_COLUMNS
+    """
+    for emp in employees:
+        yield (emp.id, emp.name, emp.salary, emp.age, emp.content_hash())
+
+
+def iter_batches(rows, batch_size):
+    """
+    Split any iterable of rows into lists of at most batch_size rows
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _on_duplicate_clause(update_columns):
+    """
+    Row alias and ON DUPLICATE KEY UPDATE suffix turning an INSERT into an upsert.
+    The alias form (MySQL 8.0.19+) replaces VALUES(col), deprecated since 8.0.20.
+    """
+    if not update_columns:
+        return ''
+    assignments = ', '.join(f"{column} = new.{column}" for column in update_columns)
+    return f" AS new ON DUPLICATE KEY UPDATE {assignments}"
+
+
+def _insert_values(cursor, table, columns, batch, update_columns=None):
+    """Send one batch as a single multi-row INSERT ... VALUES statement"""
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    query = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+        + ', '.join([placeholders] * len(batch))
+        + _on_duplicate_clause(update_columns)
+    )
+    params = [value for row in batch for value in row]
+    cursor.execute(query, params)
+
+
+def _insert_executemany(cursor, table, columns, batch, update_columns=None):
+    """Send one batch through executemany (the driver rewrites it to a multi-row INSERT)"""
+    query = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+        + _on_duplicate_clause(update_columns)
+    )
+    cursor.executemany(query, batch)
+
+
+def _tsv_field(value):
+    """Format a value for LOAD DATA's default escaping rules"""
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _insert_load_data(cursor, table, columns, batch, update_columns=None):
+    """
+    Stream one batch to a temporary TSV file and load it with LOAD DATA LOCAL INFILE.
+    The connection must be opened with allow_local_infile=True (ALLOW_LOCAL_INFILE=1 in .env).
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8',
+                                     newline='\n', delete=False) as f:
+        for row in batch:
+            f.write('\t'.join(_tsv_field(value) for value in row))
+            f.write('\n')
+        path = f.name
+
+    try:
+        # MySQL expects forward slashes and escaped quotes in the file name literal
+        literal = path.replace('\\', '/').replace("'", "\\'")
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{literal}' INTO TABLE {table} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+            f"({', '.join(columns)})"
+        )
+    finally:
+        os.remove(path)
+
+
+def _commit(connection):
+    with timer('db_commit_seconds'):
+        connection.commit()
+    increment('db_commits')
+
+
+_INSERTERS = {
+    'values': _insert_values,
+    'executemany': _insert_executemany,
+    'load_data': _insert_load_data,
+}
+
+
+def bulk_insert(connection, rows, table='employees', columns=EMPLOYEE_COLUMNS,
+                batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY,
+                method=DEFAULT_METHOD, update_columns=None):
+    """
+    Insert rows in batches instead of one round trip per row.
+
+    rows can be any iterable (including a generator) of tuples ordered like
+    columns. method is one of 'values' (multi-row INSERT), 'executemany' or
+    'load_data' (LOAD DATA LOCAL INFILE from a temporary TSV per batch).
+    The transaction is committed whenever at least commit_every rows are
+    pending, and once more at the end; commit_every=None commits only at the end.
+    Passing update_columns turns the insert into an upsert
+    (INSERT ... ON DUPLICATE KEY UPDATE), which the load_data method does not support.
+
+    Returns a dict with rows, batches, commits, seconds and rows_per_sec.
+    Each batch and commit is also timed in the instrumentation registry
+    (db_batch_seconds, db_commit_seconds).
+    mysql.connector.Error propagates to the caller; batches committed before
+    the failure stay in the table.
+    """
+    if method not in _INSERTERS:
+        raise ValueError(f"Unknown insert method '{method}', expected one of {INSERT_METHODS}")
+    if update_columns and method == 'load_data':
+        raise ValueError("The load_data method cannot upsert; use 'values' or 'executemany'")
+    insert_batch = _INSERTERS[method]
+
+    cursor = connection.cursor()
+    stats = {'rows': 0, 'batches': 0, 'commits': 0}
+    pending = 0
+    start = time.perf_counter()
+
+    try:
+        for batch in iter_batches(rows, batch_size):
+            with timer('db_batch_seconds'):
+                insert_batch(cursor, table, columns, batch, update_columns)
+            stats['rows'] += len(batch)
+            stats['batches'] += 1
+            pending += len(batch)
+            increment('db_rows', len(batch))
+            increment('db_batches')
+
+            if commit_every and pending >= commit_every:
+                _commit(connection)
+                stats['commits'] += 1
+                pending = 0
+
+        if pending:
+            _commit(connection)
+            stats['commits'] += 1
+    finally:
+        cursor.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return stats
+
+
+def format_insert_stats(stats):
+    """
+    One-line summary of bulk_insert() results
+    """
+    return (
+        f"{stats['rows']} rows in {stats['batches']} batches, {stats['commits']} commits, "
+        f"{stats['seconds']:.3f}s ({stats['rows_per_sec']:,.0f} rows/sec)"
+    )
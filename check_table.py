@@ -0,0 +1,264 @@
+import argparse
+import json
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from config import env
+from database_connection import get_connection
+from employee_objects import iter_employees
+from instrumentation import get_logger, increment
+from lazy_imports import lazy_import
+from payroll import ROW_HASH_SQL
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Checker tuning (can be overridden in .env)
+CHECK_CHUNK_SIZE = env('CHECK_CHUNK_SIZE', 10000, int)   # source ids per top-level chunk
+CHECK_WORKERS = env('CHECK_WORKERS', 4, int)             # concurrent checksum queries
+CHECK_LEAF_SIZE = 64      # ranges this small are compared row by row
+CHECK_FANOUT = 16         # sub-ranges a differing range is split into
+SLICE_CHUNKS = 64         # top-level chunks summed by one grouped query
+
+# Per-row checksum: CRC32 of the source id and the content hash, computed
+# server-side from the columns themselves (not the stored row_hash, which a
+# corrupted row would not update)
+ROW_CHECKSUM_SQL = f"CRC32(CONCAT_WS(CHAR(31), source_id, {ROW_HASH_SQL}))"
+
+# (count, BIT_XOR, SUM) of the row checksums in each step-wide part of [low, high)
+_RANGE_CHECKSUM_QUERY = f"""
+    SELECT FLOOR((source_id - %s) / %s) AS part, COUNT(*), BIT_XOR(checksum), SUM(checksum)
+    FROM (
+        SELECT source_id, {ROW_CHECKSUM_SQL} AS checksum
+        FROM employees WHERE source_id >= %s AND source_id < %s
+    ) AS rows_in_range
+    GROUP BY part
+"""
+
+_ROW_CHECKSUM_QUERY = (
+    f"SELECT source_id, {ROW_CHECKSUM_SQL} FROM employees WHERE source_id >= %s AND source_id < %s"
+)
+
+
+def row_checksum(emp):
+    """Client-side twin of ROW_CHECKSUM_SQL for one Employee"""
+    return zlib.crc32(f"{emp.id}\x1f{emp.content_hash()}".encode('utf-8'))
+
+
+def _add(checksums, key, crc):
+    entry = checksums.get(key)
+    if entry is None:
+        checksums[key] = [1, crc, crc]
+    else:
+        entry[0] += 1
+        entry[1] ^= crc
+        entry[2] += crc
+
+
+def source_checksums(json_file, chunk_size=CHECK_CHUNK_SIZE, format=None):
+    """
+    One streaming pass over the feed: {chunk: [count, xor, sum]} of the row
+    checksums of every chunk_size-wide source id range. Memory grows with
+    the number of chunks, not rows.
+    """
+    checksums = {}
+    for emp in iter_employees(json_file, format):
+        _add(checksums, int(emp.id) // chunk_size, row_checksum(emp))
+    return checksums
+
+
+def _source_rows(json_file, chunks, chunk_size, format=None):
+    """
+    Second pass, only when chunks differ: {chunk: {source_id: checksum}} for
+    the rows of those chunks (the last occurrence of a repeated id wins, as
+    it does when the loaders upsert)
+    """
+    rows = {chunk: {} for chunk in chunks}
+    for emp in iter_employees(json_file, format):
+        emp_id = int(emp.id)
+        bucket = rows.get(emp_id // chunk_size)
+        if bucket is not None:
+            bucket[emp_id] = row_checksum(emp)
+    return rows
+
+
+def _table_checksums(connection, low, high, step):
+    """Server-side (count, xor, sum) per step-wide part of [low, high), as {part: tuple}"""
+    cursor = connection.cursor()
+    cursor.execute(_RANGE_CHECKSUM_QUERY, (low, step, low, high))
+    result = {int(part): (int(count), int(xor), int(total)) for part, count, xor, total in cursor.fetchall()}
+    cursor.close()
+    increment('check_checksum_queries')
+    return result
+
+
+def _table_slice(low_chunk, high_chunk, chunk_size):
+    """Checksums of chunks low_chunk..high_chunk-1 over a pooled connection (runs in a worker)"""
+    with get_connection(read_only=True) as connection:
+        parts = _table_checksums(connection, low_chunk * chunk_size, high_chunk * chunk_size, chunk_size)
+    return {low_chunk + part: checksum for part, checksum in parts.items()}
+
+
+def _key_span(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT MIN(source_id), MAX(source_id), COUNT(source_id) FROM employees")
+    span = cursor.fetchone()
+    cursor.close()
+    return span
+
+
+def _drill_down(connection, low, high, rows, differences, stats):
+    """
+    Narrow a differing source id range [low, high) down to the rows that
+    differ: split it into CHECK_FANOUT sub-ranges, compare their checksums
+    and recurse only into those that disagree, comparing row by row once a
+    range is at most CHECK_LEAF_SIZE ids wide. rows is {source_id: checksum}
+    of the feed rows in the range.
+    """
+    if high - low <= CHECK_LEAF_SIZE:
+        cursor = connection.cursor()
+        cursor.execute(_ROW_CHECKSUM_QUERY, (low, high))
+        table = {int(source_id): int(crc) for source_id, crc in cursor.fetchall()}
+        cursor.close()
+        stats['leaf_ranges'] += 1
+        differences['missing'].extend(rows.keys() - table.keys())
+        differences['extra'].extend(table.keys() - rows.keys())
+        differences['changed'].extend(emp_id for emp_id in rows.keys() & table.keys()
+                                      if rows[emp_id] != table[emp_id])
+        return
+
+    step = -(-(high - low) // CHECK_FANOUT)
+    table_parts = _table_checksums(connection, low, high, step)
+    stats['queries'] += 1
+    source_parts = {}
+    sub_rows = {}
+    for emp_id, crc in rows.items():
+        part = (emp_id - low) // step
+        _add(source_parts, part, crc)
+        sub_rows.setdefault(part, {})[emp_id] = crc
+
+    for part in sorted(source_parts.keys() | table_parts.keys()):
+        source = tuple(source_parts[part]) if part in source_parts else None
+        if source != table_parts.get(part):
+            _drill_down(connection, low + part * step, min(high, low + (part + 1) * step),
+                        sub_rows.get(part, {}), differences, stats)
+
+
+def _check_chunk(chunk, chunk_size, rows):
+    """Drill into one differing chunk over its own pooled connection (runs in a worker)"""
+    differences = {'missing': [], 'extra': [], 'changed': []}
+    stats = {'queries': 0, 'leaf_ranges': 0}
+    with get_connection(read_only=True) as connection:
+        _drill_down(connection, chunk * chunk_size, (chunk + 1) * chunk_size, rows, differences, stats)
+    return differences, stats
+
+
+def check_table(json_file='employees.json', chunk_size=CHECK_CHUNK_SIZE, workers=CHECK_WORKERS, format=None):
+    """
+    Compare a feed file with the employees table without pulling the table
+    to the client.
+
+    Both sides are split into chunk_size-wide source id ranges and reduced
+    to (count, BIT_XOR, SUM) of per-row CRC32 checksums: the feed in one
+    streaming pass, the table with grouped aggregate queries (SLICE_CHUNKS
+    chunks per query, workers queries at a time). Only chunks that disagree
+    are drilled into, recursively, down to the individual rows, so a
+    consistent table costs one checksum row per chunk. Rows without a
+    source_id (the hand-inserted sample data) are not compared.
+
+    Returns a dict with source_rows, table_rows, chunks, mismatched_chunks,
+    missing (ids in the feed but not the table), extra (in the table but not
+    the feed), changed (ids whose contents differ), queries and seconds.
+    """
+    start = time.perf_counter()
+    source = source_checksums(json_file, chunk_size, format)
+
+    with get_connection(read_only=True) as connection:
+        low_id, high_id, table_rows = _key_span(connection)
+    keys = set(source)
+    if low_id is not None:
+        keys.update((int(low_id) // chunk_size, int(high_id) // chunk_size))
+    result = {
+        'source_rows': sum(entry[0] for entry in source.values()),
+        'table_rows': table_rows,
+        'chunks': 0,
+        'mismatched_chunks': [],
+        'missing': [],
+        'extra': [],
+        'changed': [],
+        'queries': 1,
+    }
+    if not keys:
+        result['seconds'] = time.perf_counter() - start
+        return result
+
+    first, last = min(keys), max(keys) + 1
+    result['chunks'] = last - first
+    slices = [(low, min(low + SLICE_CHUNKS, last)) for low in range(first, last, SLICE_CHUNKS)]
+    table = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for checksums in executor.map(lambda bounds: _table_slice(*bounds, chunk_size), slices):
+            table.update(checksums)
+    result['queries'] += len(slices)
+
+    mismatched = sorted(
+        chunk for chunk in source.keys() | table.keys()
+        if (tuple(source[chunk]) if chunk in source else None) != table.get(chunk)
+    )
+    result['mismatched_chunks'] = mismatched
+    if mismatched:
+        rows = _source_rows(json_file, mismatched, chunk_size, format)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_check_chunk, chunk, chunk_size, rows[chunk]) for chunk in mismatched]
+            for future in futures:
+                differences, stats = future.result()
+                for key in ('missing', 'extra', 'changed'):
+                    result[key].extend(differences[key])
+                result['queries'] += stats['queries'] + stats['leaf_ranges']
+        for key in ('missing', 'extra', 'changed'):
+            result[key].sort()
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    """
+    Check the employees table against a feed file; exits with status 1 when
+    they differ
+    """
+    parser = argparse.ArgumentParser(description="Checksum-compare a feed file with the employees table")
+    parser.add_argument('--json-file', default='employees.json', help="source file (envelope, NDJSON or gzip)")
+    parser.add_argument('--chunk-size', type=int, default=CHECK_CHUNK_SIZE, help="source ids per chunk")
+    parser.add_argument('--workers', type=int, default=CHECK_WORKERS, help="concurrent checksum queries")
+    parser.add_argument('--show', type=int, default=20, help="ids listed per kind of difference")
+    parser.add_argument('--json', action='store_true', help="print the full result as JSON")
+    args = parser.parse_args()
+
+    try:
+        result = check_table(args.json_file, args.chunk_size, args.workers)
+    except mysql.connector.Error as e:
+        log.error(f"Error checking table: {e}")
+        return 2
+
+    consistent = not (result['missing'] or result['extra'] or result['changed'])
+    if args.json:
+        print(json.dumps(result))
+        return 0 if consistent else 1
+
+    print(f"Compared {result['source_rows']} feed rows with {result['table_rows']} table rows "
+          f"in {result['chunks']} chunks ({result['queries']} queries, {result['seconds']:.3f}s)")
+    for key, label in (('missing', 'missing from the table'), ('extra', 'not in the feed'),
+                       ('changed', 'with different contents')):
+        ids = result[key]
+        if ids:
+            more = f" ... (+{len(ids) - args.show})" if len(ids) > args.show else ''
+            print(f"  {len(ids)} employees {label}: {', '.join(map(str, ids[:args.show]))}{more}")
+    print("Table is consistent with the feed" if consistent else "Table differs from the feed")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=None)
+def load_env():
+    """
+    Read the .env file into the environment, once per process.
+    Values already set in the real environment take precedence.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def env(name, default=None, cast=None):
+    """
+    Setting from the environment (after .env has been loaded), falling back
+    to default and converted with cast when given, e.g. env('POOL_SIZE', 5, int)
+    """
+    load_env()
+    value = os.environ.get(name, default)
+    if value is None or cast is None:
+        return value
+    return cast(value)
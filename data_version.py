@@ -0,0 +1,61 @@
+import threading
+
+# Callbacks run in this process whenever a loader changes the employees table
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def on_change(callback):
+    """
+    Register callback(version) to run after this process changes the employees table
+    """
+    with _listeners_lock:
+        _listeners.append(callback)
+
+
+def ensure_data_version_table(connection):
+    """
+    Create the single-row table that counts writes to the employees table
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS employee_data_version (
+            id TINYINT PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    """)
+    cursor.close()
+
+
+def read_data_version(connection):
+    """
+    Current data version (0 if nothing has been recorded yet)
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT version FROM employee_data_version WHERE id = 1")
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else 0
+
+
+def bump_data_version(connection):
+    """
+    Record that the employees table changed so readers (such as the cache in
+    employee_api.py) drop what they have cached. Commits the connection.
+    Returns the new version.
+    """
+    ensure_data_version_table(connection)
+    cursor = connection.cursor()
+    cursor.execute("""
+        INSERT INTO employee_data_version (id, version) VALUES (1, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """)
+    connection.commit()
+    cursor.close()
+
+    version = read_data_version(connection)
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        callback(version)
+    return version
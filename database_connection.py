@@ -1,133 +1,581 @@
-import mysql.connector
-from dotenv import load_dotenv
-import os
+from contextlib import contextmanager
+import atexit
+import contextvars
+import threading
+import time
 
-# Load environment variables from .env file
-load_dotenv()
+from config import env
+from instrumentation import Histogram, get_logger, increment
+from lazy_imports import lazy_import
+from query_trace import trace_connection
 
-def connect_to_database():
+# The driver is only imported once a connection is actually opened
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Pool tuning parameters (can be overridden in .env)
+POOL_SIZE = env('POOL_SIZE', 5, int)           # max open connections per database
+POOL_MIN_IDLE = env('POOL_MIN_IDLE', 1, int)   # connections opened up front and kept warm
+POOL_TIMEOUT = env('POOL_TIMEOUT', 30, float)  # seconds to wait for a free connection
+POOL_HEALTH_CHECK_AFTER = env('POOL_HEALTH_CHECK_AFTER', 30, float)  # ping connections idle this long
+
+# Read replicas as host[:port][*weight], comma-separated (unset: every read goes to the primary)
+REPLICAS = env('REPLICAS', '')
+REPLICA_MAX_LAG = env('REPLICA_MAX_LAG', 5, float)        # seconds behind the primary a replica may serve reads
+REPLICA_LAG_CHECK_INTERVAL = env('REPLICA_LAG_CHECK_INTERVAL', 2, float)  # seconds between lag probes
+REPLICA_RETRY_AFTER = env('REPLICA_RETRY_AFTER', 30, float)  # seconds an unreachable replica is skipped
+
+
+def get_connection_config(database=None, endpoint=None):
     """
-    Connect to MySQL database using credentials from .env file
+    Build MySQL connection parameters from the .env file.
+    Pass database='' for a server-level connection (no default schema), and
+    a replica Endpoint to connect to it instead of the primary (same
+    credentials).
     """
-    try:
-        # Get credentials from environment variables
-        user = os.getenv('USER')
-        password = os.getenv('PASSWORD')
-        
-        # Default connection parameters (you can add these to .env if needed)
-        host = os.getenv('HOST', 'localhost')  # defaults to localhost
-        database = os.getenv('DATABASE', '')   # defaults to no specific database
-        port = os.getenv('PORT', 3306)        # defaults to MySQL default port
-        
-        print(f"Attempting to connect to database with user: {user}")
-        print(f"Host: {host}, Port: {port}, Database: {database}")
-        
-        # Create connection without specifying database first
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            port=port
-        )
-        
-        if connection.is_connected():
-            print("Successfully connected to MySQL database")
-            
-            # Get server info
-            db_info = connection.get_server_info()
-            print(f"MySQL Server version: {db_info}")
-            
-            return connection
-            
-    except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+    if database is None:
+        database = env('DATABASE', 'employee_db')
+
+    config = {
+        'host': env('HOST', 'localhost'),
+        'user': env('USER'),
+        'password': env('PASSWORD'),
+        'port': env('PORT', 3306, int),
+    }
+    if endpoint is not None and endpoint.role == 'replica':
+        config['host'] = endpoint.host
+        config['port'] = endpoint.port
+    if database:
+        config['database'] = database
+    # Needed by the LOAD DATA LOCAL INFILE fast path in bulk_insert.py
+    if env('ALLOW_LOCAL_INFILE') == '1':
+        config['allow_local_infile'] = True
+    return config
 
-def create_database_and_table(connection, db_name="employee_db"):
+
+class ConnectionPool:
     """
-    Create database and employees table
+    Bounded pool of MySQL connections.
+
+    Connections are handed out LIFO so the most recently used (warmest) one is
+    reused first, and any connection that sat idle longer than
+    health_check_after seconds is pinged before checkout. When every
+    connection is in use, callers wait up to timeout seconds for one to be
+    released.
     """
-    try:
-        cursor = connection.cursor()
-        
-        # Create database if it doesn't exist
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
-        print(f"Database '{db_name}' created or already exists")
-        
-        # Use the database
-        cursor.execute(f"USE {db_name}")
-        print(f"Using database '{db_name}'")
-        
-        # SQL to create employees table
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS employees (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            salary DECIMAL(10, 2) NOT NULL,
-            age INT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+    def __init__(self, config, size=POOL_SIZE, min_idle=POOL_MIN_IDLE,
+                 timeout=POOL_TIMEOUT, health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self.config = config
+        self.size = size
+        self.min_idle = min(min_idle, size)
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+
+        self._idle = []        # (connection, released_at) pairs, most recent last
+        self._open = 0         # idle + checked out connections
+        self._condition = threading.Condition()
+        self._metrics = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'creation_time': 0.0,
+            'health_check_failures': 0,
+        }
+
+    def _create_connection(self):
+        """Open a new physical connection and record how long the handshake took"""
+        start = time.perf_counter()
+        # With QUERY_TRACE=1 every statement on the connection is traced
+        connection = trace_connection(mysql.connector.connect(**self.config))
+        elapsed = time.perf_counter() - start
+
+        with self._condition:
+            self._metrics['connections_created'] += 1
+            self._metrics['creation_time'] += elapsed
+        return connection
+
+    def _discard(self, connection):
+        """Close a connection and free its slot in the pool"""
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def warm_up(self):
+        """Open min_idle connections ahead of the first checkout"""
+        while True:
+            with self._condition:
+                if self._open >= self.min_idle:
+                    return
+                self._open += 1
+            try:
+                connection = self._create_connection()
+            except mysql.connector.Error:
+                with self._condition:
+                    self._open -= 1
+                raise
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def acquire(self):
         """
-        
-        cursor.execute(create_table_query)
-        connection.commit()
-        print("Employees table created successfully")
-        
-        return db_name
-        
-    except mysql.connector.Error as e:
-        print(f"Error creating database or table: {e}")
-        return None
+        Check out a healthy connection, opening a new one if the pool has room.
+        Raises mysql.connector.errors.PoolError if none frees up within the timeout.
+        """
+        deadline = time.monotonic() + self.timeout
+        wait_started = None
+        connection = None
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics['timeouts'] += 1
+                    raise mysql.connector.errors.PoolError(
+                        f"No connection available within {self.timeout} seconds "
+                        f"(pool size {self.size})"
+                    )
+                if wait_started is None:
+                    wait_started = time.monotonic()
+                    self._metrics['waits'] += 1
+                self._condition.wait(remaining)
+
+            if wait_started is not None:
+                self._metrics['wait_time'] += time.monotonic() - wait_started
+            self._metrics['checkouts'] += 1
+
+        if connection is not None:
+            # Only ping connections that have been idle long enough to have gone stale
+            if time.monotonic() - released_at < self.health_check_after or connection.is_connected():
+                return connection
+            with self._condition:
+                self._metrics['health_check_failures'] += 1
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
+
+        # Either a fresh slot or a replacement for a dead connection
+        try:
+            return self._create_connection()
+        except mysql.connector.Error:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection):
+        """Return a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except mysql.connector.Error:
+            self._discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """Close every idle connection"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
 
-def insert_sample_data(connection, employees_data):
+    def metrics(self):
+        """Snapshot of pool usage counters"""
+        with self._condition:
+            stats = dict(self._metrics)
+            stats['size'] = self.size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        return stats
+
+
+class Endpoint:
     """
-    Insert sample employee data into the database
+    One MySQL server, the primary or a read replica: its routing weight,
+    last measured replication lag, and how long each checkout held a
+    connection to it
     """
-    try:
-        cursor = connection.cursor()
-        
-        # Prepare insert query
-        insert_query = """
-        INSERT INTO employees (name, salary, age) VALUES (%s, %s, %s)
+    def __init__(self, name, host, port, role='replica', weight=1):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.role = role
+        self.weight = weight
+        self.current_weight = 0     # smooth weighted round-robin state
+        self.lag = None             # seconds behind the primary at the last probe (None: unknown)
+        self.lag_checked_at = None
+        self.down_until = 0.0
+        self.checkouts = 0
+        self.errors = 0
+        self.latency = Histogram()          # seconds each checkout held a connection
+        self.probe_latency = Histogram()    # round trip of the lag probes
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.latency.observe(seconds)
+
+    def applied_until(self):
         """
-        
-        # Insert each employee
-        for emp in employees_data:
-            cursor.execute(insert_query, (emp.name, emp.salary, emp.age))
-        
-        connection.commit()
-        print(f"Successfully inserted {len(employees_data)} employees into database")
-        
-    except mysql.connector.Error as e:
-        print(f"Error inserting data: {e}")
+        Monotonic time up to which this replica had applied the primary's
+        writes at its last probe (Seconds_Behind_Source counts in whole
+        seconds, hence the extra second), or None if its lag is unknown
+        """
+        if self.lag is None:
+            return None
+        return self.lag_checked_at - self.lag - 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'role': self.role,
+                'host': self.host,
+                'port': self.port,
+                'weight': self.weight,
+                'checkouts': self.checkouts,
+                'errors': self.errors,
+                'lag': self.lag,
+                'down': self.down_until > time.monotonic(),
+                'latency': self.latency.summary(),
+                'probe_latency': self.probe_latency.summary(),
+            }
+
+
+def parse_replicas(spec):
+    """Endpoints for REPLICAS ('host[:port][*weight]', comma-separated)"""
+    replicas = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        address, _, weight = entry.partition('*')
+        host, _, port = address.partition(':')
+        port = int(port) if port else env('PORT', 3306, int)
+        replicas.append(Endpoint(f"{host}:{port}", host, port, 'replica', int(weight) if weight else 1))
+    return replicas
+
+
+class Session:
+    """
+    One unit of work for read-your-writes: reads stay on the primary until
+    a replica has caught up with this session's last write
+    """
+    def __init__(self):
+        self.last_write = 0.0
+
+    def wrote(self):
+        self.last_write = time.monotonic()
+
+
+# Without an explicit session() the whole process is one session, so a
+# loader's own reads (verification, counts) always see what it wrote
+_process_session = Session()
+_current_session = contextvars.ContextVar('database_session', default=None)
+
+
+def current_session():
+    return _current_session.get() or _process_session
+
+
+@contextmanager
+def session():
+    """
+    Scope read-your-writes to a with-block (one API request, one job):
+    writes made inside it only hold back reads made inside it
+    """
+    token = _current_session.set(Session())
+    try:
+        yield _current_session.get()
+    finally:
+        _current_session.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Chooses where a read-only checkout goes.
+
+    Replicas are picked by smooth weighted round-robin among those that are
+    reachable, no more than max_lag seconds behind the primary (probed with
+    SHOW REPLICA STATUS at most every lag_check_interval seconds), and
+    caught up with the session's last write. When none qualifies the read
+    falls back to the primary. A replica that refuses connections is
+    skipped for retry_after seconds. A server without replication status
+    (e.g. a local stand-in) counts as fully caught up.
+    """
+    def __init__(self, primary, replicas, max_lag=REPLICA_MAX_LAG,
+                 lag_check_interval=REPLICA_LAG_CHECK_INTERVAL, retry_after=REPLICA_RETRY_AFTER):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self.fallbacks = {'lag': 0, 'read_your_writes': 0, 'down': 0}
+        self._lock = threading.Lock()
+
+    def mark_down(self, endpoint, error):
+        with endpoint._lock:
+            endpoint.errors += 1
+            endpoint.down_until = time.monotonic() + self.retry_after
+        log.warning(f"Replica {endpoint.name} unavailable ({error}); "
+                    f"reading from the primary for {self.retry_after:g}s")
+
+    def _read_lag(self, connection):
+        cursor = connection.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                # Servers before MySQL 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+        finally:
+            cursor.close()
+        if status is None:
+            return 0.0
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        # NULL: replication is stopped or broken
+        return None if lag is None else float(lag)
+
+    def probe(self, endpoint, database=None):
+        """Measure a replica's lag, unless another thread is already doing so"""
+        if not endpoint._probe_lock.acquire(blocking=False):
+            return
+        try:
+            start = time.perf_counter()
+            pool = get_pool(database, endpoint)
+            connection = pool.acquire()
+            try:
+                lag = self._read_lag(connection)
+            finally:
+                pool.release(connection)
+            with endpoint._lock:
+                endpoint.probe_latency.observe(time.perf_counter() - start)
+                endpoint.lag = lag
+                endpoint.lag_checked_at = time.monotonic()
+        except mysql.connector.Error as e:
+            self.mark_down(endpoint, e)
+        finally:
+            endpoint._probe_lock.release()
+
+    def pick(self, database=None, read_session=None):
+        """The replica a read should use, or None for the primary"""
+        if not self.replicas:
+            return None
+        read_session = read_session or current_session()
+        reasons = set()
+        eligible = []
+        for replica in self.replicas:
+            now = time.monotonic()
+            if replica.down_until > now:
+                reasons.add('down')
+                continue
+            if replica.lag_checked_at is None or now - replica.lag_checked_at >= self.lag_check_interval:
+                self.probe(replica, database)
+                if replica.down_until > now:
+                    reasons.add('down')
+                    continue
+            if replica.lag is None or replica.lag > self.max_lag:
+                reasons.add('lag')
+                continue
+            if read_session.last_write and replica.applied_until() < read_session.last_write:
+                reasons.add('read_your_writes')
+                continue
+            eligible.append(replica)
+
+        with self._lock:
+            if not eligible:
+                # Report the reason a caller can act on first
+                for reason in ('read_your_writes', 'lag', 'down'):
+                    if reason in reasons:
+                        self.fallbacks[reason] += 1
+                        break
+                increment('replica_fallbacks')
+                return None
+            total = 0
+            best = None
+            for replica in eligible:
+                replica.current_weight += replica.weight
+                total += replica.weight
+                if best is None or replica.current_weight > best.current_weight:
+                    best = replica
+            best.current_weight -= total
+        increment('replica_reads')
+        return best
+
+
+ROUTER = ReplicaRouter(
+    Endpoint('primary', env('HOST', 'localhost'), env('PORT', 3306, int), role='primary'),
+    parse_replicas(REPLICAS),
+)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database=None, endpoint=None):
+    """
+    Return the shared pool for a database on the primary (or on a replica
+    Endpoint), creating and warming it on first use
+    """
+    config = get_connection_config(database, endpoint)
+    key = config.get('database', '')
+    if endpoint is not None and endpoint.role == 'replica':
+        key = (key, endpoint.name)
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(config)
+            _pools[key] = pool
+            created = True
+        else:
+            created = False
+
+    if created:
+        pool.warm_up()
+    return pool
+
+
+@contextmanager
+def get_connection(database=None, read_only=False):
+    """
+    Check out a pooled connection for the duration of a with-block.
+
+    read_only=True lets ROUTER send the checkout to a replica; anything
+    else goes to the primary and counts as a write of the current session,
+    so the session's reads stay on the primary until a replica catches up.
+    """
+    endpoint = ROUTER.pick(database) if read_only else None
+    connection = None
+    if endpoint is not None:
+        try:
+            pool = get_pool(database, endpoint)
+            connection = pool.acquire()
+        except mysql.connector.errors.PoolError:
+            # Replica busy, not broken: this read alone goes to the primary
+            increment('replica_fallbacks')
+        except mysql.connector.Error as e:
+            ROUTER.mark_down(endpoint, e)
+    if connection is None:
+        endpoint = ROUTER.primary
+        pool = get_pool(database)
+        connection = pool.acquire()
+
+    start = time.perf_counter()
+    try:
+        yield connection
+    finally:
+        pool.release(connection)
+        endpoint.record(time.perf_counter() - start)
+        if not read_only:
+            current_session().wrote()
+
+
+@contextmanager
+def transaction(database=None):
+    """
+    Run a with-block in a single transaction on a pooled connection.
+    Commits on success and rolls back if the block raises.
+    """
+    with get_connection(database) as connection:
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+
+def pool_metrics():
+    """
+    Metrics for every pool created in this process, keyed by database name
+    (database@replica for replica pools)
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    metrics = {}
+    for key, pool in pools.items():
+        name, replica = key if isinstance(key, tuple) else (key, None)
+        metrics[(name or '<server>') + (f"@{replica}" if replica else '')] = pool.metrics()
+    return metrics
+
+
+def endpoint_stats():
+    """
+    Per-server routing and latency figures: {name: {role, host, port,
+    weight, checkouts, errors, lag, down, latency, probe_latency}} plus
+    'fallbacks', the reads sent back to the primary by reason
+    """
+    stats = {endpoint.name: endpoint.stats() for endpoint in [ROUTER.primary, *ROUTER.replicas]}
+    with ROUTER._lock:
+        stats['fallbacks'] = dict(ROUTER.fallbacks)
+    return stats
+
+
+def close_all_pools():
+    """
+    Close idle connections in every pool
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all_pools)
+
 
 def test_connection():
     """
-    Test the database connection with sample operations
-    """
-    # Connect to the database
-    db_connection = connect_to_database()
-    
-    if db_connection:
-        # Create database and table
-        db_name = create_database_and_table(db_connection)
-        
-        if db_name:
-            # Switch to the new database
-            db_connection.database = db_name
-            print(f"Switched to database: {db_name}")
-        
-        # Close the connection
-        db_connection.close()
-        print("MySQL connection closed")
-        
+    Test the database connection and report pool metrics
+    """
+    log.info(f"Attempting to connect to database with user: {env('USER')}")
+
+    try:
+        with get_connection(database='') as connection:
+            log.info("Successfully connected to MySQL database")
+            log.info(f"MySQL Server version: {connection.get_server_info()}")
+
+        for replica in ROUTER.replicas:
+            ROUTER.probe(replica, '')
+            state = 'unreachable' if replica.down_until > time.monotonic() else f"{replica.lag}s behind"
+            log.info(f"Replica {replica.name} (weight {replica.weight}): {state}")
+
+        log.info(f"Connection pool metrics: {pool_metrics()}")
         return True
-    else:
-        print("Failed to connect to database. Please ensure:")
-        print("1. MySQL server is running")
-        print("2. Credentials in .env file are correct")
-        print("3. Host and port are accessible")
+
+    except mysql.connector.Error as e:
+        log.error(f"Error connecting to MySQL: {e}")
+        log.error("Failed to connect to database. Please ensure:")
+        log.error("1. MySQL server is running")
+        log.error("2. Credentials in .env file are correct")
+        log.error("3. Host and port are accessible")
         return False
 
+
 if __name__ == "__main__":
-    test_connection()
\ No newline at end of file
+    test_connection()
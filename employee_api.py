@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from database_connection import get_connection, POOL_SIZE
+from data_version import ensure_data_version_table, read_data_version, on_change
+from config import env
+from instrumentation import get_logger
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Service tuning (can be overridden in the environment)
+API_HOST = env('API_HOST', '127.0.0.1')
+API_PORT = env('API_PORT', 8000, int)
+CACHE_SIZE = env('API_CACHE_SIZE', 10000, int)  # cached responses
+CACHE_TTL = env('API_CACHE_TTL', 60, float)     # seconds
+VERSION_CHECK_INTERVAL = env('API_VERSION_CHECK_INTERVAL', 1, float)  # seconds between data version polls
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+EMPLOYEE_FIELDS = ('emp_id', 'source_id', 'name', 'monthly_salary', 'age', 'yearly_salary')
+
+# Range filters accepted by the list endpoint: query parameter -> SQL condition
+RANGE_FILTERS = {
+    'min_age': 'age >= %s',
+    'max_age': 'age <= %s',
+    'min_salary': 'monthly_salary >= %s',
+    'max_salary': 'monthly_salary <= %s',
+}
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire ttl seconds after they were stored
+    """
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class BadRequest(Exception):
+    """Raised for malformed query parameters"""
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _int_param(query, name, default=None):
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise BadRequest(f"Query parameter '{name}' must be an integer")
+
+
+class EmployeeReadService:
+    """
+    Read-only employee endpoints backed by the pooled MySQL connections.
+
+    Responses are cached in an LRU+TTL cache keyed by the request. The cache is
+    dropped whenever the data version recorded by the loaders changes (polled
+    at most every VERSION_CHECK_INTERVAL seconds, or immediately for writes
+    made in this process). Blocking database calls run on a thread pool sized
+    to the connection pool, so the event loop only ever waits on I/O.
+    """
+    def __init__(self, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL,
+                 version_check_interval=VERSION_CHECK_INTERVAL):
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.version_check_interval = version_check_interval
+        self.executor = ThreadPoolExecutor(max_workers=POOL_SIZE)
+        self.requests = 0
+        self._version = None
+        self._version_checked_at = 0.0
+        self._version_lock = asyncio.Lock()
+        # Writes made in this process force a version poll on the next request
+        on_change(self._expire_version_check)
+
+    # Database access (runs on the executor threads)
+
+    def _db_setup(self):
+        with get_connection() as connection:
+            ensure_data_version_table(connection)
+            return read_data_version(connection)
+
+    def _db_version(self):
+        with get_connection(read_only=True) as connection:
+            return read_data_version(connection)
+
+    def _db_get_employee(self, emp_id):
+        with get_connection(read_only=True) as connection:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT {', '.join(EMPLOYEE_FIELDS)} FROM employees WHERE emp_id = %s",
+                (emp_id,)
+            )
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+
+    def _db_list_employees(self, after, limit, filters):
+        conditions = ['emp_id > %s']
+        params = [after]
+        for name, value in filters:
+            conditions.append(RANGE_FILTERS[name])
+            params.append(value)
+        params.append(limit)
+
+        with get_connection(read_only=True) as connection:
+            cursor = connection.cursor(dictionary=True)
+            # Keyset pagination: seek past the last emp_id instead of OFFSET scanning
+            cursor.execute(
+                f"SELECT {', '.join(EMPLOYEE_FIELDS)} FROM employees "
+                f"WHERE {' AND '.join(conditions)} ORDER BY emp_id LIMIT %s",
+                params
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+    # Cache maintenance
+
+    def _invalidate(self, version=None):
+        self.cache.clear()
+        self._version = version
+
+    def _expire_version_check(self, version=None):
+        # May run on a loader thread, so only touch a plain attribute here
+        self._version_checked_at = 0.0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def start(self):
+        self._version = await self._run(self._db_setup)
+        self._version_checked_at = time.monotonic()
+
+    async def _check_version(self):
+        """Drop the cache if the loaders have written since the last poll"""
+        if time.monotonic() - self._version_checked_at < self.version_check_interval:
+            return
+        async with self._version_lock:
+            if time.monotonic() - self._version_checked_at < self.version_check_interval:
+                return
+            version = await self._run(self._db_version)
+            self._version_checked_at = time.monotonic()
+            if version != self._version:
+                self._invalidate(version)
+
+    # Request handling
+
+    async def _cached(self, key, loader):
+        """Return (status, body, etag) from the cache or by running loader()"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        status, payload = await loader()
+        body = json.dumps(payload, default=_json_default).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        result = (status, body, etag)
+        self.cache.set(key, result)
+        return result
+
+    async def _get_employee(self, emp_id):
+        row = await self._run(self._db_get_employee, emp_id)
+        if row is None:
+            return HTTPStatus.NOT_FOUND, {'error': f"Employee {emp_id} not found"}
+        return HTTPStatus.OK, row
+
+    async def _list_employees(self, after, limit, filters):
+        rows = await self._run(self._db_list_employees, after, limit, filters)
+        next_after = rows[-1]['emp_id'] if len(rows) == limit else None
+        return HTTPStatus.OK, {'data': rows, 'next_after': next_after}
+
+    async def handle(self, method, target, headers):
+        """
+        Route one request. Returns (status, body bytes, extra headers).
+        """
+        self.requests += 1
+        if method not in ('GET', 'HEAD'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, b'{"error": "Method not allowed"}', {'Allow': 'GET, HEAD'}
+
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+
+        try:
+            if parts == ['health']:
+                return HTTPStatus.OK, b'{"status": "ok"}', {}
+            if parts == ['stats']:
+                body = json.dumps({'requests': self.requests, 'cache': self.cache.stats()}).encode('utf-8')
+                return HTTPStatus.OK, body, {}
+
+            await self._check_version()
+
+            if len(parts) == 2 and parts[0] == 'employees':
+                try:
+                    emp_id = int(parts[1])
+                except ValueError:
+                    raise BadRequest("Employee id must be an integer")
+                status, body, etag = await self._cached(('id', emp_id), lambda: self._get_employee(emp_id))
+            elif parts == ['employees']:
+                after = _int_param(query, 'after', 0)
+                limit = min(max(_int_param(query, 'limit', DEFAULT_PAGE_LIMIT), 1), MAX_PAGE_LIMIT)
+                filters = tuple(
+                    (name, _int_param(query, name)) for name in RANGE_FILTERS if name in query
+                )
+                status, body, etag = await self._cached(
+                    ('list', after, limit, filters), lambda: self._list_employees(after, limit, filters)
+                )
+            else:
+                return HTTPStatus.NOT_FOUND, b'{"error": "Not found"}', {}
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, json.dumps({'error': str(e)}).encode('utf-8'), {}
+        except mysql.connector.Error as e:
+            log.error(f"Database error: {e}")
+            return HTTPStatus.SERVICE_UNAVAILABLE, b'{"error": "Database unavailable"}', {}
+
+        if status == HTTPStatus.OK and headers.get('if-none-match') == etag:
+            return HTTPStatus.NOT_MODIFIED, b'', {'ETag': etag}
+        return status, body, {'ETag': etag}
+
+
+async def _read_request(reader):
+    """
+    Parse one HTTP/1.1 request head. Returns (method, target, version, headers)
+    or None when the client closed the connection.
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    # The API is read-only, but drain any body so the next request parses cleanly
+    length = int(headers.get('content-length', 0) or 0)
+    if length:
+        await reader.readexactly(length)
+    return method, target, version, headers
+
+
+async def _handle_connection(service, reader, writer):
+    """
+    Serve requests on one keep-alive connection until the client closes it
+    """
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except (ValueError, asyncio.IncompleteReadError):
+                request = None
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            if request is None:
+                break
+            method, target, version, headers = request
+
+            status, body, extra_headers = await service.handle(method, target, headers)
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+            head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+            head.extend(f"{name}: {value}" for name, value in extra_headers.items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=API_HOST, port=API_PORT, service=None, ready=None):
+    """
+    Run the read service until cancelled. ready, if given, is an
+    asyncio.Event set once the server is accepting connections.
+    """
+    if service is None:
+        service = EmployeeReadService()
+    await service.start()
+
+    server = await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer), host, port
+    )
+    log.info(f"Employee API listening on http://{host}:{port}")
+    if ready is not None:
+        ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    Start the employee read API
+    """
+    parser = argparse.ArgumentParser(description="Serve the employees table over HTTP")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        log.info("\nEmployee API stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,332 @@
+import gzip
+import hashlib
 import json
+import time
+from itertools import islice
+
+from instrumentation import increment, observe
+
+# Read size used by the streaming parsers
+READ_CHUNK_SIZE = 64 * 1024
+
+# Characters before the end of the buffer where a decode error can still be a
+# token cut by a chunk boundary ('-Infinity', a surrogate-pair escape)
+TRUNCATION_TAIL = 12
+
+# Characters that can continue a number ('-0.' is only the start of '-0.5')
+_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+# Records per parse-timing observation (timing every record would cost more than parsing it)
+TIMING_BATCH = 1000
 
 class Employee:
     """
-    Employee class to represent employee data with methods for calculations
+    Employee class to represent employee data with methods for calculations.
+    Uses __slots__ so each instance carries no per-object __dict__.
     """
+    __slots__ = ('id', 'name', 'salary', 'age')
+
     def __init__(self, emp_id, name, salary, age):
         self.id = emp_id
         self.name = name
         self.salary = int(salary)  # Convert to int for calculations
         self.age = int(age)        # Convert to int
-        
+
     def yearly_salary(self):
         """Calculate yearly salary (monthly salary * 12)"""
         return self.salary * 12
-        
-    def promotion(self):
-        """Calculate promoted salary (current salary * 1.10)"""
-        return self.salary * 1.10
-    
+
+    def promotion(self, rate=0.10):
+        """Calculate promoted salary (current salary * (1 + rate), 1.10 by default)"""
+        return self.salary * (1 + rate)
+
+    def content_hash(self):
+        """Hash of the stored fields, used by incremental sync to skip unchanged rows"""
+        content = f"{self.name}\x1f{self.salary}\x1f{self.age}"
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
     def __str__(self):
         return f"Employee(id={self.id}, name='{self.name}', salary={self.salary}, age={self.age})"
 
-def load_employees_from_json(json_file):
-    """
-    Load employee data from JSON file and convert to Employee objects
-    """
-    with open(json_file, 'r') as f:
-        data = json.load(f)
-    
-    # Extract the employee list from the 'data' key
-    employees_json = data.get('data', [])
-    
-    # Convert JSON data to Employee objects
-    employees = []
-    for emp_data in employees_json:
-        employee = Employee(
-            emp_id=emp_data['id'],
-            name=emp_data['employee_name'],
-            salary=emp_data['employee_salary'],
-            age=emp_data['employee_age']
-        )
-        employees.append(employee)
-    
-    return employees
-
-# Load employees from the JSON file
-employees = load_employees_from_json('employees.json')
-
-# Display some information about the employees
-print(f"Loaded {len(employees)} employees from JSON data")
-print()
-
-# Display information for the first few employees
-for i, emp in enumerate(employees[:5]):  # Show first 5 employees
-    print(f"Employee {i+1}:")
-    print(f"  {emp}")
-    print(f"  Yearly Salary: {emp.yearly_salary()}")
-    print(f"  Promoted Salary: {emp.promotion():.2f}")
+def employee_from_record(emp_data):
+    """
+    Build an Employee from one record of the API payload
+    """
+    return Employee(
+        emp_id=emp_data['id'],
+        name=emp_data['employee_name'],
+        salary=emp_data['employee_salary'],
+        age=emp_data['employee_age']
+    )
+
+def _open_text(path):
+    """
+    Open a file for reading as text, transparently decompressing gzip input
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def _detect_format(path, f):
+    """
+    Guess whether a file is the {"status":..., "data":[...]} envelope or NDJSON.
+    Looks at the file extension first, then at the keys of the first JSON object.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+
+    try:
+        return _first_object_format(_StreamReader(f))
+    except ValueError:
+        # Not JSON we recognise; the envelope parser reports the error
+        return 'envelope'
+    finally:
+        f.seek(0)
+
+def _first_object_format(reader):
+    """
+    Walk the first object's keys: an envelope has "data", a record does not.
+    Values are decoded one at a time and the data array is never entered, so
+    a minified envelope or a first record longer than a read chunk is
+    classified without loading more than that record.
+    """
+    if reader.peek() != '{':
+        return 'envelope'
+    reader.expect('{')
+    while reader.peek() not in ('}', ''):
+        key = reader.value()
+        if key == 'data':
+            return 'envelope'
+        reader.expect(':')
+        reader.value()
+        if reader.peek() == ',':
+            reader.expect(',')
+    return 'ndjson'
+
+class _StreamReader:
+    """
+    Minimal pull parser over a text stream that decodes one JSON value at a time
+    without ever holding more than the current value (plus one read chunk) in memory
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=READ_CHUNK_SIZE):
+        """Read at least another chunk, dropping the already-consumed prefix of the buffer"""
+        chunk = self.f.read(max(size, READ_CHUNK_SIZE))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the next non-whitespace character, which must be char"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed JSON: expected '{char}' but found '{found or 'EOF'}'")
+        self.pos += 1
+
+    def _truncated(self, error):
+        """Whether a decode error may just mean the value runs past the buffer"""
+        return error.pos >= len(self.buf) - TRUNCATION_TAIL or error.msg.startswith('Unterminated string')
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                # Malformed input raises here instead of reading the rest of the file.
+                # A value that is still incomplete doubles the buffer, so long
+                # values are decoded a logarithmic number of times.
+                if self._truncated(e) and self._fill(len(self.buf) - self.pos):
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if (isinstance(value, (int, float)) and not self.eof
+                    and _NUMBER_CHARS.issuperset(self.buf[end:]) and self._fill()):
+                continue
+            self.pos = end
+            return value
+
+def _iter_envelope_records(f):
+    """
+    Incrementally yield the records of the envelope's "data" array.
+    A bare top-level array of records is accepted as well.
+    """
+    reader = _StreamReader(f)
+
+    if reader.peek() == '[':
+        reader.expect('[')
+    else:
+        # Walk the top-level object until the "data" key, skipping the small
+        # metadata values (status, message) in front of it
+        reader.expect('{')
+        while True:
+            if reader.peek() == '}':
+                return
+            key = reader.value()
+            reader.expect(':')
+            if key == 'data':
+                reader.expect('[')
+                break
+            reader.value()
+            if reader.peek() == ',':
+                reader.expect(',')
+
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ',':
+            reader.expect(',')
+        else:
+            reader.expect(']')
+            return
+
+def _iter_ndjson_records(f, on_error=None):
+    """
+    Yield one record per non-empty line. If on_error is given, lines that are
+    not valid JSON are passed to on_error(line, error) and skipped.
+    """
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            if on_error is None:
+                raise
+            on_error(line, e)
+            continue
+        yield record
+
+def iter_employee_records(json_file, format=None, on_error=None):
+    """
+    Stream raw employee records from a JSON envelope, NDJSON, or a gzip of either.
+    format can be 'envelope' or 'ndjson'; by default it is detected from the file.
+    on_error(line, error) receives undecodable NDJSON lines instead of raising
+    (a broken envelope cannot be resumed, so it always raises).
+    """
+    with _open_text(json_file) as f:
+        if format is None:
+            format = _detect_format(json_file, f)
+        if format == 'ndjson':
+            yield from _iter_ndjson_records(f, on_error)
+        elif format == 'envelope':
+            yield from _iter_envelope_records(f)
+        else:
+            raise ValueError(f"Unknown format '{format}', expected 'envelope' or 'ndjson'")
+
+def _record_parse_timings(decode, build, count):
+    """Report the decode and construction time of count records as one observation each"""
+    if count:
+        observe('json_decode_seconds', decode)
+        observe('employee_build_seconds', build)
+        increment('records_parsed', count)
+
+def iter_employees(json_file, format=None):
+    """
+    Stream Employee objects one at a time in constant memory.
+    JSON decode and Employee construction time are recorded per
+    TIMING_BATCH records (time spent by the consumer is not counted).
+    """
+    records = iter_employee_records(json_file, format)
+    done = object()  # A record may legitimately decode to None
+    clock = time.perf_counter
+    decode = build = 0.0
+    count = 0
+    try:
+        while True:
+            start = clock()
+            emp_data = next(records, done)
+            decoded = clock()
+            if emp_data is done:
+                decode += decoded - start
+                return
+            emp = employee_from_record(emp_data)
+            built = clock()
+            decode += decoded - start
+            build += built - decoded
+            count += 1
+            if count == TIMING_BATCH:
+                _record_parse_timings(decode, build, count)
+                decode = build = 0.0
+                count = 0
+            yield emp
+    finally:
+        _record_parse_timings(decode, build, count)
+
+def iter_employee_batches(json_file, batch_size=1000, format=None):
+    """
+    Stream lists of at most batch_size Employee objects
+    """
+    employees = iter_employees(json_file, format)
+    while True:
+        batch = list(islice(employees, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def load_employees_from_json(json_file, use_snapshot=True):
+    """
+    Load employee data from JSON file and convert to Employee objects.
+    With use_snapshot the rows come from the file's binary snapshot
+    (see employee_snapshot.py) when one is up to date.
+    """
+    if use_snapshot:
+        from employee_snapshot import load_snapshot
+        table = load_snapshot(json_file)
+        if table is not None:
+            return list(table)
+    return list(iter_employees(json_file))
+
+def main():
+    """
+    Load employees from the JSON file and display some information about them
+    """
+    employees = load_employees_from_json('employees.json')
+
+    # Display some information about the employees
+    print(f"Loaded {len(employees)} employees from JSON data")
     print()
 
-# Example of accessing specific employee
-if employees:
-    first_employee = employees[0]
-    print(f"First employee: {first_employee.name}")
-    print(f"Yearly salary: {first_employee.yearly_salary()}")
-    print(f"Promoted salary: {first_employee.promotion():.2f}")
\ No newline at end of file
+    # Display information for the first few employees
+    for i, emp in enumerate(employees[:5]):  # Show first 5 employees
+        print(f"Employee {i+1}:")
+        print(f"  {emp}")
+        print(f"  Yearly Salary: {emp.yearly_salary()}")
+        print(f"  Promoted Salary: {emp.promotion():.2f}")
+        print()
+
+    # Example of accessing specific employee
+    if employees:
+        first_employee = employees[0]
+        print(f"First employee: {first_employee.name}")
+        print(f"Yearly salary: {first_employee.yearly_salary()}")
+        print(f"Promoted salary: {first_employee.promotion():.2f}")
+
+if __name__ == "__main__":
+    main()
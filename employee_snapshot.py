@@ -0,0 +1,229 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from config import env
+from employee_objects import iter_employees
+from employee_table import EmployeeTable, COLUMN_TYPES
+from instrumentation import get_logger
+
+log = get_logger(__name__)
+
+# Set EMPLOYEE_SNAPSHOT=0 to always parse the JSON source
+SNAPSHOT_ENABLED = env('EMPLOYEE_SNAPSHOT', '1') != '0'
+SNAPSHOT_SUFFIX = '.snap'
+
+MAGIC = b'EMPSNAP\x00'
+FORMAT_VERSION = 1
+BYTE_ORDER = {'little': 1, 'big': 2}[sys.byteorder]
+
+# magic, format version, byte order, row count, names blob size, and the
+# source file's size, mtime (ns) and SHA-1 at the time the snapshot was taken
+HEADER = struct.Struct('=8sHBxQQQQ20s')
+HEADER_SIZE = 64
+
+# Column layout after the header: ids (int64), salaries (int64), ages (int32),
+# then int64 name offsets (count + 1 of them) and the UTF-8 names blob
+_ITEM_SIZES = {name: array(typecode).itemsize for name, (typecode, _) in COLUMN_TYPES.items()}
+_ATTRIBUTES = {'id': 'ids', 'salary': 'salaries', 'age': 'ages'}
+
+
+class SnapshotMismatch(Exception):
+    """Raised when a snapshot file is not readable by this version or platform"""
+
+
+def snapshot_path(json_file):
+    """Snapshot file kept next to a JSON source"""
+    return json_file + SNAPSHOT_SUFFIX
+
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+def _layout(count):
+    """Byte offset of each region for a snapshot of count rows"""
+    offsets = {}
+    position = HEADER_SIZE
+    for name in COLUMN_TYPES:
+        offsets[name] = position
+        position += count * _ITEM_SIZES[name]
+    offsets['name_offsets'] = _align(position)
+    offsets['names'] = offsets['name_offsets'] + (count + 1) * 8
+    return offsets
+
+
+class _SnapshotNames:
+    """
+    Read-only sequence of names decoded on demand from the mapped names blob
+    """
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def write_snapshot(json_file, path=None):
+    """
+    Parse json_file once and write its binary snapshot (atomically, via a
+    temporary file). Returns the number of employees written.
+    """
+    path = path or snapshot_path(json_file)
+    source = os.stat(json_file)
+    source_hash = _file_hash(json_file)
+    table = EmployeeTable.from_employees(iter_employees(json_file))
+
+    name_offsets = array('q', [0])
+    encoded = []
+    size = 0
+    for name in table.names:
+        data = name.encode('utf-8')
+        encoded.append(data)
+        size += len(data)
+        name_offsets.append(size)
+
+    count = len(table)
+    layout = _layout(count)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, BYTE_ORDER, count, size,
+                            source.st_size, source.st_mtime_ns, source_hash).ljust(HEADER_SIZE, b'\0'))
+        for name in COLUMN_TYPES:
+            f.write(table._column(name).tobytes())
+        f.write(b'\0' * (layout['name_offsets'] - f.tell()))
+        f.write(name_offsets.tobytes())
+        for data in encoded:
+            f.write(data)
+    os.replace(tmp_path, path)
+    return count
+
+
+def _read_header(f):
+    header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise SnapshotMismatch("truncated header")
+    magic, version, byte_order, count, names_size, size, mtime_ns, source_hash = HEADER.unpack_from(header)
+    if magic != MAGIC or version != FORMAT_VERSION or byte_order != BYTE_ORDER:
+        raise SnapshotMismatch("unsupported snapshot format")
+    return count, names_size, size, mtime_ns, source_hash
+
+
+def is_fresh(json_file, path=None):
+    """
+    True if the snapshot matches the current source file. Size and mtime are
+    compared first; the source is only hashed when they differ, so a file that
+    was touched or copied without changing keeps its snapshot.
+    """
+    path = path or snapshot_path(json_file)
+    try:
+        with open(path, 'rb') as f:
+            _, _, size, mtime_ns, source_hash = _read_header(f)
+        source = os.stat(json_file)
+    except (OSError, SnapshotMismatch):
+        return False
+    if source.st_size != size:
+        return False
+    if source.st_mtime_ns == mtime_ns:
+        return True
+    return _file_hash(json_file) == source_hash
+
+
+def open_snapshot(path):
+    """
+    Map a snapshot file into memory and return an EmployeeTable whose columns
+    are zero-copy views of the mapping. Names are decoded only when accessed.
+    """
+    with open(path, 'rb') as f:
+        count, names_size, _, _, _ = _read_header(f)
+        layout = _layout(count)
+        expected = layout['names'] + names_size
+        if os.fstat(f.fileno()).st_size != expected:
+            raise SnapshotMismatch("file size does not match header")
+        if count == 0:
+            return EmployeeTable()
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapping)
+    table = EmployeeTable()
+    for name, (typecode, _) in COLUMN_TYPES.items():
+        start = layout[name]
+        column = view[start:start + count * _ITEM_SIZES[name]].cast(typecode)
+        setattr(table, _ATTRIBUTES[name], column)
+    offsets = view[layout['name_offsets']:layout['names']].cast('q')
+    table.names = _SnapshotNames(offsets, view[layout['names']:expected])
+    # The views keep the mapping alive for as long as the table is in use
+    return table
+
+
+def load_snapshot(json_file, rebuild=True):
+    """
+    EmployeeTable for json_file read from its snapshot, rebuilding the
+    snapshot first when it is missing or stale (if rebuild is set).
+    Returns None if no usable snapshot is available.
+    """
+    if not SNAPSHOT_ENABLED:
+        return None
+    path = snapshot_path(json_file)
+    if not is_fresh(json_file, path):
+        if not rebuild:
+            return None
+        try:
+            write_snapshot(json_file, path)
+        except OSError as e:
+            log.warning(f"Could not write employee snapshot {path}: {e}")
+            return None
+    try:
+        return open_snapshot(path)
+    except (OSError, SnapshotMismatch) as e:
+        log.warning(f"Could not open employee snapshot {path}: {e}")
+        return None
+
+
+def main():
+    """
+    Build (or refresh) the snapshot for employees.json and time opening it
+    """
+    json_file = sys.argv[1] if len(sys.argv) > 1 else 'employees.json'
+
+    start = time.perf_counter()
+    if is_fresh(json_file):
+        log.info(f"Snapshot {snapshot_path(json_file)} is up to date")
+    else:
+        count = write_snapshot(json_file)
+        log.info(f"Wrote snapshot of {count} employees to {snapshot_path(json_file)} "
+                 f"in {time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    table = open_snapshot(snapshot_path(json_file))
+    print(f"Opened {len(table)} employees in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    start = time.perf_counter()
+    EmployeeTable.from_employees(iter_employees(json_file))
+    print(f"Parsing {json_file} instead takes {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import sys
+from array import array
+from itertools import islice
+
+from employee_objects import Employee, iter_employees
+
+# NumPy is optional: when it is installed the column operations run as
+# vectorized NumPy expressions over zero-copy views of the typed arrays,
+# otherwise they fall back to tight loops over the same arrays. It is only
+# imported the first time a column operation runs, which keeps importing
+# this module (and Employee) cheap for scripts that never need it.
+_np = False
+
+
+def _numpy():
+    """The numpy module, or None if it is not installed (looked up once)"""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _np = numpy
+    return _np
+
+# Typecodes for each numeric column (and the matching NumPy dtype)
+COLUMN_TYPES = {
+    'id': ('q', 'int64'),
+    'salary': ('q', 'int64'),
+    'age': ('i', 'int32'),
+}
+
+
+class EmployeeTable:
+    """
+    Columnar container for a whole employee population.
+
+    ids, salaries and ages are stored in typed arrays (8 or 4 bytes per value)
+    and names are interned, so a table costs a small fraction of the memory of
+    the equivalent list of Employee objects. Payroll calculations, filtering and
+    sorting operate on whole columns at once.
+    """
+    def __init__(self):
+        self.ids = array(COLUMN_TYPES['id'][0])
+        self.names = []
+        self.salaries = array(COLUMN_TYPES['salary'][0])
+        self.ages = array(COLUMN_TYPES['age'][0])
+
+    @classmethod
+    def from_employees(cls, employees):
+        """Build a table from any iterable of Employee objects"""
+        table = cls()
+        for emp in employees:
+            table.append(emp.id, emp.name, emp.salary, emp.age)
+        return table
+
+    @classmethod
+    def from_json(cls, json_file, format=None, use_snapshot=True):
+        """
+        Build a table from a JSON envelope or NDJSON file. With use_snapshot the
+        table is memory-mapped from the file's binary snapshot (refreshed when
+        the source changes) instead of decoding the JSON again.
+        """
+        if use_snapshot:
+            from employee_snapshot import load_snapshot
+            table = load_snapshot(json_file)
+            if table is not None:
+                return table
+        return cls.from_employees(iter_employees(json_file, format))
+
+    def append(self, emp_id, name, salary, age):
+        """Add one employee to the end of the table"""
+        self.ids.append(int(emp_id))
+        self.names.append(sys.intern(name))
+        self.salaries.append(int(salary))
+        self.ages.append(int(age))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return Employee(self.ids[index], self.names[index], self.salaries[index], self.ages[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _column(self, name):
+        """The typed array backing a numeric column"""
+        return {'id': self.ids, 'salary': self.salaries, 'age': self.ages}[name]
+
+    def _view(self, name):
+        """Zero-copy NumPy view of a numeric column"""
+        return _numpy().frombuffer(self._column(name), dtype=COLUMN_TYPES[name][1])
+
+    def yearly_salary(self):
+        """Yearly salary (monthly salary * 12) for every employee"""
+        np = _numpy()
+        if np is not None:
+            return self._view('salary') * 12
+        return array('q', [salary * 12 for salary in self.salaries])
+
+    def promotion(self, rate=0.10):
+        """Promoted salary (monthly salary * (1 + rate)) for every employee"""
+        np = _numpy()
+        factor = 1 + rate
+        if np is not None:
+            return self._view('salary') * factor
+        return array('d', [salary * factor for salary in self.salaries])
+
+    def total_monthly_salary(self):
+        """Sum of monthly salaries across the table"""
+        np = _numpy()
+        if np is not None:
+            return int(self._view('salary').sum())
+        return sum(self.salaries)
+
+    def total_yearly_salary(self):
+        """Sum of yearly salaries across the table"""
+        return self.total_monthly_salary() * 12
+
+    def _take(self, indices):
+        """New table holding the rows at the given positions, in that order"""
+        np = _numpy()
+        table = EmployeeTable()
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.intp)
+            for name in COLUMN_TYPES:
+                table._column(name).frombytes(self._view(name)[indices].tobytes())
+        else:
+            for name in COLUMN_TYPES:
+                column = self._column(name)
+                table._column(name).extend([column[i] for i in indices])
+        table.names = [self.names[i] for i in indices]
+        return table
+
+    def filter(self, min_age=None, max_age=None, min_salary=None, max_salary=None):
+        """
+        New table with the employees whose age and monthly salary fall inside
+        the given inclusive ranges (None leaves that bound open)
+        """
+        np = _numpy()
+        bounds = [
+            ('age', min_age, max_age),
+            ('salary', min_salary, max_salary),
+        ]
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            for name, low, high in bounds:
+                view = self._view(name)
+                if low is not None:
+                    mask &= view >= low
+                if high is not None:
+                    mask &= view <= high
+            return self._take(np.flatnonzero(mask))
+
+        indices = range(len(self))
+        for name, low, high in bounds:
+            column = self._column(name)
+            if low is not None:
+                indices = [i for i in indices if column[i] >= low]
+            if high is not None:
+                indices = [i for i in indices if column[i] <= high]
+        return self._take(list(indices))
+
+    def sort_by(self, column='id', reverse=False):
+        """New table ordered by 'id', 'salary', 'age' or 'name' (stable sort)"""
+        np = _numpy()
+        if column == 'name':
+            order = sorted(range(len(self)), key=self.names.__getitem__, reverse=reverse)
+        elif np is not None:
+            view = self._view(column)
+            order = np.argsort(-view if reverse else view, kind='stable')
+        else:
+            values = self._column(column)
+            order = sorted(range(len(self)), key=values.__getitem__, reverse=reverse)
+        return self._take(order)
+
+
+def main():
+    """
+    Load employees.json into a table and print company-wide payroll figures
+    """
+    table = EmployeeTable.from_json('employees.json')
+    print(f"Loaded {len(table)} employees into a columnar table")
+    print(f"Total monthly payroll: {table.total_monthly_salary()}")
+    print(f"Total yearly payroll: {table.total_yearly_salary()}")
+
+    promoted = table.promotion()
+    print(f"Total monthly payroll after a 10% promotion: {sum(promoted):.2f}")
+
+    top = table.sort_by('salary', reverse=True)
+    print("\nTop 5 earners:")
+    for emp in islice(top, 5):
+        print(f"  {emp}")
+
+    under_30 = table.filter(max_age=29)
+    print(f"\nEmployees under 30: {len(under_30)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import time
+
+from bulk_insert import iter_batches
+from config import env
+from instrumentation import get_logger
+from storage_backend import get_backend, BACKENDS
+
+log = get_logger(__name__)
+
+# Rows pulled from the server per fetchmany() call
+EXPORT_CHUNK_SIZE = env('EXPORT_CHUNK_SIZE', 10000, int)
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'envelope')
+
+CSV_HEADER = ('emp_id', 'source_id', 'name', 'monthly_salary', 'age', 'yearly_salary')
+
+
+def _plain_number(value):
+    """Render a DECIMAL without a trailing '.00' so it reads back like the API's salary strings"""
+    if value is None:
+        return None
+    text = format(value, 'f')
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return text
+
+
+def _feed_record(row):
+    """
+    Shape a table row like a record of the employees.json feed, keeping the
+    table's own emp_id and yearly_salary alongside
+    """
+    emp_id, source_id, name, monthly_salary, age, yearly_salary = row
+    return {
+        'id': source_id,
+        'employee_name': name,
+        'employee_salary': _plain_number(monthly_salary),
+        'employee_age': str(age),
+        'emp_id': emp_id,
+        'yearly_salary': _plain_number(yearly_salary),
+    }
+
+
+def _open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def _write_rows(f, chunks, format):
+    """Write every chunk of rows in the requested format, returning the row count"""
+    count = 0
+    if format == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for rows in chunks:
+            writer.writerows(
+                (emp_id, source_id, name, _plain_number(monthly), age, _plain_number(yearly))
+                for emp_id, source_id, name, monthly, age, yearly in rows
+            )
+            count += len(rows)
+    elif format == 'ndjson':
+        for rows in chunks:
+            f.write(''.join(json.dumps(_feed_record(row)) + '\n' for row in rows))
+            count += len(rows)
+    else:
+        f.write('{\n  "status": "success",\n  "data": [')
+        for rows in chunks:
+            for row in rows:
+                f.write(',\n    ' if count else '\n    ')
+                f.write(json.dumps(_feed_record(row)))
+                count += 1
+        f.write('\n  ]\n}\n' if count else ']\n}\n')
+    return count
+
+
+def export_employees(output_file, format='ndjson', compress=None, chunk_size=EXPORT_CHUNK_SIZE,
+                     backend=None):
+    """
+    Stream the employees table to a file without buffering the result set.
+
+    Rows are read from the storage backend (STORAGE_BACKEND by default; for
+    MySQL an unbuffered cursor) chunk_size rows at a time and written
+    straight out, so memory stays flat however large the table is.
+    format is 'csv', 'ndjson' or 'envelope' (the employees.json layout);
+    compress defaults to True when output_file ends in '.gz'; backend is a
+    StorageBackend or a backend name. The file is
+    written under a temporary name and only moved into place on success.
+    Returns the number of rows exported, or None on error.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {EXPORT_FORMATS}")
+    if compress is None:
+        compress = output_file.endswith('.gz')
+
+    if backend is None or isinstance(backend, str):
+        backend = get_backend(backend)
+
+    tmp_path = output_file + '.tmp'
+    start = time.perf_counter()
+    try:
+        with _open_output(tmp_path, compress) as f:
+            count = _write_rows(f, iter_batches(backend.iter_rows(chunk_size), chunk_size), format)
+        os.replace(tmp_path, output_file)
+    except backend.Error as e:
+        log.error(f"Error exporting employees: {e}")
+        return None
+    finally:
+        # Any failure (disk full, Ctrl-C, an encoding error) leaves no partial file behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0.0
+    log.info(f"Exported {count} employees to {output_file} in {elapsed:.3f}s ({rate:,.0f} rows/sec)")
+    return count
+
+
+def main():
+    """
+    Export the employees table from the command line
+    """
+    parser = argparse.ArgumentParser(description="Stream the employees table to CSV, NDJSON or JSON")
+    parser.add_argument('output', help="destination file; a .gz suffix enables gzip compression")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--gzip', action='store_true', default=None, help="force gzip compression")
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument('--backend', choices=tuple(BACKENDS), help="storage backend (default STORAGE_BACKEND)")
+    args = parser.parse_args()
+
+    export_employees(args.output, args.format, args.gzip, args.chunk_size, args.backend)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,428 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
 import json
+import math
+import os
+import random
+import sys
+import threading
 import time
 
-def fetch_employee_data():
-    """Fetch employee data from the dummy API"""
-    url = "https://dummy.restapiexample.com/api/v1/employees"
-    
-    # Add headers to avoid 406 error
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-    
-    max_retries = 3
-    retry_delay = 5  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"Attempt {attempt + 1} to fetch data...")
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 429:  # Too Many Requests
-                print(f"Rate limited. Waiting {retry_delay} seconds before retry...")
-                time.sleep(retry_delay)
+from http_cache import ResponseCache
+from employee_snapshot import write_snapshot, SNAPSHOT_ENABLED
+from config import env
+from instrumentation import get_logger, increment, timer
+from lazy_imports import lazy_import
+
+requests = lazy_import('requests')
+log = get_logger(__name__)
+
+# Upstream API and fetch tuning (can be overridden in the environment)
+API_URL = env('API_URL', 'https://dummy.restapiexample.com/api/v1/employees')
+PAGE_SIZE = env('FETCH_PAGE_SIZE', 100, int)    # records requested per page
+FETCH_WORKERS = env('FETCH_WORKERS', 4, int)    # concurrent page requests
+RATE_LIMIT = env('FETCH_RATE_LIMIT', 2, float)  # requests per second
+RATE_BURST = env('FETCH_RATE_BURST', FETCH_WORKERS, int)
+MAX_RETRIES = env('FETCH_MAX_RETRIES', 5, int)
+BACKOFF_BASE = 0.5   # seconds, doubled on every retry
+BACKOFF_CAP = 30     # seconds
+REQUEST_TIMEOUT = 30  # seconds
+
+# Add headers to avoid 406 error
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json',
+    'Content-Type': 'application/json'
+}
+
+# Simpler header set retried once when the API answers 406 Not Acceptable
+FALLBACK_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.1; Trident/6.0)',
+    'Accept': '*/*'
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all fetch workers.
+    pause() stops every worker until a server-requested Retry-After has passed.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Hold back all requests for at least the given number of seconds"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def backoff_delay(attempt):
+    """
+    Exponential backoff with full jitter for the given (0-based) retry attempt
+    """
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_after_seconds(response):
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+    Returns None when the header is missing or unparseable.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def create_session(pool_size=FETCH_WORKERS):
+    """
+    Keep-alive session whose connection pool has room for every worker
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def _total_pages(payload, page_size):
+    """
+    Read the page count from common pagination metadata, if the API sends any
+    """
+    for key in ('total_pages', 'last_page'):
+        if isinstance(payload.get(key), int):
+            return payload[key]
+    if isinstance(payload.get('total'), int):
+        return max(1, math.ceil(payload['total'] / page_size))
+    return None
+
+
+class PageFetcher:
+    """
+    Fetch a paginated employee endpoint with a bounded worker pool.
+
+    All workers share one keep-alive session and one token bucket. 429/503
+    responses pause the bucket for the server's Retry-After (or a jittered
+    backoff), transient errors are retried with jittered exponential backoff,
+    and a 406 is retried once with FALLBACK_HEADERS. Every retry is counted
+    in stats.
+
+    With a ResponseCache, pages are revalidated with If-None-Match /
+    If-Modified-Since and answered from disk on a 304 (or without a request
+    while a validator-less entry is inside its TTL). stats['not_modified'] is
+    True when every page, and the set of pages as a whole, matched the last
+    complete fetch.
+    """
+    def __init__(self, url=API_URL, page_size=PAGE_SIZE, workers=FETCH_WORKERS,
+                 rate_limit=RATE_LIMIT, burst=RATE_BURST, max_retries=MAX_RETRIES,
+                 cache=None):
+        self.url = url
+        self.page_size = page_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate_limit, burst)
+        self.session = create_session(workers)
+        self.cache = cache
+        self.stats = {'pages': 0, 'records': 0, 'requests': 0, 'retries': 0, 'rate_limited': 0,
+                      'cache_hits': 0, 'changed_pages': 0, 'not_modified': False}
+        self._stats_lock = threading.Lock()
+        self._page_hashes = {}
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+        increment(f"fetch_{key}", amount)
+
+    def fetch_page(self, page):
+        """
+        Fetch one page and return its decoded JSON payload.
+        Raises requests.exceptions.RequestException once retries are exhausted.
+        """
+        params = {'page': page, 'per_page': self.page_size}
+        headers = None
+        last_error = None
+
+        cache_key = entry = None
+        if self.cache is not None:
+            cache_key = self.cache.key(self.url, params)
+            entry = self.cache.lookup(cache_key)
+            if entry and self.cache.is_fresh(entry):
+                payload = self.cache.load_payload(cache_key)
+                if payload is not None:
+                    self._count('cache_hits')
+                    self._page_hashes[page] = entry['body_hash']
+                    return payload
+
+        for attempt in range(self.max_retries):
+            if attempt:
+                self._count('retries')
+            self.limiter.acquire()
+            self._count('requests')
+
+            try:
+                request_headers = dict(headers or {})
+                if entry:
+                    request_headers.update(self.cache.conditional_headers(entry))
+                with timer('http_request_seconds'):
+                    response = self.session.get(self.url, params=params, headers=request_headers,
+                                                timeout=REQUEST_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                log.warning(f"Error fetching page {page} on attempt {attempt + 1}: {e}")
+                last_error = e
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code == 304 and entry:  # Not Modified
+                payload = self.cache.load_payload(cache_key)
+                if payload is not None:
+                    self._count('cache_hits')
+                    self.cache.touch(cache_key)
+                    self._page_hashes[page] = entry['body_hash']
+                    return payload
+                # The cached body is gone; ask again without validators
+                entry = None
                 continue
-            elif response.status_code == 406:  # Not Acceptable
-                print("Request not acceptable. Trying with different headers...")
-                # Try with a simpler header set
-                simple_headers = {
-                    'User-Agent': 'Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.1; Trident/6.0)',
-                    'Accept': '*/*'
-                }
-                response = requests.get(url, headers=simple_headers)
-            else:
-                response.raise_for_status()  # Raises an HTTPError for bad responses
-            
-            # Parse the JSON response
-            data = response.json()
-            
-            # Print the data in a formatted way
-            print("Employee Data:")
-            print(json.dumps(data, indent=2))
-            
-            # Save the data to a file
-            with open('employees.json', 'w') as f:
-                json.dump(data, f, indent=2)
-            
-            print(f"\nSuccessfully fetched {len(data.get('data', []))} employees")
-            return data
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching data on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                print(f"Waiting {retry_delay} seconds before retry...")
-                time.sleep(retry_delay)
-            else:
-                print("Max retries reached. Failed to fetch data.")
-                return None
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON response: {e}")
-            return None
+            if response.status_code in (429, 503):  # Too Many Requests / Service Unavailable
+                self._count('rate_limited')
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                log.warning(f"Rate limited on page {page}. Waiting {delay:.1f} seconds before retry...")
+                self.limiter.pause(delay)
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} for page {page}", response=response)
+                continue
+            if response.status_code == 406 and headers is None:  # Not Acceptable
+                log.warning("Request not acceptable. Trying with different headers...")
+                headers = FALLBACK_HEADERS
+                continue
+            if response.status_code >= 500:
+                last_error = requests.exceptions.HTTPError(f"{response.status_code} for page {page}", response=response)
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            response.raise_for_status()  # Other 4xx errors are not worth retrying
+            with timer('http_json_decode_seconds'):
+                payload = response.json()
+            if self.cache is not None:
+                if self.cache.store(cache_key, response):
+                    self._count('changed_pages')
+                self._page_hashes[page] = self.cache.body_hash(cache_key)
+            return payload
+
+        raise requests.exceptions.RetryError(
+            f"Giving up on page {page} after {self.max_retries} attempts: {last_error}"
+        )
+
+    def fetch_all(self, on_page):
+        """
+        Fetch every page and hand each one to on_page(page_number, records) as
+        soon as it arrives. on_page always runs on the calling thread, so it
+        does not need to be thread-safe. Pages may arrive out of order.
+
+        When the API reports its page count the remaining pages are fanned out
+        over the worker pool; otherwise pages are requested a window at a time
+        until a short or empty page marks the end.
+        """
+        first = self.fetch_page(1)
+        first_records = first.get('data', [])
+        self._deliver(on_page, 1, first_records)
+
+        total_pages = _total_pages(first, self.page_size)
+        if total_pages is None and len(first_records) < self.page_size:
+            total_pages = 1
+        last_page = total_pages  # None until the end of the data has been seen
+        first_id = first_records[0].get('id') if first_records else None
+
+        next_page = 2
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while True:
+                    # Keep a bounded window of requests in flight
+                    while len(in_flight) < self.workers * 2 and (last_page is None or next_page <= last_page):
+                        in_flight[executor.submit(self.fetch_page, next_page)] = next_page
+                        next_page += 1
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        page = in_flight.pop(future)
+                        records = future.result().get('data', [])
+                        if last_page is not None and page > last_page:
+                            continue
+                        if total_pages is None:
+                            # Unpaginated APIs ignore the page parameter and repeat page 1
+                            repeated = bool(records) and records[0].get('id') == first_id
+                            if repeated or not records:
+                                last_page = page - 1 if last_page is None else min(last_page, page - 1)
+                                continue
+                            if len(records) < self.page_size:
+                                last_page = page if last_page is None else min(last_page, page)
+                        self._deliver(on_page, page, records)
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        if self.cache is not None:
+            delivered = sorted(page for page in self._page_hashes if last_page is None or page <= last_page)
+            dataset_changed = self.cache.record_dataset([self._page_hashes[page] for page in delivered])
+            self.stats['not_modified'] = not dataset_changed and self.stats['changed_pages'] == 0
+            self.cache.save()
+        return self.stats
+
+    def cached_page(self, page):
+        """
+        Payload of a page this fetcher has already fetched, read back from the
+        cache (requested again if the cached body has gone)
+        """
+        if self.cache is not None:
+            payload = self.cache.load_payload(self.cache.key(self.url, {'page': page, 'per_page': self.page_size}))
+            if payload is not None:
+                return payload
+        return self.fetch_page(page)
+
+    def _deliver(self, on_page, page, records):
+        self._count('pages')
+        self._count('records', len(records))
+        on_page(page, records)
+
+    def close(self):
+        self.session.close()
+
+
+class EnvelopeWriter:
+    """
+    Write records to disk in the employees.json envelope format as pages arrive,
+    so the full payload never has to be held in memory
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._tmp_path = path + '.tmp'
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self._file.write('{\n  "status": "success",\n  "data": [')
+
+    def write_page(self, page, records):
+        for record in records:
+            self._file.write(',\n    ' if self.count else '\n    ')
+            self._file.write(json.dumps(record))
+            self.count += 1
+
+    def close(self):
+        """Finish the envelope and atomically replace the target file"""
+        self._file.write('\n  ]\n}\n' if self.count else ']\n}\n')
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discard a partially written file, leaving the previous one in place"""
+        self._file.close()
+        os.remove(self._tmp_path)
+
+
+def fetch_employee_data(output_file='employees.json', on_page=None, url=API_URL, use_cache=True):
+    """
+    Fetch employee data from the API.
+
+    Each page is streamed to on_page(page_number, records) when given, and
+    otherwise written incrementally to output_file in the envelope format.
+    When use_cache is set, responses are revalidated against the on-disk
+    HTTP cache and an unchanged dataset leaves output_file untouched.
+    Returns the fetch stats (pages, records, requests, retries, rate_limited,
+    cache_hits, changed_pages, not_modified) or None if the fetch failed.
+    """
+    cache = ResponseCache() if use_cache else None
+    fetcher = PageFetcher(url=url, cache=cache)
+    writer = None
+    if on_page is None:
+        writer = EnvelopeWriter(output_file)
+        on_page = writer.write_page
+
+    try:
+        log.info(f"Fetching employee data from {url} with {fetcher.workers} workers...")
+        with timer('fetch_seconds'):
+            stats = fetcher.fetch_all(on_page)
+    except requests.exceptions.RequestException as e:
+        log.error(f"Error fetching data: {e}")
+        log.error("Max retries reached. Failed to fetch data.")
+        stats = None
+    except json.JSONDecodeError as e:
+        log.error(f"Error decoding JSON response: {e}")
+        stats = None
+    finally:
+        fetcher.close()
+
+    unchanged = stats is not None and stats['not_modified'] and os.path.exists(output_file)
+    if writer is not None:
+        if stats is None or unchanged:
+            writer.abort()
+        else:
+            writer.close()
+
+    if unchanged:
+        log.info(f"\nEmployee data unchanged upstream ({stats['cache_hits']} cached pages); "
+                 f"{output_file} left as is")
+    elif stats is not None:
+        log.info(f"\nSuccessfully fetched {stats['records']} employees in {stats['pages']} pages "
+                 f"({stats['requests']} requests, {stats['retries']} retries, "
+                 f"{stats['rate_limited']} rate limited)")
+        if writer is not None and SNAPSHOT_ENABLED:
+            # Later runs map the parsed columns instead of decoding the JSON again
+            try:
+                write_snapshot(output_file)
+            except OSError as e:
+                log.warning(f"Could not write employee snapshot: {e}")
+    return stats
+
+# Exit status of the script when upstream data has not changed, so a cron chain
+# like `python fetch_employees.py && python insert_employees_with_class.py`
+# skips the rest of the ingest
+EXIT_NOT_MODIFIED = 3
+
+def main():
+    """
+    Fetch employees into employees.json; the exit status reports what happened
+    (0 new data written, 1 fetch failed, EXIT_NOT_MODIFIED nothing changed)
+    """
+    use_cache = env('HTTP_CACHE', '1') != '0'
+    stats = fetch_employee_data(use_cache=use_cache)
+    if stats is None:
+        return 1
+    if stats['not_modified']:
+        return EXIT_NOT_MODIFIED
+    return 0
 
 if __name__ == "__main__":
-    fetch_employee_data()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import argparse
+import gzip
+import json
+import os
+import random
+
+from instrumentation import get_logger
+
+log = get_logger(__name__)
+
+GENERATOR_FORMATS = ('envelope', 'ndjson')
+
+FIRST_NAMES = (
+    'Tiger', 'Garrett', 'Ashton', 'Cedric', 'Airi', 'Brielle', 'Herrod', 'Rhona', 'Colleen', 'Sonya',
+    'Jena', 'Quinn', 'Charde', 'Haley', 'Tatyana', 'Michael', 'Paul', 'Gloria', 'Bradley', 'Dai',
+    'Jenette', 'Yuri', 'Caesar', 'Doris', 'Angelica', 'Gavin', 'Jennifer', 'Brenden', 'Fiona', 'Shou',
+    'Michelle', 'Suki', 'Prescott', 'Gavin', 'Martena', 'Unity', 'Howard', 'Hope', 'Vivian', 'Timothy',
+    'Jackson', 'Olivia', 'Sakura', 'Thor', 'Finn', 'Serge', 'Zenaida', 'Zorita', 'Jennifer', 'Cara',
+    'Hermione', 'Lael', 'Jonas', 'Shad', 'Michael', 'Donna', 'Zoë', 'José', 'Łucja', 'Ingrid',
+)
+
+LAST_NAMES = (
+    'Nixon', 'Winters', 'Cox', 'Kelly', 'Satou', 'Williamson', 'Chandler', 'Davidson', 'Hurst', 'Frost',
+    'Gaines', 'Flynn', 'Marshall', 'Kennedy', 'Fitzpatrick', 'Silva', 'Byrd', 'Little', 'Greer', 'Rios',
+    'Caldwell', 'Berry', 'Vance', 'Wilder', 'Ramos', 'Joyce', 'Chang', 'Wagner', 'Green', 'Itou',
+    'House', 'Baker', 'Bartlett', 'Cortez', 'Mccray', 'Butler', 'Hatfield', 'Fuentes', 'Harrell', 'Mooney',
+    'Bradshaw', 'Liang', 'Yamamoto', 'Walton', 'Camacho', 'Baldwin', 'Frank', 'Serrano', 'Acosta', 'Stevens',
+    'Wallace', 'Alexander', 'Snider', 'Decker', 'Bruce', 'Snider', 'Müller', 'Núñez', 'Żak', 'Ørsted',
+)
+
+SALARY_RANGE = (1000, 500000)   # monthly, whole units like the feed
+AGE_RANGE = (18, 70)
+DEFAULT_SEED = 42
+
+
+def synthetic_records(count, seed=DEFAULT_SEED, start_id=1):
+    """
+    Yield count records shaped like the employees.json feed (string salary
+    and age, empty profile_image). The same count and seed always produce the
+    same records, so benchmark runs on different commits see identical input.
+    """
+    rng = random.Random(seed)
+    first, last = FIRST_NAMES, LAST_NAMES
+    low_salary, high_salary = SALARY_RANGE
+    low_age, high_age = AGE_RANGE
+    for emp_id in range(start_id, start_id + count):
+        yield {
+            'id': emp_id,
+            'employee_name': f"{first[rng.randrange(len(first))]} {last[rng.randrange(len(last))]}",
+            'employee_salary': str(rng.randint(low_salary, high_salary)),
+            'employee_age': str(rng.randint(low_age, high_age)),
+            'profile_image': '',
+        }
+
+
+def _open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def write_dataset(path, count, format='envelope', seed=DEFAULT_SEED, compress=None):
+    """
+    Stream count synthetic records to path as the employees.json envelope or
+    NDJSON (gzip-compressed when compress is set, by default when path ends
+    in '.gz'). Records are written as they are generated, so 10^7 rows need
+    no more memory than 10^3. Returns the number of records written.
+    """
+    if format not in GENERATOR_FORMATS:
+        raise ValueError(f"Unknown format '{format}', expected one of {GENERATOR_FORMATS}")
+    if compress is None:
+        compress = path.endswith('.gz')
+
+    tmp_path = path + '.tmp'
+    written = 0
+    with _open_output(tmp_path, compress) as f:
+        if format == 'ndjson':
+            for record in synthetic_records(count, seed):
+                f.write(json.dumps(record) + '\n')
+                written += 1
+        else:
+            f.write('{\n  "status": "success",\n  "data": [')
+            for record in synthetic_records(count, seed):
+                f.write(',\n    ' if written else '\n    ')
+                f.write(json.dumps(record))
+                written += 1
+            f.write('\n  ]\n}\n' if written else ']\n}\n')
+    os.replace(tmp_path, path)
+    return written
+
+
+def main():
+    """
+    Write a synthetic employee dataset from the command line
+    """
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic employee dataset")
+    parser.add_argument('output', help="destination file; a .gz suffix enables gzip compression")
+    parser.add_argument('--rows', type=int, default=1000, help="number of employees (e.g. 1000 to 10000000)")
+    parser.add_argument('--format', choices=GENERATOR_FORMATS, default='envelope')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    count = write_dataset(args.output, args.rows, args.format, args.seed)
+    log.info(f"Wrote {count} synthetic employees to {args.output} ({args.format}, seed {args.seed})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+from config import env
+
+# On-disk cache location and freshness window (can be overridden in the environment)
+HTTP_CACHE_DIR = env('HTTP_CACHE_DIR', '.http_cache')
+HTTP_CACHE_TTL = env('HTTP_CACHE_TTL', 300, float)   # seconds; only used when the server sends no validators
+
+INDEX_FILE = 'index.json'
+DATASET_KEY = '__dataset__'
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses for conditional GETs.
+
+    For every request URL (including query parameters) the index stores the
+    ETag / Last-Modified validators, when the response was stored and a
+    SHA-256 of the body; the body itself is kept next to the index so a 304
+    can be answered locally. Entries without validators are served from disk
+    without a request until they are older than ttl seconds. The index also
+    records a hash over all page hashes of the last complete fetch, so an
+    unchanged dataset is detected even when the server ignores validators.
+    """
+    def __init__(self, directory=HTTP_CACHE_DIR, ttl=HTTP_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index = {}
+
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # A missing or corrupt index just means a cold cache
+            self._index = {}
+
+    @staticmethod
+    def key(url, params=None):
+        """Cache key for a URL and its query parameters"""
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted(params.items()))}"
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def lookup(self, key):
+        """Stored entry for a key, or None"""
+        with self._lock:
+            entry = self._index.get(key)
+            return dict(entry) if entry else None
+
+    def is_fresh(self, entry):
+        """True when an entry without validators is still inside its TTL"""
+        if entry.get('etag') or entry.get('last_modified'):
+            return False
+        return time.time() - entry.get('stored_at', 0) < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """If-None-Match / If-Modified-Since headers for revalidating an entry"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def load_payload(self, key):
+        """Decoded cached body for a key, or None if it is missing or unreadable"""
+        try:
+            with open(self._body_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def touch(self, key):
+        """Mark an entry as revalidated now (after a 304)"""
+        with self._lock:
+            if key in self._index:
+                self._index[key]['stored_at'] = time.time()
+
+    def store(self, key, response):
+        """
+        Save a 200 response's validators and body.
+        Returns True if the body differs from the previously cached one.
+        """
+        body = response.content
+        body_hash = hashlib.sha256(body).hexdigest()
+
+        tmp_path = self._body_path(key) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, self._body_path(key))
+
+        with self._lock:
+            previous = self._index.get(key, {}).get('body_hash')
+            self._index[key] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'stored_at': time.time(),
+                'body_hash': body_hash,
+            }
+        return previous != body_hash
+
+    def body_hash(self, key):
+        with self._lock:
+            return self._index.get(key, {}).get('body_hash')
+
+    def record_dataset(self, page_hashes):
+        """
+        Store the hash of a complete fetch (page hashes in page order).
+        Returns True if it differs from the last complete fetch.
+        """
+        digest = hashlib.sha256('\n'.join(page_hashes).encode('utf-8')).hexdigest()
+        with self._lock:
+            previous = self._index.get(DATASET_KEY, {}).get('body_hash')
+            self._index[DATASET_KEY] = {'stored_at': time.time(), 'body_hash': digest}
+        return previous != digest
+
+    def save(self):
+        """Atomically write the index to disk"""
+        with self._lock:
+            data = json.dumps(self._index, indent=2)
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
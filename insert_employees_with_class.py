@@ -1,177 +1,299 @@
-import mysql.connector
-from dotenv import load_dotenv
-import os
-import json
+from database_connection import get_connection, pool_metrics
+from bulk_insert import (
+    bulk_insert, employee_rows, format_insert_stats, iter_batches, upsert_method,
+    DEFAULT_BATCH_SIZE, DEFAULT_COMMIT_EVERY, DEFAULT_METHOD, EMPLOYEE_UPDATE_COLUMNS
+)
+from update_table_structure import run_migrations
+from data_version import bump_data_version
+from employee_objects import iter_employees
+from payroll_summary import SummaryDelta, read_summary, reset_summary
+from storage_backend import get_backend, BACKENDS
+from itertools import chain
+import argparse
+import time
+from instrumentation import get_logger
+from lazy_imports import lazy_import
 
-# Load environment variables from .env file
-load_dotenv()
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
 
-class Employee:
-    """
-    Employee class to represent employee data with methods for calculations
-    """
-    def __init__(self, emp_id, name, salary, age):
-        self.id = emp_id
-        self.name = name
-        self.salary = int(salary)  # Convert to int for calculations
-        self.age = int(age)        # Convert to int
-        
-    def yearly_salary(self):
-        """Calculate yearly salary (monthly salary * 12)"""
-        return self.salary * 12
-        
-    def promotion(self):
-        """Calculate promoted salary (current salary * 1.10)"""
-        return self.salary * 1.10
-    
-    def __str__(self):
-        return f"Employee(id={self.id}, name='{self.name}', salary={self.salary}, age={self.age})"
+# Rows removed per DELETE when pruning employees that left the source feed
+DELETE_CHUNK_SIZE = 5000
 
-def load_employees_from_json(json_file):
+def insert_employees_to_db(employees, batch_size=DEFAULT_BATCH_SIZE, method=DEFAULT_METHOD,
+                           commit_every=DEFAULT_COMMIT_EVERY):
     """
-    Load employee data from JSON file and convert to Employee objects
+    Insert employee data into the database (yearly salary is generated by the database).
+    Rows are sent in batches of batch_size using the given bulk_insert method and
+    committed every commit_every rows. Each commit also carries the payroll summary
+    delta for its rows, so the summary always matches what has been committed.
+    Returns False if the connection or any batch fails; chunks committed before
+    the failure stay in the table (see quarantine_loader.py to load around bad rows).
     """
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+    delta = SummaryDelta()
+    stats = {'rows': 0, 'batches': 0, 'commits': 0}
     
-    # Extract the employee list from the 'data' key
-    employees_json = data.get('data', [])
-    
-    # Convert JSON data to Employee objects
-    employees = []
-    for emp_data in employees_json:
-        employee = Employee(
-            emp_id=emp_data['id'],
-            name=emp_data['employee_name'],
-            salary=emp_data['employee_salary'],
-            age=emp_data['employee_age']
-        )
-        employees.append(employee)
-    
-    return employees
+    try:
+        with get_connection() as connection:
+            # Make sure the payroll summary table exists
+            run_migrations(connection)
+            start = time.perf_counter()
+            try:
+                for chunk in iter_batches(employees, commit_every or DEFAULT_COMMIT_EVERY):
+                    for emp in chunk:
+                        delta.add(emp.age, emp.salary)
+                    delta.apply(connection)
+                    # Yearly salary is generated by the database from monthly_salary;
+                    # bulk_insert's single commit covers the summary delta too
+                    chunk_stats = bulk_insert(connection, employee_rows(chunk), batch_size=batch_size,
+                                              method=method, commit_every=None)
+                    for key in stats:
+                        stats[key] += chunk_stats[key]
+                bump_data_version(connection)
+                
+                stats['seconds'] = time.perf_counter() - start
+                stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+                log.info(f"Successfully inserted {stats['rows']} employees into the database")
+                log.info(f"Insert throughput: {format_insert_stats(stats)}")
+                
+            except mysql.connector.Error as e:
+                log.error(f"Error inserting data: {e}")
+                # Drops the failed chunk together with its summary delta
+                connection.rollback()
+                return False
+        
+        return True
+    except mysql.connector.Error as e:
+        log.error(f"Error connecting to MySQL: {e}")
+        return False
 
-def connect_to_database():
+def clear_employees_table():
     """
-    Connect to MySQL database using credentials from .env file
+    Clear all records from the employees table
     """
     try:
-        # Get credentials from environment variables
-        user = os.getenv('USER')
-        password = os.getenv('PASSWORD')
-        
-        # Default connection parameters
-        host = os.getenv('HOST', 'localhost')
-        database = os.getenv('DATABASE', 'employee_db')
-        port = os.getenv('PORT', 3306)
-        
-        print(f"Connecting to database: {database}")
-        
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port
-        )
-        
-        if connection.is_connected():
-            print("Successfully connected to MySQL database")
-            return connection
+        with get_connection() as connection:
+            run_migrations(connection)
+            cursor = connection.cursor()
+            
+            # Clear the table (and its summary, in the same transaction)
+            cursor.execute("DELETE FROM employees;")
+            reset_summary(cursor)
+            connection.commit()
+            bump_data_version(connection)
+            log.info("Cleared all records from employees table")
             
     except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+        log.error(f"Error clearing table: {e}")
 
-def insert_employees_to_db(employees):
+def sync_employees_to_db(employees, batch_size=DEFAULT_BATCH_SIZE, delete_missing=True):
     """
-    Insert employee data into the database using computed yearly salary from class method
+    Incrementally sync employees into the table, keyed on the source id.
+    
+    Each batch is compared against the stored row hashes: new employees are
+    inserted, changed ones are updated through INSERT ... ON DUPLICATE KEY UPDATE
+    and unchanged ones are skipped. Rows whose source id no longer appears in the
+    feed are deleted at the end. The table is never emptied while the sync runs.
+    Every change is also applied to the payroll summary as a delta, in the same
+    transaction as the rows it describes.
+    Returns a dict of inserted/updated/deleted/unchanged counts, or None on error.
     """
-    connection = connect_to_database()
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+    delta = SummaryDelta()
     
-    if connection:
-        try:
+    try:
+        with get_connection() as connection:
+            # Make sure the source_id / row_hash columns and unique key exist
+            run_migrations(connection)
             cursor = connection.cursor()
             
-            # Prepare insert query
-            insert_query = """
-            INSERT INTO employees (name, monthly_salary, age, yearly_salary) 
-            VALUES (%s, %s, %s, %s)
-            """
-            
-            successful_inserts = 0
+            # Source ids seen in this run are kept server-side so client memory stays flat
+            cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS sync_seen_ids (source_id INT PRIMARY KEY)")
+            cursor.execute("DELETE FROM sync_seen_ids")
             
-            for emp in employees:
-                # Compute yearly salary using the class method
-                yearly_sal = emp.yearly_salary()
+            seen = 0
+            for batch in iter_batches(employees, batch_size):
+                # The last occurrence wins if the feed repeats an id within a batch
+                by_id = {emp.id: emp for emp in batch}
+                ids = list(by_id)
+                seen += len(ids)
                 
-                # Insert the employee data
-                cursor.execute(insert_query, (emp.name, emp.salary, emp.age, yearly_sal))
-                successful_inserts += 1
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f"SELECT source_id, row_hash, age, monthly_salary FROM employees "
+                    f"WHERE source_id IN ({placeholders})",
+                    ids
+                )
+                stored = {row[0]: row[1:] for row in cursor.fetchall()}
+                
+                changed = []
+                for emp_id, emp in by_id.items():
+                    if emp_id not in stored:
+                        counts['inserted'] += 1
+                        changed.append(emp)
+                        delta.add(emp.age, emp.salary)
+                    elif stored[emp_id][0] != emp.content_hash():
+                        counts['updated'] += 1
+                        changed.append(emp)
+                        delta.remove(*stored[emp_id][1:])
+                        delta.add(emp.age, emp.salary)
+                    else:
+                        counts['unchanged'] += 1
+                
+                bulk_insert(connection, [(emp_id,) for emp_id in ids], table='sync_seen_ids',
+                            columns=('source_id',), update_columns=('source_id',),
+                            batch_size=len(ids), commit_every=None, method=upsert_method())
+                if changed:
+                    # bulk_insert's commit covers the summary delta too
+                    delta.apply(connection)
+                    bulk_insert(connection, employee_rows(changed), update_columns=EMPLOYEE_UPDATE_COLUMNS,
+                                batch_size=len(changed), commit_every=None, method=upsert_method())
             
-            connection.commit()
-            print(f"Successfully inserted {successful_inserts} employees into the database")
-            print(f"Yearly salaries computed using the Employee.yearly_salary() method")
+            if delete_missing and seen == 0:
+                # An empty feed is far more likely a failed fetch than a company with no staff
+                log.warning("Source feed is empty; skipping deletion of missing employees")
+            elif delete_missing:
+                while True:
+                    cursor.execute("""
+                        SELECT e.emp_id, e.age, e.monthly_salary FROM employees e
+                        LEFT JOIN sync_seen_ids s ON s.source_id = e.source_id
+                        WHERE s.source_id IS NULL
+                        LIMIT %s
+                    """, (DELETE_CHUNK_SIZE,))
+                    missing = cursor.fetchall()
+                    if not missing:
+                        break
+                    placeholders = ', '.join(['%s'] * len(missing))
+                    cursor.execute(f"DELETE FROM employees WHERE emp_id IN ({placeholders})",
+                                   [row[0] for row in missing])
+                    counts['deleted'] += cursor.rowcount
+                    for _, age, monthly_salary in missing:
+                        delta.remove(age, monthly_salary)
+                    delta.apply(connection)
+                    connection.commit()
             
-        except mysql.connector.Error as e:
-            print(f"Error inserting data: {e}")
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS sync_seen_ids")
+            cursor.close()
+            
+            if counts['inserted'] or counts['updated'] or counts['deleted']:
+                bump_data_version(connection)
         
-        connection.close()
-        return True
-    else:
-        return False
+        return counts
+    except mysql.connector.Error as e:
+        log.error(f"Error syncing employees: {e}")
+        return None
 
-def clear_employees_table():
+def load_into_backend(employees, backend, full_reload=False, batch_size=DEFAULT_BATCH_SIZE):
     """
-    Clear all records from the employees table
+    Load employees into any storage backend (see storage_backend.py).
+    Upserts by source id by default; full_reload empties the table first.
+    Unlike sync_employees_to_db, rows missing from the feed are kept unless
+    full_reload is used. Returns the bulk insert stats, or None on error.
     """
-    connection = connect_to_database()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
-            
-            # Clear the table
-            cursor.execute("DELETE FROM employees;")
-            connection.commit()
-            print("Cleared all records from employees table")
-            
-        except mysql.connector.Error as e:
-            print(f"Error clearing table: {e}")
-        
-        connection.close()
+    try:
+        backend.ensure_schema()
+        if full_reload:
+            backend.clear()
+            stats = backend.bulk_insert(employee_rows(employees), batch_size=batch_size)
+        else:
+            stats = backend.upsert(employee_rows(employees), batch_size=batch_size)
+        log.info(f"Loaded into {backend.name}: {format_insert_stats(stats)}")
+        log.info(f"Total employees in {backend.name}: {backend.count()}")
+        return stats
+    except backend.Error as e:
+        log.error(f"Error loading employees into {backend.name}: {e}")
+        return None
+
+def verify_load(json_file):
+    """
+    Compare the table with the feed it was loaded from by chunk checksums
+    (a count alone misses changed or corrupted rows). Returns True if they match.
+    """
+    from check_table import check_table
+    try:
+        result = check_table(json_file)
+    except mysql.connector.Error as e:
+        log.error(f"Error verifying the load: {e}")
+        return False
+    differences = len(result['missing']) + len(result['extra']) + len(result['changed'])
+    if differences:
+        log.error(f"Verification failed: {len(result['missing'])} missing, {len(result['extra'])} extra, "
+                  f"{len(result['changed'])} changed rows in chunks {result['mismatched_chunks'][:10]} "
+                  f"(run check_table.py for details)")
+    else:
+        log.info(f"Verified {result['source_rows']} rows against the feed in {result['chunks']} chunks")
+    return not differences
 
 def main():
     """
-    Main function to load employees from JSON, compute yearly salary using class method, and insert to DB
+    Main function to load employees from JSON and insert them into the DB.
+    Runs an incremental sync by default; --full-reload clears the table and re-inserts everything.
     """
-    print("Loading employees from JSON file...")
-    employees = load_employees_from_json('employees.json')
+    parser = argparse.ArgumentParser(description="Load employees.json into the employees table")
+    parser.add_argument('--full-reload', action='store_true',
+                        help="delete every row and re-insert the whole feed instead of syncing changes")
+    parser.add_argument('--json-file', default='employees.json', help="source file (envelope, NDJSON or gzip)")
+    parser.add_argument('--backend', choices=tuple(BACKENDS),
+                        help="storage backend (default STORAGE_BACKEND); only mysql syncs deletions")
+    parser.add_argument('--verify', action='store_true',
+                        help="checksum-compare the table with the feed afterwards (see check_table.py)")
+    args = parser.parse_args()
+    
+    log.info("Streaming employees from JSON file...")
+    employees = iter_employees(args.json_file)
+    
+    # Peek at the first employee without materialising the rest of the file
+    first = next(employees, None)
+    if first is not None:
+        employees = chain([first], employees)
+    log.info(f"Sample employee: {first if first else 'No employees'}")
+    log.info(f"Sample yearly salary (computed using class method): {first.yearly_salary() if first else 'N/A'}")
+    
+    backend = get_backend(args.backend)
+    if backend.name != 'mysql':
+        log.info(f"\nLoading employee data into {backend.name}...")
+        load_into_backend(employees, backend, full_reload=args.full_reload)
+        return
     
-    print(f"Loaded {len(employees)} employees")
-    print(f"Sample employee: {employees[0] if employees else 'No employees'}")
-    print(f"Sample yearly salary (computed using class method): {employees[0].yearly_salary() if employees else 'N/A'}")
+    if not args.full_reload:
+        log.info("\nSyncing employee data into database...")
+        counts = sync_employees_to_db(employees)
+        if counts is not None:
+            log.info(f"Sync complete: {counts['inserted']} inserted, {counts['updated']} updated, "
+                     f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+        else:
+            log.error("\nFailed to sync employees into database")
+        if counts is not None and args.verify:
+            verify_load(args.json_file)
+        log.info(f"Connection pool metrics: {pool_metrics()}")
+        return
     
     # Clear the existing data in the table
-    print("\nClearing existing data from employees table...")
+    log.info("\nClearing existing data from employees table...")
     clear_employees_table()
     
     # Insert the employee data into the database
-    print("\nInserting employee data into database...")
+    log.info("\nInserting employee data into database...")
     success = insert_employees_to_db(employees)
     
     if success:
-        print("\nSuccessfully inserted all employees with computed yearly salaries!")
+        log.info("\nSuccessfully inserted all employees!")
         
-        # Verify by checking the count
-        connection = connect_to_database()
-        if connection:
-            cursor = connection.cursor()
-            cursor.execute("SELECT COUNT(*) FROM employees;")
-            count = cursor.fetchone()[0]
-            print(f"Total employees in database after insertion: {count}")
-            connection.close()
+        # Verify by checking the count (reuses the same pooled connection)
+        try:
+            # Read-only, but still on the primary until a replica has this run's writes
+            with get_connection(read_only=True) as connection:
+                # Read from the payroll summary instead of counting every row
+                count = read_summary(connection)['all']['headcount']
+                log.info(f"Total employees in database after insertion: {count}")
+        except mysql.connector.Error as e:
+            log.error(f"Error counting employees: {e}")
+        if args.verify:
+            verify_load(args.json_file)
     else:
-        print("\nFailed to insert employees into database")
+        log.error("\nFailed to insert employees into database")
+    
+    log.info(f"Connection pool metrics: {pool_metrics()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
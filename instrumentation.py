@@ -0,0 +1,267 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from config import env
+from lazy_imports import lazy_import
+
+logging = lazy_import('logging')
+
+# Where the metrics of a run are written when the process exits (unset: not written)
+METRICS_JSON_FILE = env('METRICS_JSON_FILE')    # one JSON line appended per run
+METRICS_PROM_FILE = env('METRICS_PROM_FILE')    # Prometheus text format, replaced per run
+
+# DEBUG, INFO (default), WARNING, ERROR or OFF; LOG_FORMAT=json for JSON log lines
+LOG_LEVEL = env('LOG_LEVEL', 'INFO')
+LOG_FORMAT = env('LOG_FORMAT', 'plain')
+
+METRIC_PREFIX = 'employees_'
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Observations kept per histogram for percentiles (a uniform sample beyond that)
+MAX_SAMPLES = 10000
+
+
+class Histogram:
+    """
+    Distribution of observed values: count, sum, min, max, cumulative bucket
+    counts for Prometheus, and a bounded reservoir sample for percentiles
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS, max_samples=MAX_SAMPLES):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)   # last one is +Inf
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.max_samples:
+                self.samples[slot] = value
+
+    def percentile(self, q):
+        """Value below which a fraction q of the observations fall (nearest rank)"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(0.50),
+            'p90': self.percentile(0.90),
+            'p99': self.percentile(0.99),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe registry of the counters and histograms of one process run.
+
+    Counters only go up (rows written, retries, ...); histograms record
+    durations in seconds (one observation per HTTP request, JSON decode,
+    DB batch, commit, ...). snapshot() derives a per-second rate for every
+    counter over the run, and the p50/p90/p99 of every histogram.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+            self._start = time.perf_counter()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe how long the with-block took, in seconds, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of timer()"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """
+        Everything recorded so far: {'started', 'elapsed_seconds', 'counters',
+        'rates' (per second of the run), 'histograms' (count, sum, min, max,
+        mean, p50, p90, p99)}
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            return {
+                'started': self.started,
+                'elapsed_seconds': elapsed,
+                'counters': dict(self.counters),
+                'rates': {name: value / elapsed for name, value in self.counters.items()} if elapsed > 0 else {},
+                'histograms': {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """The registry in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            for name, value in sorted(self.counters.items()):
+                metric = f"{prefix}{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+            return '\n'.join(lines) + '\n'
+
+    def write_json_line(self, path, **fields):
+        """Append the snapshot (plus any extra fields, e.g. the script name) as one JSON line"""
+        record = {**fields, **self.snapshot()}
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def write_prometheus(self, path):
+        """
+        Write the Prometheus text file atomically, so a node_exporter
+        textfile collector never reads half a file
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+# The process-wide registry every module records into
+METRICS = Metrics()
+increment = METRICS.increment
+observe = METRICS.observe
+timer = METRICS.timer
+timed = METRICS.timed
+
+
+def export_metrics(json_file=None, prom_file=None):
+    """
+    Write the metrics of this run to METRICS_JSON_FILE / METRICS_PROM_FILE
+    (or the given paths); does nothing when neither is set
+    """
+    json_file = json_file or METRICS_JSON_FILE
+    prom_file = prom_file or METRICS_PROM_FILE
+    try:
+        if json_file:
+            METRICS.write_json_line(json_file, script=os.path.basename(sys.argv[0]) or None)
+        if prom_file:
+            METRICS.write_prometheus(prom_file)
+    except OSError as e:
+        get_logger(__name__).warning(f"Could not write metrics: {e}")
+
+
+def _export_at_exit():
+    # Worker processes (parallel_loader.py) would overwrite the parent's files
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        export_metrics()
+
+
+if METRICS_JSON_FILE or METRICS_PROM_FILE:
+    atexit.register(_export_at_exit)
+
+
+def _json_record(record):
+    return json.dumps({
+        'time': record.created,
+        'level': record.levelname.lower(),
+        'logger': record.name,
+        'message': record.getMessage(),
+    })
+
+
+@functools.lru_cache(maxsize=None)
+def _configure_logging():
+    """
+    Send the project's log messages to stdout at LOG_LEVEL, as bare messages
+    (so output reads as it did with print) or as JSON lines
+    """
+    root = logging.getLogger('employees')
+    handler = logging.StreamHandler(sys.stdout)
+    formatter = logging.Formatter('%(message)s')
+    if LOG_FORMAT == 'json':
+        formatter.format = _json_record
+    handler.setFormatter(formatter)
+    root.addHandler(handler)
+    level = LOG_LEVEL.upper()
+    root.setLevel(logging.CRITICAL + 1 if level == 'OFF' else level)
+    root.propagate = False
+
+
+class _Logger:
+    """
+    Module logger that imports and configures logging on its first message,
+    so importing a module stays as cheap as it was with print
+    """
+    def __init__(self, name):
+        self.name = name
+        self._logger = None
+
+    def __getattr__(self, attr):
+        if self._logger is None:
+            _configure_logging()
+            self._logger = logging.getLogger(self.name)
+        return getattr(self._logger, attr)
+
+
+def get_logger(name):
+    """
+    Levelled logger for a module: get_logger(__name__).info(...) replaces
+    print(...); LOG_LEVEL=WARNING keeps only problems, LOG_LEVEL=OFF silences it
+    """
+    return _Logger(f"employees.{name}")
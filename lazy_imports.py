@@ -0,0 +1,38 @@
+import importlib
+import importlib.util
+import sys
+import threading
+
+_lock = threading.Lock()
+
+
+def lazy_import(name):
+    """
+    Behaves like `import name`, but the module body only runs the first time
+    one of its attributes is used. Scripts that never touch the database or
+    the network therefore never pay for importing the MySQL driver or requests.
+
+    As with the import statement, a dotted name returns the top-level package
+    with the submodule bound on it, so `mysql = lazy_import('mysql.connector')`
+    keeps `mysql.connector.connect(...)` and `except mysql.connector.Error`
+    working unchanged. Modules already imported are returned as they are.
+    """
+    with _lock:
+        if name not in sys.modules:
+            spec = importlib.util.find_spec(name)
+            if spec is None:
+                raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+            loader = importlib.util.LazyLoader(spec.loader)
+            spec.loader = loader
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            loader.exec_module(module)
+
+            parent, _, child = name.rpartition('.')
+            if parent:
+                setattr(sys.modules[parent], child, module)
+
+    top_level = name.partition('.')[0]
+    if top_level == name:
+        return sys.modules[name]
+    return importlib.import_module(top_level)
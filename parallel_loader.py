@@ -0,0 +1,199 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from bulk_insert import (
+    bulk_insert, employee_rows, format_insert_stats, upsert_method,
+    DEFAULT_BATCH_SIZE, EMPLOYEE_UPDATE_COLUMNS
+)
+from database_connection import get_connection
+from data_version import bump_data_version
+from employee_objects import iter_employees
+from insert_employees_with_class import clear_employees_table
+from payroll_summary import rebuild_summary
+from config import env
+from instrumentation import get_logger, increment, observe
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Defaults (can be overridden in the environment)
+LOAD_WORKERS = env('PARALLEL_LOAD_WORKERS', os.cpu_count() or 4, int)
+PARTITION_RETRIES = env('PARALLEL_LOAD_RETRIES', 2, int)
+RANGE_SIZE = env('PARALLEL_LOAD_RANGE_SIZE', 100000, int)   # source ids per range partition
+
+PARTITION_SCHEMES = ('hash', 'range')
+
+
+def partition_key(emp_id, scheme, partitions=None, range_size=RANGE_SIZE):
+    """
+    Partition an employee belongs to: emp_id modulo partitions for 'hash',
+    or the block of range_size consecutive ids for 'range'
+    """
+    if scheme == 'hash':
+        return emp_id % partitions
+    return emp_id // range_size
+
+
+def split_into_partitions(employees, directory, scheme='hash', partitions=None, range_size=RANGE_SIZE):
+    """
+    Stream employees once and spill each one, already shaped as an insert row,
+    to its partition's file under directory. Every row for a given source id
+    lands in the same partition, so partitions never conflict with each other.
+    Returns {partition: (path, row_count)}.
+    """
+    files = {}
+    counts = {}
+    try:
+        for row in employee_rows(employees):
+            # row[0] is the source id (see EMPLOYEE_COLUMNS)
+            key = partition_key(row[0], scheme, partitions, range_size)
+            f = files.get(key)
+            if f is None:
+                f = files[key] = open(os.path.join(directory, f"partition-{key}.jsonl"), 'w', encoding='utf-8')
+                counts[key] = 0
+            f.write(json.dumps(row))
+            f.write('\n')
+            counts[key] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return {key: (files[key].name, counts[key]) for key in files}
+
+
+def load_partition(partition, path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load one partition file in a single transaction on its own connection.
+    Runs inside a worker process or thread. Returns (partition, rows, seconds).
+    """
+    def rows():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    with get_connection() as connection:
+        # commit_every=None: the whole partition commits or rolls back together
+        stats = bulk_insert(connection, rows(), batch_size=batch_size, commit_every=None,
+                            method=upsert_method(), update_columns=EMPLOYEE_UPDATE_COLUMNS)
+    return partition, stats['rows'], stats['seconds']
+
+
+def parallel_load(json_file, workers=LOAD_WORKERS, scheme='hash', partitions=None,
+                  range_size=RANGE_SIZE, max_retries=PARTITION_RETRIES,
+                  batch_size=DEFAULT_BATCH_SIZE, use_threads=False):
+    """
+    Load a JSON/NDJSON feed over several connections at once.
+
+    The feed is split into partitions by source id (hash or id range), then
+    partitions are loaded concurrently by worker processes (or threads), each
+    with its own connection and one transaction per partition. A partition
+    that fails is rolled back and retried up to max_retries times without
+    touching the partitions that already committed. Rows are upserted, so a
+    retry never duplicates data.
+
+    Returns a dict with rows, partitions, failed_partitions, retries, seconds
+    and rows_per_sec.
+    """
+    if scheme not in PARTITION_SCHEMES:
+        raise ValueError(f"Unknown partition scheme '{scheme}', expected one of {PARTITION_SCHEMES}")
+    if scheme == 'hash' and not partitions:
+        # More partitions than workers keeps every worker busy and makes retries cheap
+        partitions = workers * 4
+
+    start = time.perf_counter()
+    spill_dir = tempfile.mkdtemp(prefix='employee-partitions-')
+    try:
+        log.info(f"Partitioning {json_file} by {scheme}...")
+        tasks = split_into_partitions(iter_employees(json_file), spill_dir, scheme, partitions, range_size)
+        log.info(f"Split into {len(tasks)} partitions in {time.perf_counter() - start:.3f}s")
+
+        if use_threads:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            # spawn: children must not inherit the parent's pooled MySQL sockets
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+        stats = {'rows': 0, 'partitions': len(tasks), 'failed_partitions': [], 'retries': 0}
+        attempts = {key: 0 for key in tasks}
+        with executor:
+            in_flight = {
+                executor.submit(load_partition, key, path, batch_size): key
+                for key, (path, _) in tasks.items()
+            }
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = in_flight.pop(future)
+                    try:
+                        _, rows, seconds = future.result()
+                    except mysql.connector.Error as e:
+                        attempts[key] += 1
+                        if attempts[key] <= max_retries:
+                            log.warning(f"Partition {key} failed ({e}); retrying ({attempts[key]}/{max_retries})")
+                            stats['retries'] += 1
+                            increment('partition_retries')
+                            in_flight[executor.submit(load_partition, key, tasks[key][0], batch_size)] = key
+                        else:
+                            log.error(f"Partition {key} failed after {max_retries} retries: {e}")
+                            stats['failed_partitions'].append(key)
+                            increment('partition_failures')
+                        continue
+                    stats['rows'] += rows
+                    # Worker processes keep their own registries, so the parent records partitions
+                    observe('partition_seconds', seconds)
+                    increment('partition_rows', rows)
+                    log.info(f"Partition {key}: {rows} rows in {seconds:.3f}s")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    if stats['rows']:
+        with get_connection() as connection:
+            # Partitions upsert independently, so recount the summary once at the end
+            rebuild_summary(connection)
+            bump_data_version(connection)
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    stats['batches'] = stats['partitions']
+    stats['commits'] = stats['partitions'] - len(stats['failed_partitions'])
+    return stats
+
+
+def main():
+    """
+    Load employees over several connections in parallel
+    """
+    parser = argparse.ArgumentParser(description="Partitioned parallel load of employees into MySQL")
+    parser.add_argument('--json-file', default='employees.json', help="source file (envelope, NDJSON or gzip)")
+    parser.add_argument('--workers', type=int, default=LOAD_WORKERS)
+    parser.add_argument('--scheme', choices=PARTITION_SCHEMES, default='hash')
+    parser.add_argument('--partitions', type=int, help="hash partitions (default: 4 per worker)")
+    parser.add_argument('--range-size', type=int, default=RANGE_SIZE, help="source ids per range partition")
+    parser.add_argument('--retries', type=int, default=PARTITION_RETRIES)
+    parser.add_argument('--threads', action='store_true', help="use worker threads instead of processes")
+    parser.add_argument('--full-reload', action='store_true', help="clear the table before loading")
+    args = parser.parse_args()
+
+    if args.full_reload:
+        clear_employees_table()
+
+    try:
+        stats = parallel_load(args.json_file, args.workers, args.scheme, args.partitions,
+                              args.range_size, args.retries, use_threads=args.threads)
+    except mysql.connector.Error as e:
+        log.error(f"Parallel load failed: {e}")
+        return
+
+    log.info(f"\nParallel load: {format_insert_stats(stats)} across {args.workers} workers")
+    if stats['failed_partitions']:
+        log.error(f"Failed partitions: {sorted(stats['failed_partitions'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import argparse
+import time
+from decimal import Decimal
+
+from config import env
+from database_connection import get_connection
+from data_version import bump_data_version
+from instrumentation import get_logger
+from lazy_imports import lazy_import
+from payroll_summary import SummaryDelta, AGE_BAND_WIDTH
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Chunking and pacing of set-based updates (can be overridden in the environment)
+PAYROLL_CHUNK_SIZE = env('PAYROLL_CHUNK_SIZE', 10000, int)   # emp_id range covered by one UPDATE
+PAYROLL_THROTTLE = env('PAYROLL_THROTTLE', 0.05, float)      # seconds to pause between chunks
+
+# Largest value the DECIMAL(10, 2) monthly_salary column can hold
+MAX_MONTHLY_SALARY = Decimal('99999999.99')
+
+# Mirrors Employee.content_hash() so incremental sync sees the stored row as
+# it is after the update (whole salaries are rendered without decimals, like
+# the integer salaries the Python side hashes)
+ROW_HASH_SQL = (
+    "MD5(CONCAT_WS(CHAR(31), name, "
+    "IF(monthly_salary = FLOOR(monthly_salary), FLOOR(monthly_salary), monthly_salary), age))"
+)
+
+# Optional row filters: keyword -> SQL condition
+RANGE_FILTERS = {
+    'min_age': 'age >= %s',
+    'max_age': 'age <= %s',
+    'min_salary': 'monthly_salary >= %s',
+    'max_salary': 'monthly_salary <= %s',
+}
+
+
+def _factor(rate):
+    """1 + rate as an exact Decimal, so 0.10 multiplies by exactly 1.10"""
+    return Decimal(1) + Decimal(str(rate))
+
+
+def _range_conditions(filters):
+    """SQL conditions and parameters for the given range filters (None values are skipped)"""
+    conditions = []
+    params = []
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in RANGE_FILTERS:
+            raise ValueError(f"Unknown filter '{name}', expected one of {tuple(RANGE_FILTERS)}")
+        conditions.append(RANGE_FILTERS[name])
+        params.append(value)
+    return conditions, params
+
+
+def _print_progress(done_through, last_id, changed):
+    log.info(f"  up to emp_id {done_through} of {last_id}: {changed} rows changed")
+
+
+def _preview_salary_change(connection, new_salary, new_params, conditions, params):
+    """Aggregate effect of a salary change, computed on the server without writing anything"""
+    where = ' AND '.join(conditions) if conditions else '1 = 1'
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(monthly_salary), 0), COALESCE(SUM(new_salary), 0),
+               MAX(new_salary), COALESCE(SUM(new_salary > %s), 0)
+        FROM (
+            SELECT monthly_salary, ROUND({new_salary}, 2) AS new_salary
+            FROM employees WHERE {where}
+        ) AS preview
+    """, [MAX_MONTHLY_SALARY] + new_params + params)
+    rows, before, after, max_salary, overflow = cursor.fetchone()
+    cursor.close()
+    return {
+        'rows': rows,
+        'monthly_before': before,
+        'monthly_after': after,
+        'monthly_delta': after - before,
+        'yearly_delta': (after - before) * 12,
+        'max_new_salary': max_salary,
+        'overflow_rows': int(overflow),
+    }
+
+
+def _update_in_chunks(connection, assignments, params, conditions, condition_params,
+                      chunk_size, throttle, on_progress, resume_after, before_update=None):
+    """
+    Run one UPDATE per emp_id range, committing after each so locks are held
+    only briefly, with a pause of throttle seconds between chunks.
+    before_update(cursor, range_params), if given, runs in each chunk's
+    transaction just ahead of its UPDATE.
+    Returns (rows changed, chunks, last emp_id processed).
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT COALESCE(MIN(emp_id), 0), COALESCE(MAX(emp_id), 0) FROM employees")
+    first_id, last_id = cursor.fetchone()
+    start_after = max(first_id - 1, resume_after or 0)
+
+    where = ' AND '.join(['emp_id > %s', 'emp_id <= %s'] + conditions)
+    query = f"UPDATE employees SET {assignments} WHERE {where}"
+
+    changed = 0
+    chunks = 0
+    low = start_after
+    try:
+        while low < last_id:
+            high = min(low + chunk_size, last_id)
+            if before_update is not None:
+                before_update(cursor, [low, high] + condition_params)
+            cursor.execute(query, params + [low, high] + condition_params)
+            connection.commit()
+            changed += cursor.rowcount
+            chunks += 1
+            low = high
+            if on_progress is not None:
+                on_progress(high, last_id, changed)
+            if throttle and low < last_id:
+                time.sleep(throttle)
+    except mysql.connector.Error:
+        # Chunks up to low are committed; resume_after=low continues from here
+        log.warning(f"Payroll update stopped after emp_id {low}; rerun with resume_after={low} to continue")
+        raise
+    finally:
+        cursor.close()
+    return changed, chunks, low
+
+
+def apply_salary_change(new_salary, new_params=(), filters=None, chunk_size=PAYROLL_CHUNK_SIZE,
+                        throttle=PAYROLL_THROTTLE, dry_run=False, on_progress=_print_progress,
+                        resume_after=None):
+    """
+    Set monthly_salary to the SQL expression new_salary (rounded to cents) for
+    every employee matching filters, entirely on the server.
+
+    The table is walked in emp_id ranges of chunk_size, one committed UPDATE
+    per range. A run interrupted part way can be continued with resume_after
+    set to the last emp_id it reported. row_hash is refreshed in the same
+    statement, yearly_salary follows through its generated column, and the
+    payroll summary is adjusted in each chunk's transaction.
+
+    With dry_run nothing is written; a single aggregate query returns rows,
+    monthly_before, monthly_after, monthly_delta, yearly_delta,
+    max_new_salary and overflow_rows (rows that would exceed the column).
+    Otherwise returns rows, chunks, last_emp_id and seconds.
+    """
+    conditions, condition_params = _range_conditions(filters or {})
+    new_params = list(new_params)
+
+    with get_connection() as connection:
+        if dry_run:
+            return _preview_salary_change(connection, new_salary, new_params, conditions, condition_params)
+
+        # Salary deltas per age band, read before each chunk's UPDATE and
+        # committed with it, keep payroll_summary current (ages never change here)
+        where = ' AND '.join(['emp_id > %s', 'emp_id <= %s'] + conditions)
+        delta_query = (
+            f"SELECT FLOOR(age / %s) * %s, SUM(ROUND({new_salary}, 2) - monthly_salary) "
+            f"FROM employees WHERE {where} GROUP BY 1"
+        )
+
+        def record_delta(cursor, range_params):
+            cursor.execute(delta_query, [AGE_BAND_WIDTH, AGE_BAND_WIDTH] + new_params + range_params)
+            delta = SummaryDelta()
+            for band, total in cursor.fetchall():
+                delta.add_band(int(band), 0, total)
+            delta.apply(connection)
+
+        start = time.perf_counter()
+        assignments = f"monthly_salary = ROUND({new_salary}, 2), row_hash = {ROW_HASH_SQL}"
+        changed, chunks, last_emp_id = _update_in_chunks(
+            connection, assignments, new_params, conditions, condition_params,
+            chunk_size, throttle, on_progress, resume_after, before_update=record_delta
+        )
+        if changed:
+            bump_data_version(connection)
+        return {'rows': changed, 'chunks': chunks, 'last_emp_id': last_emp_id,
+                'seconds': time.perf_counter() - start}
+
+
+def give_raise(rate, min_age=None, max_age=None, min_salary=None, max_salary=None, **options):
+    """
+    Raise monthly salaries by rate (0.10 = 10%), the set-based counterpart of
+    Employee.promotion(). Range filters restrict who gets the raise; options
+    are passed to apply_salary_change (chunk_size, throttle, dry_run, ...).
+    """
+    filters = {'min_age': min_age, 'max_age': max_age, 'min_salary': min_salary, 'max_salary': max_salary}
+    return apply_salary_change('monthly_salary * %s', [_factor(rate)], filters, **options)
+
+
+def adjust_age_bands(bands, **options):
+    """
+    Apply a different rate to each age band in one pass. bands is a list of
+    (min_age, max_age, rate) with inclusive bounds; the first matching band
+    wins and employees outside every band are left untouched.
+    """
+    if not bands:
+        raise ValueError("At least one age band is required")
+    cases = []
+    params = []
+    for min_age, max_age, rate in bands:
+        cases.append("WHEN age BETWEEN %s AND %s THEN %s")
+        params.extend([min_age, max_age, _factor(rate)])
+    new_salary = f"monthly_salary * CASE {' '.join(cases)} ELSE 1 END"
+
+    # Restrict the walk to the ages the bands span; anyone in a gap between
+    # bands falls through to ELSE 1 and is left unchanged
+    lowest = min(band[0] for band in bands)
+    highest = max(band[1] for band in bands)
+    return apply_salary_change(new_salary, params, {'min_age': lowest, 'max_age': highest}, **options)
+
+
+def recompute_yearly_salary(chunk_size=PAYROLL_CHUNK_SIZE, throttle=PAYROLL_THROTTLE,
+                            dry_run=False, on_progress=_print_progress, resume_after=None):
+    """
+    Bring yearly_salary back in line with monthly_salary * 12.
+
+    Once migration 5 has made yearly_salary a generated column the server
+    maintains it and there is nothing to do; on older schemas the drifted rows
+    are fixed in chunks. Returns the same stats as apply_salary_change, or
+    {'rows': 0, 'generated': True} when the column is generated.
+    """
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT EXTRA FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'employees' AND COLUMN_NAME = 'yearly_salary'
+        """)
+        row = cursor.fetchone()
+        if row and 'generated' in row[0].lower():
+            cursor.close()
+            return {'rows': 0, 'generated': True}
+
+        drifted = 'yearly_salary <> monthly_salary * 12'
+        if dry_run:
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM(monthly_salary * 12 - yearly_salary), 0) "
+                           f"FROM employees WHERE {drifted}")
+            rows, delta = cursor.fetchone()
+            cursor.close()
+            return {'rows': rows, 'yearly_delta': delta}
+        cursor.close()
+
+        start = time.perf_counter()
+        changed, chunks, last_emp_id = _update_in_chunks(
+            connection, "yearly_salary = monthly_salary * 12", [], [drifted], [],
+            chunk_size, throttle, on_progress, resume_after
+        )
+        if changed:
+            bump_data_version(connection)
+        return {'rows': changed, 'chunks': chunks, 'last_emp_id': last_emp_id,
+                'seconds': time.perf_counter() - start}
+
+
+def _parse_band(text):
+    """'20:29:0.05' -> (20, 29, 0.05)"""
+    try:
+        min_age, max_age, rate = text.split(':')
+        return int(min_age), int(max_age), float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Band '{text}' must look like MIN_AGE:MAX_AGE:RATE")
+
+
+def main():
+    """
+    Run a payroll operation against the employees table from the command line
+    """
+    parser = argparse.ArgumentParser(description="Set-based payroll updates, chunked by emp_id range")
+    parser.add_argument('--dry-run', action='store_true', help="report the aggregate effect without writing")
+    parser.add_argument('--chunk-size', type=int, default=PAYROLL_CHUNK_SIZE)
+    parser.add_argument('--throttle', type=float, default=PAYROLL_THROTTLE, help="seconds between chunks")
+    parser.add_argument('--resume-after', type=int, help="continue an interrupted run after this emp_id")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    raise_parser = commands.add_parser('raise', help="raise salaries by a rate")
+    raise_parser.add_argument('rate', type=float, help="0.10 for a 10%% raise")
+    for name in RANGE_FILTERS:
+        raise_parser.add_argument('--' + name.replace('_', '-'), dest=name, type=int)
+
+    bands_parser = commands.add_parser('bands', help="apply a different rate per age band")
+    bands_parser.add_argument('bands', nargs='+', type=_parse_band, metavar='MIN_AGE:MAX_AGE:RATE')
+
+    commands.add_parser('yearly', help="recompute yearly_salary where it drifted")
+    args = parser.parse_args()
+
+    options = {'chunk_size': args.chunk_size, 'throttle': args.throttle,
+               'dry_run': args.dry_run, 'resume_after': args.resume_after}
+    try:
+        if args.command == 'raise':
+            result = give_raise(args.rate, args.min_age, args.max_age, args.min_salary, args.max_salary, **options)
+        elif args.command == 'bands':
+            result = adjust_age_bands(args.bands, **options)
+        else:
+            result = recompute_yearly_salary(**options)
+    except mysql.connector.Error as e:
+        log.error(f"Payroll operation failed: {e}")
+        return
+
+    if args.dry_run:
+        print("Dry run (nothing written):")
+        for key, value in result.items():
+            print(f"  {key}: {value}")
+        if result.get('overflow_rows'):
+            print(f"  WARNING: {result['overflow_rows']} salaries would exceed {MAX_MONTHLY_SALARY}")
+    elif result.get('generated'):
+        print("yearly_salary is a generated column; the server keeps it up to date")
+    else:
+        print(f"Updated {result['rows']} employees in {result['chunks']} chunks "
+              f"in {result['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
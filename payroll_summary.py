@@ -0,0 +1,228 @@
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+
+from config import env
+from database_connection import get_connection
+from instrumentation import get_logger
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Width of each age band in years: 20 covers ages 20-29 with the default of 10
+AGE_BAND_WIDTH = env('SUMMARY_AGE_BAND_WIDTH', 10, int)
+
+# Key of the row holding the company-wide totals
+GLOBAL_BAND = -1
+
+CENT = Decimal('0.01')
+
+SUMMARY_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS payroll_summary (
+    age_band INT PRIMARY KEY,
+    headcount BIGINT NOT NULL,
+    total_monthly DECIMAL(20, 2) NOT NULL
+)
+"""
+
+# Recount every band (and the global row) from the employees table
+_REBUILD_QUERIES = (
+    "DELETE FROM payroll_summary",
+    """
+    INSERT INTO payroll_summary (age_band, headcount, total_monthly)
+    SELECT FLOOR(age / %(width)s) * %(width)s, COUNT(*), SUM(monthly_salary)
+    FROM employees GROUP BY 1
+    """,
+    """
+    INSERT INTO payroll_summary (age_band, headcount, total_monthly)
+    SELECT %(global)s, COUNT(*), COALESCE(SUM(monthly_salary), 0) FROM employees
+    """,
+)
+
+
+def age_band(age, width=AGE_BAND_WIDTH):
+    """First age of the band an age falls into"""
+    return age // width * width
+
+
+class SummaryDelta:
+    """
+    Headcount and salary changes accumulated by a loader, per age band.
+
+    Loaders record every row they insert (add), delete (remove) or change
+    (remove the old values, add the new ones) and call apply() on the same
+    connection before committing, so the summary moves in the same
+    transaction as the rows it describes.
+    """
+    def __init__(self, width=AGE_BAND_WIDTH):
+        self.width = width
+        self.bands = {}
+
+    def add_band(self, band, headcount, total_monthly):
+        entry = self.bands.setdefault(band, [0, Decimal(0)])
+        entry[0] += headcount
+        entry[1] += total_monthly
+
+    def add(self, age, monthly_salary, count=1):
+        # Rounded as the DECIMAL(10, 2) column stores it
+        salary = Decimal(str(monthly_salary)).quantize(CENT, ROUND_HALF_UP)
+        self.add_band(age_band(age, self.width), count, count * salary)
+
+    def remove(self, age, monthly_salary):
+        self.add(age, monthly_salary, -1)
+
+    def __bool__(self):
+        return any(headcount or total for headcount, total in self.bands.values())
+
+    def apply(self, connection):
+        """
+        Add the accumulated deltas to payroll_summary (without committing)
+        and start again from zero
+        """
+        if not self:
+            self.bands.clear()
+            return
+        rows = [(band, headcount, total) for band, (headcount, total) in self.bands.items()]
+        rows.append((GLOBAL_BAND, sum(row[1] for row in rows), sum(row[2] for row in rows)))
+
+        placeholders = ', '.join(['(%s, %s, %s)'] * len(rows))
+        cursor = connection.cursor()
+        cursor.execute(
+            f"INSERT INTO payroll_summary (age_band, headcount, total_monthly) VALUES {placeholders} "
+            "AS new ON DUPLICATE KEY UPDATE headcount = headcount + new.headcount, "
+            "total_monthly = total_monthly + new.total_monthly",
+            [value for row in rows for value in row]
+        )
+        cursor.close()
+        self.bands.clear()
+
+
+def reset_summary(cursor):
+    """Zero the summary (for use in the same transaction that empties employees)"""
+    cursor.execute("DELETE FROM payroll_summary")
+
+
+def recount_summary(cursor, width=AGE_BAND_WIDTH):
+    """
+    Replace payroll_summary with a fresh aggregate of the employees table
+    (one scan), leaving the commit to the caller
+    """
+    for query in _REBUILD_QUERIES:
+        cursor.execute(query, {'width': width, 'global': GLOBAL_BAND})
+
+
+def rebuild_summary(connection, width=AGE_BAND_WIDTH):
+    """
+    Recompute payroll_summary from scratch in a single transaction
+    """
+    cursor = connection.cursor()
+    cursor.execute(SUMMARY_TABLE_QUERY)
+    recount_summary(cursor, width)
+    connection.commit()
+    cursor.close()
+
+
+def _band_row(band, headcount, total_monthly, width):
+    total_monthly = Decimal(total_monthly)
+    row = {
+        'headcount': headcount,
+        'total_monthly': total_monthly,
+        'total_yearly': total_monthly * 12,
+        'avg_monthly': (total_monthly / headcount).quantize(CENT) if headcount else None,
+        'avg_yearly': (total_monthly * 12 / headcount).quantize(CENT) if headcount else None,
+    }
+    if band != GLOBAL_BAND:
+        row = {'age_from': band, 'age_to': band + width - 1, **row}
+    return row
+
+
+def read_summary(connection, width=AGE_BAND_WIDTH):
+    """
+    Dashboard figures straight from payroll_summary (one row per band, never
+    a scan of employees): {'all': {...}, 'bands': [{...}, ...]} with
+    headcount, total and average monthly and yearly salary
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT age_band, headcount, total_monthly FROM payroll_summary ORDER BY age_band")
+    rows = cursor.fetchall()
+    cursor.close()
+
+    summary = {'all': _band_row(GLOBAL_BAND, 0, 0, width), 'bands': []}
+    for band, headcount, total_monthly in rows:
+        if band == GLOBAL_BAND:
+            summary['all'] = _band_row(band, headcount, total_monthly, width)
+        elif headcount:
+            summary['bands'].append(_band_row(band, headcount, total_monthly, width))
+    return summary
+
+
+def check_summary(connection, width=AGE_BAND_WIDTH):
+    """
+    Compare payroll_summary with a fresh aggregate of the employees table.
+    Returns a list of (age_band, stored (headcount, total), actual (headcount, total))
+    for every band that disagrees; an empty list means the summary is consistent.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT age_band, headcount, total_monthly FROM payroll_summary")
+    stored = {band: (headcount, total) for band, headcount, total in cursor.fetchall() if headcount or total}
+    cursor.execute(
+        "SELECT FLOOR(age / %s) * %s, COUNT(*), SUM(monthly_salary) FROM employees GROUP BY 1",
+        (width, width)
+    )
+    actual = {int(band): (headcount, total) for band, headcount, total in cursor.fetchall()}
+    cursor.close()
+    if actual:
+        actual[GLOBAL_BAND] = (sum(v[0] for v in actual.values()), sum(v[1] for v in actual.values()))
+
+    zero = (0, Decimal(0))
+    return [
+        (band, stored.get(band, zero), actual.get(band, zero))
+        for band in sorted(set(stored) | set(actual))
+        if stored.get(band, zero) != actual.get(band, zero)
+    ]
+
+
+def main():
+    """
+    Show the payroll dashboard, or rebuild / check the summary table
+    """
+    parser = argparse.ArgumentParser(description="Payroll summary by age band")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--rebuild', action='store_true', help="recompute the summary from the employees table")
+    group.add_argument('--check', action='store_true', help="compare the summary with the employees table")
+    args = parser.parse_args()
+
+    try:
+        with get_connection(read_only=not args.rebuild) as connection:
+            if args.rebuild:
+                rebuild_summary(connection)
+                log.info("Rebuilt payroll_summary")
+            elif args.check:
+                mismatches = check_summary(connection)
+                if not mismatches:
+                    print("payroll_summary is consistent with the employees table")
+                    return True
+                for band, stored, actual in mismatches:
+                    label = 'all' if band == GLOBAL_BAND else f"{band}-{band + AGE_BAND_WIDTH - 1}"
+                    print(f"  {label}: stored {stored[0]} / {stored[1]}, actual {actual[0]} / {actual[1]}")
+                print(f"{len(mismatches)} band(s) out of date; run with --rebuild")
+                return False
+            summary = read_summary(connection)
+    except mysql.connector.Error as e:
+        log.error(f"Error reading payroll summary: {e}")
+        return False
+
+    if args.rebuild:
+        return True
+    print(f"{'ages':<10} {'headcount':>10} {'total monthly':>16} {'avg monthly':>14} {'avg yearly':>14}")
+    for row in summary['bands']:
+        print(f"{row['age_from']:>3}-{row['age_to']:<6} {row['headcount']:>10} {row['total_monthly']:>16} "
+              f"{row['avg_monthly']:>14} {row['avg_yearly']:>14}")
+    total = summary['all']
+    print(f"{'all':<10} {total['headcount']:>10} {total['total_monthly']:>16} "
+          f"{total['avg_monthly'] or '-':>14} {total['avg_yearly'] or '-':>14}")
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import argparse
+import queue
+import threading
+import time
+from itertools import chain, islice
+
+from bulk_insert import bulk_insert, employee_rows, upsert_method, DEFAULT_BATCH_SIZE, EMPLOYEE_UPDATE_COLUMNS
+from database_connection import get_connection
+from data_version import bump_data_version
+from employee_objects import employee_from_record, iter_employee_records
+from fetch_employees import PageFetcher, EnvelopeWriter, API_URL, FETCH_WORKERS
+from http_cache import ResponseCache
+from insert_employees_with_class import clear_employees_table, sync_employees_to_db
+from payroll_summary import rebuild_summary
+from config import env
+from instrumentation import get_logger
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+requests = lazy_import('requests')
+log = get_logger(__name__)
+
+# Stage sizing (can be overridden in the environment)
+PIPELINE_QUEUE_SIZE = env('PIPELINE_QUEUE_SIZE', 8, int)     # batches buffered between stages
+PARSE_WORKERS = env('PIPELINE_PARSE_WORKERS', 2, int)
+LOAD_WORKERS = env('PIPELINE_LOAD_WORKERS', 2, int)
+
+# How often blocked stages wake up to check for cancellation
+POLL_INTERVAL = 0.1
+
+LOAD_MODES = ('sync', 'reload')
+
+_DONE = object()
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when the pipeline is being shut down"""
+
+
+class Pipeline:
+    """
+    Fetch -> parse -> load runner with the stages connected by bounded queues.
+
+    The source stage (the concurrent API fetcher, or a streamed JSON/NDJSON
+    file) pushes pages of raw records, parse workers turn them into Employee
+    batches, and load workers write the batches to MySQL, so all three stages
+    run at once. A full queue blocks the stage feeding it (backpressure), and
+    cancel() or a failure in any stage stops every stage promptly.
+
+    In 'sync' mode a single loader runs the incremental sync (which needs one
+    connection for its bookkeeping); in 'reload' mode the table is cleared
+    just before the first page is passed on and load_workers connections
+    upsert batches in parallel.
+
+    With the response cache, pages are held back while they all match the
+    last fetch. If the whole fetch turns out not modified, nothing is parsed,
+    cleared or loaded (stats['not_modified'] is True); the first changed page
+    releases the held pages, read back from the cache.
+    """
+    def __init__(self, source_file=None, url=API_URL, json_file=None, mode='sync',
+                 fetch_workers=FETCH_WORKERS, parse_workers=PARSE_WORKERS,
+                 load_workers=LOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, use_cache=True):
+        if mode not in LOAD_MODES:
+            raise ValueError(f"Unknown load mode '{mode}', expected one of {LOAD_MODES}")
+        self.source_file = source_file
+        self.url = url
+        self.json_file = json_file
+        self.mode = mode
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.load_workers = 1 if mode == 'sync' else load_workers
+        self.batch_size = batch_size
+        self.use_cache = use_cache
+
+        self.records_queue = queue.Queue(maxsize=queue_size)
+        self.employees_queue = queue.Queue(maxsize=queue_size)
+        self.cancelled = threading.Event()
+        self.errors = []
+        self.stats = {'pages': 0, 'records': 0, 'employees': 0, 'rows_loaded': 0,
+                      'sync': None, 'fetch': None, 'not_modified': False}
+        self._load_started = False
+        self._stats_lock = threading.Lock()
+        self._stage_time = {}
+
+    def cancel(self):
+        """Ask every stage to stop as soon as possible"""
+        self.cancelled.set()
+
+    def _count(self, key, amount):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _put(self, target, item):
+        """Blocking put that gives up when the pipeline is cancelled"""
+        while True:
+            if self.cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                target.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, source):
+        """Blocking get that gives up when the pipeline is cancelled"""
+        while True:
+            if self.cancelled.is_set():
+                raise PipelineCancelled()
+            try:
+                return source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _stage(self, name, func):
+        """Run one stage body, recording its time and turning failures into a cancel"""
+        start = time.perf_counter()
+        try:
+            func()
+        except PipelineCancelled:
+            pass
+        except BaseException as e:
+            self.errors.append((name, e))
+            self.cancel()
+        finally:
+            with self._stats_lock:
+                self._stage_time[name] = max(self._stage_time.get(name, 0.0), time.perf_counter() - start)
+
+    # Stages
+
+    def _start_load(self):
+        """Clear the table before the first page of a reload goes downstream"""
+        if not self._load_started:
+            self._load_started = True
+            if self.mode == 'reload':
+                clear_employees_table()
+
+    def _release(self, records):
+        self._start_load()
+        self._put(self.records_queue, records)
+
+    def _source(self):
+        writer = EnvelopeWriter(self.json_file) if self.json_file else None
+        fetcher = None
+        held = []  # Unchanged pages not passed on yet; their bodies stay in the cache
+
+        def release_held():
+            for page in held:
+                self._release(fetcher.cached_page(page).get('data', []))
+            held.clear()
+
+        def on_page(page, records):
+            self._count('pages', 1)
+            self._count('records', len(records))
+            if writer is not None:
+                writer.write_page(page, records)
+            if fetcher is not None and fetcher.cache is not None and not fetcher.stats['changed_pages']:
+                held.append(page)
+                return
+            release_held()
+            self._release(records)
+
+        try:
+            if self.source_file:
+                records = iter_employee_records(self.source_file)
+                page = 0
+                while True:
+                    chunk = list(islice(records, self.batch_size))
+                    if not chunk:
+                        break
+                    page += 1
+                    on_page(page, chunk)
+            else:
+                fetcher = PageFetcher(url=self.url, workers=self.fetch_workers,
+                                      cache=ResponseCache() if self.use_cache else None)
+                try:
+                    self.stats['fetch'] = fetcher.fetch_all(on_page)
+                    if self.stats['fetch']['not_modified']:
+                        self.stats['not_modified'] = True
+                        log.info(f"Employee data unchanged upstream ({len(held)} cached pages); nothing to load")
+                    else:
+                        release_held()
+                finally:
+                    fetcher.close()
+            if not self.stats['not_modified']:
+                # An empty feed still empties the table in reload mode
+                self._start_load()
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            writer.close()
+
+    def _parse(self):
+        while True:
+            records = self._get(self.records_queue)
+            if records is _DONE:
+                return
+            employees = [employee_from_record(record) for record in records]
+            self._count('employees', len(employees))
+            self._put(self.employees_queue, employees)
+
+    def _iter_loaded_employees(self):
+        """Employees from the parse stage, for the single sync loader"""
+        while True:
+            batch = self._get(self.employees_queue)
+            if batch is _DONE:
+                return
+            self._count('rows_loaded', len(batch))
+            yield from batch
+
+    def _load_sync(self):
+        employees = self._iter_loaded_employees()
+        # Wait for the first employee so an unchanged feed never opens a sync
+        first = next(employees, None)
+        if first is None and self.stats['not_modified']:
+            return
+        employees = chain([] if first is None else [first], employees)
+        counts = sync_employees_to_db(employees, batch_size=self.batch_size)
+        if counts is None:
+            raise RuntimeError("Incremental sync failed")
+        self.stats['sync'] = counts
+
+    def _load_batches(self):
+        with get_connection() as connection:
+            while True:
+                batch = self._get(self.employees_queue)
+                if batch is _DONE:
+                    break
+                # Upsert so ids repeated in the feed do not trip the unique key
+                stats = bulk_insert(connection, employee_rows(batch), batch_size=self.batch_size,
+                                    method=upsert_method(), update_columns=EMPLOYEE_UPDATE_COLUMNS)
+                self._count('rows_loaded', stats['rows'])
+
+    def _refresh_summary(self):
+        """Recount the summary once every reload loader has finished"""
+        # Upserts do not know the values they replaced, so recount
+        with get_connection() as connection:
+            rebuild_summary(connection)
+            bump_data_version(connection)
+
+    # Orchestration
+
+    def _start(self, name, func):
+        thread = threading.Thread(target=self._stage, args=(name, func), name=f"pipeline-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def _finish(self, threads, target, count):
+        """Wait for a stage's threads, then tell the next stage it has everything"""
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(POLL_INTERVAL)
+        if not self.cancelled.is_set():
+            for _ in range(count):
+                self._put(target, _DONE)
+
+    def _run(self):
+        load_stage = self._load_sync if self.mode == 'sync' else self._load_batches
+        source = self._start('source', self._source)
+        parsers = [self._start('parse', self._parse) for _ in range(self.parse_workers)]
+        loaders = [self._start('load', load_stage) for _ in range(self.load_workers)]
+
+        self._finish([source], self.records_queue, self.parse_workers)
+        self._finish(parsers, self.employees_queue, self.load_workers)
+        for thread in loaders:
+            while thread.is_alive():
+                thread.join(POLL_INTERVAL)
+        if self.mode == 'reload' and self._load_started and not self.cancelled.is_set():
+            self._stage('summary', self._refresh_summary)
+
+    def run(self):
+        """
+        Run the pipeline to completion. Returns the stats dict, or None if a
+        stage failed or the run was cancelled.
+        """
+        start = time.perf_counter()
+        try:
+            self._run()
+        except (KeyboardInterrupt, PipelineCancelled):
+            self.cancel()
+            log.warning("\nPipeline cancelled")
+            return None
+
+        self.stats['seconds'] = time.perf_counter() - start
+        self.stats['stage_seconds'] = dict(self._stage_time)
+
+        if self.errors:
+            for stage, error in self.errors:
+                log.error(f"Pipeline stage '{stage}' failed: {error}")
+            return None
+        if self.cancelled.is_set():
+            log.warning("Pipeline cancelled")
+            return None
+        return self.stats
+
+
+def main():
+    """
+    Run fetch, parse and load as one overlapped pipeline
+    """
+    parser = argparse.ArgumentParser(description="Fetch employees and load them into MySQL in one pipeline")
+    parser.add_argument('--from-file', metavar='PATH',
+                        help="stream an existing JSON/NDJSON(.gz) file instead of calling the API")
+    parser.add_argument('--write-json', metavar='PATH',
+                        help="also save fetched records to this file (skipped by default)")
+    parser.add_argument('--mode', choices=LOAD_MODES, default='sync',
+                        help="sync: incremental upsert + delete; reload: clear the table and insert in parallel")
+    parser.add_argument('--fetch-workers', type=int, default=FETCH_WORKERS)
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS)
+    parser.add_argument('--load-workers', type=int, default=LOAD_WORKERS)
+    parser.add_argument('--queue-size', type=int, default=PIPELINE_QUEUE_SIZE)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    pipeline = Pipeline(source_file=args.from_file, json_file=args.write_json, mode=args.mode,
+                        fetch_workers=args.fetch_workers, parse_workers=args.parse_workers,
+                        load_workers=args.load_workers, queue_size=args.queue_size,
+                        batch_size=args.batch_size)
+    try:
+        stats = pipeline.run()
+    except (requests.exceptions.RequestException, mysql.connector.Error) as e:
+        log.error(f"Pipeline failed: {e}")
+        return
+
+    if stats is None:
+        log.error("\nPipeline did not complete")
+        return
+    if stats['not_modified']:
+        log.info(f"\nPipeline finished in {stats['seconds']:.3f}s: upstream data unchanged, table left as is")
+        return
+
+    log.info(f"\nPipeline finished in {stats['seconds']:.3f}s: {stats['pages']} pages, "
+             f"{stats['employees']} employees parsed, {stats['rows_loaded']} rows loaded")
+    for stage, seconds in stats['stage_seconds'].items():
+        log.info(f"  {stage}: {seconds:.3f}s")
+    if stats['sync']:
+        counts = stats['sync']
+        log.info(f"Sync: {counts['inserted']} inserted, {counts['updated']} updated, "
+                 f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+
+
+if __name__ == "__main__":
+    main()
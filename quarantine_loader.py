@@ -0,0 +1,232 @@
+import argparse
+import json
+import time
+
+from bulk_insert import (
+    bulk_insert, iter_batches, upsert_method, DEFAULT_BATCH_SIZE, DEFAULT_METHOD, EMPLOYEE_UPDATE_COLUMNS
+)
+from database_connection import get_connection
+from data_version import bump_data_version
+from employee_objects import employee_from_record, iter_employee_records
+from insert_employees_with_class import clear_employees_table
+from payroll_summary import rebuild_summary
+from config import env
+from instrumentation import get_logger, increment
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+QUARANTINE_FILE = env('QUARANTINE_FILE', 'quarantine.ndjson')
+
+# Limits of the employees table columns (see update_table_structure.py)
+MAX_NAME_LENGTH = 255
+MAX_SOURCE_ID = 2 ** 31 - 1            # INT
+MAX_MONTHLY_SALARY = 99999999          # DECIMAL(10, 2)
+MAX_YEARLY_SALARY = 9999999999         # DECIMAL(12, 2) generated column
+AGE_RANGE = (0, 150)
+
+REQUIRED_FIELDS = ('id', 'employee_name', 'employee_salary', 'employee_age')
+
+
+def _row_errors():
+    """
+    Errors caused by the values in a batch rather than by the server or the
+    connection. Only these are worth bisecting; anything else is re-raised.
+    (A function so the driver is not loaded just to build the tuple.)
+    """
+    return (mysql.connector.errors.DataError, mysql.connector.errors.IntegrityError)
+
+
+def _as_int(value, field):
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be an integer, got {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer, got {value!r}")
+
+
+def validate_record(record):
+    """
+    Check one raw feed record against what Employee and the employees table accept.
+    Returns None if the record is valid, otherwise the reason it is not.
+    """
+    if not isinstance(record, dict):
+        return f"record is a {type(record).__name__}, not an object"
+    missing = [field for field in REQUIRED_FIELDS if field not in record]
+    if missing:
+        return f"missing field(s): {', '.join(missing)}"
+
+    try:
+        source_id = _as_int(record['id'], 'id')
+        salary = _as_int(record['employee_salary'], 'employee_salary')
+        age = _as_int(record['employee_age'], 'employee_age')
+    except ValueError as e:
+        return str(e)
+
+    name = record['employee_name']
+    if not isinstance(name, str) or not name.strip():
+        return "employee_name must be a non-empty string"
+    if len(name) > MAX_NAME_LENGTH:
+        return f"employee_name is longer than {MAX_NAME_LENGTH} characters"
+    if not 0 < source_id <= MAX_SOURCE_ID:
+        return f"id {source_id} is out of range"
+    if not 0 <= salary <= MAX_MONTHLY_SALARY or salary * 12 > MAX_YEARLY_SALARY:
+        return f"employee_salary {salary} is out of range"
+    if not AGE_RANGE[0] <= age <= AGE_RANGE[1]:
+        return f"employee_age {age} is out of range"
+    return None
+
+
+class QuarantineWriter:
+    """
+    Appends rejected records to an NDJSON file, one object per line with the
+    original record, the stage that rejected it and the reason. The file is
+    only created once the first record is rejected.
+    """
+    def __init__(self, path=QUARANTINE_FILE):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def write(self, record, stage, reason):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        entry = {'stage': stage, 'reason': reason, 'record': record}
+        self._file.write(json.dumps(entry, default=str))
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _valid_rows(records, quarantine, stats):
+    """
+    Validation pre-pass: yield (record, row) pairs for valid records and send
+    the rest straight to quarantine, so bad input never reaches the server
+    """
+    for record in records:
+        stats['records'] += 1
+        reason = validate_record(record)
+        if reason is not None:
+            stats['invalid'] += 1
+            increment('quarantine_invalid')
+            quarantine.write(record, 'validation', reason)
+            continue
+        emp = employee_from_record(record)
+        yield record, (emp.id, emp.name, emp.salary, emp.age, emp.content_hash())
+
+
+def _load_isolating(connection, pairs, quarantine, stats, update_columns):
+    """
+    Load one batch of (record, row) pairs in its own transaction. If the
+    server rejects the batch because of its data, roll back, split it in half
+    and retry each half, until the offending rows are isolated one at a time
+    and quarantined. Every other row of the batch is still committed.
+    """
+    # An upsert cannot use load_data; pick a method up front so only data errors bisect
+    method = upsert_method() if update_columns else DEFAULT_METHOD
+    try:
+        bulk_insert(connection, [row for _, row in pairs], batch_size=len(pairs),
+                    commit_every=None, method=method, update_columns=update_columns)
+        stats['rows'] += len(pairs)
+        stats['commits'] += 1
+        return
+    except _row_errors() as e:
+        connection.rollback()
+        if len(pairs) == 1:
+            stats['rejected'] += 1
+            increment('quarantine_rejected')
+            quarantine.write(pairs[0][0], 'database', f"{e.errno}: {e.msg}")
+            return
+
+    stats['bisections'] += 1
+    increment('quarantine_bisections')
+    middle = len(pairs) // 2
+    _load_isolating(connection, pairs[:middle], quarantine, stats, update_columns)
+    _load_isolating(connection, pairs[middle:], quarantine, stats, update_columns)
+
+
+def load_with_quarantine(records, quarantine=None, batch_size=DEFAULT_BATCH_SIZE,
+                         update_columns=EMPLOYEE_UPDATE_COLUMNS):
+    """
+    Load raw feed records, isolating bad rows instead of aborting the load.
+
+    Records are validated on the way in and invalid ones are written to
+    quarantine (a QuarantineWriter; one on QUARANTINE_FILE by default).
+    Valid rows are upserted batch_size at a time, one transaction per batch;
+    a batch the server rejects is bisected until the rows causing the error
+    are found, and only those are quarantined. The payroll summary is
+    recounted once at the end.
+    Connection and server errors are not bisected and propagate to the caller.
+
+    Returns a dict with records, rows, invalid, rejected, bisections,
+    batches, commits, seconds and rows_per_sec.
+    """
+    stats = {'records': 0, 'rows': 0, 'invalid': 0, 'rejected': 0,
+             'bisections': 0, 'batches': 0, 'commits': 0}
+    owns_quarantine = quarantine is None
+    if owns_quarantine:
+        quarantine = QuarantineWriter()
+    start = time.perf_counter()
+    try:
+        with get_connection() as connection:
+            for pairs in iter_batches(_valid_rows(records, quarantine, stats), batch_size):
+                stats['batches'] += 1
+                _load_isolating(connection, pairs, quarantine, stats, update_columns)
+            if stats['rows']:
+                # Upserts do not know the values they replaced, so recount
+                rebuild_summary(connection)
+                bump_data_version(connection)
+    finally:
+        if owns_quarantine:
+            quarantine.close()
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    return stats
+
+
+def main():
+    """
+    Load a feed file, quarantining bad records instead of failing the whole load
+    """
+    parser = argparse.ArgumentParser(description="Load employees, quarantining records that cannot be stored")
+    parser.add_argument('--json-file', default='employees.json', help="source file (envelope, NDJSON or gzip)")
+    parser.add_argument('--quarantine-file', default=QUARANTINE_FILE)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--full-reload', action='store_true', help="clear the table before loading")
+    args = parser.parse_args()
+
+    quarantine = QuarantineWriter(args.quarantine_file)
+
+    def on_bad_line(line, error):
+        quarantine.write(line, 'parse', str(error))
+
+    if args.full_reload:
+        clear_employees_table()
+
+    try:
+        records = iter_employee_records(args.json_file, on_error=on_bad_line)
+        stats = load_with_quarantine(records, quarantine, args.batch_size)
+    except mysql.connector.Error as e:
+        log.error(f"Load failed: {e}")
+        return
+    finally:
+        quarantine.close()
+
+    unparseable = quarantine.count - stats['invalid'] - stats['rejected']
+    log.info(f"Loaded {stats['rows']} of {stats['records']} records in {stats['seconds']:.3f}s "
+             f"({stats['rows_per_sec']:,.0f} rows/sec)")
+    if quarantine.count:
+        log.warning(f"Quarantined {quarantine.count} records in {args.quarantine_file}: "
+                    f"{unparseable} unparseable, {stats['invalid']} invalid, "
+                    f"{stats['rejected']} rejected by the database ({stats['bisections']} bisections)")
+
+
+if __name__ == "__main__":
+    main()
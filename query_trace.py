@@ -0,0 +1,365 @@
+import atexit
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from config import env
+from instrumentation import Histogram, get_logger, increment
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Query tracing (can be overridden in .env)
+QUERY_TRACE = env('QUERY_TRACE', '0') == '1'            # wrap every pooled connection
+QUERY_SLOW_SECONDS = env('QUERY_SLOW_SECONDS', 0.5, float)  # statements this slow get an EXPLAIN
+QUERY_EXPLAIN = env('QUERY_EXPLAIN', '1') == '1'        # capture EXPLAIN for slow statements
+QUERY_TRACE_TOP = env('QUERY_TRACE_TOP', 10, int)       # fingerprints listed in the end-of-run report
+QUERY_TRACE_FILE = env('QUERY_TRACE_FILE')              # one JSON line appended per run (unset: not written)
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_COMMENT = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_NUMBER = re.compile(r"\b(?:0x[0-9a-f]+|\d+(?:\.\d+)?(?:e[+-]?\d+)?)\b", re.I)
+_SPACE = re.compile(r"\s+")
+_COMMA = re.compile(r" ?, ?")
+_IN_LIST = re.compile(r"\bin ?\(\?(?:, \?)*\)")
+_VALUES_LIST = re.compile(r"\bvalues ?\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(statement):
+    """
+    Normalised form of a SQL statement, identical for every execution of
+    the same query shape: literals and placeholders become ?, IN lists and
+    multi-row VALUES collapse to (?+), comments and whitespace are dropped
+    and the text is lower-cased.
+    """
+    text = _STRING.sub('?', statement)
+    text = _COMMENT.sub(' ', text)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _COMMA.sub(', ', _SPACE.sub(' ', text))
+    text = text.replace('( ', '(').replace(' )', ')').strip().lower()
+    text = _IN_LIST.sub('in (?+)', text)
+    return _VALUES_LIST.sub('values (?+)', text)
+
+
+class QueryStats:
+    """Everything recorded for one statement fingerprint"""
+    def __init__(self, statement):
+        self.sample = statement     # first statement seen with this fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.rows_returned = 0
+        self.rows_affected = 0
+        self.slow = 0
+        self.latency = Histogram()
+        self.explain = None         # EXPLAIN rows of the first slow execution
+        self.explain_seconds = None
+
+    def full_scan(self):
+        """True if the captured plan reads a whole table (access type ALL)"""
+        return bool(self.explain) and any(str(row.get('type', '')).upper() == 'ALL' for row in self.explain)
+
+    def summary(self):
+        latency = self.latency.summary()
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_seconds': latency['sum'],
+            'mean_ms': latency['mean'] * 1000 if latency['mean'] is not None else None,
+            'p99_ms': latency['p99'] * 1000 if latency['p99'] is not None else None,
+            'max_ms': latency['max'] * 1000 if latency['max'] is not None else None,
+            'rows_returned': self.rows_returned,
+            'rows_affected': self.rows_affected,
+            'slow': self.slow,
+            'full_scan': self.full_scan(),
+            'explain': self.explain,
+            'explain_seconds': self.explain_seconds,
+            'sample': self.sample[:500],
+        }
+
+
+class QueryTracer:
+    """
+    Thread-safe per-fingerprint registry of every statement run through a
+    TracedConnection: calls, latency distribution, rows returned/affected,
+    errors, and an EXPLAIN of the first execution slower than slow_seconds.
+    """
+    def __init__(self, slow_seconds=QUERY_SLOW_SECONDS, explain=QUERY_EXPLAIN):
+        self.slow_seconds = slow_seconds
+        self.explain = explain
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def record(self, statement, seconds, rows=-1, returned=False, error=False):
+        """
+        Count one execution. Returns True when it was slow and its fingerprint
+        has no plan yet, i.e. the caller should capture an EXPLAIN.
+        """
+        key = fingerprint(statement)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = QueryStats(statement)
+            stats.calls += 1
+            stats.latency.observe(seconds)
+            if error:
+                stats.errors += 1
+            elif rows >= 0:
+                if returned:
+                    stats.rows_returned += rows
+                else:
+                    stats.rows_affected += rows
+            slow = seconds >= self.slow_seconds
+            if slow:
+                stats.slow += 1
+        increment('queries')
+        if slow:
+            increment('slow_queries')
+            log.warning(f"Slow query ({seconds * 1000:.1f} ms): {key[:200]}")
+        return slow and self.explain and stats.explain is None and _explainable(key)
+
+    def capture_explain(self, connection, statement, params, seconds):
+        """Run EXPLAIN for a slow statement on the connection it ran on and keep the plan"""
+        try:
+            cursor = connection.cursor(buffered=True)
+            try:
+                cursor.execute(f"EXPLAIN {statement}", params)
+                columns = cursor.column_names
+                plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except mysql.connector.Error as e:
+            log.debug(f"Could not EXPLAIN slow query: {e}")
+            return
+        with self._lock:
+            stats = self.stats[fingerprint(statement)]
+            if stats.explain is None:
+                stats.explain = [{name: _plain(value) for name, value in row.items()} for row in plan]
+                stats.explain_seconds = seconds
+        if any(str(row.get('type', '')).upper() == 'ALL' for row in plan):
+            log.warning(f"Slow query does a full table scan: {fingerprint(statement)[:200]}")
+
+    def report(self, top=QUERY_TRACE_TOP, order='total_seconds'):
+        """
+        {'queries', 'seconds', 'fingerprints', 'top': [{fingerprint, ...summary}]}
+        with the top fingerprints by order ('total_seconds', 'calls', 'slow', ...)
+        """
+        with self._lock:
+            summaries = [{'fingerprint': key, **stats.summary()} for key, stats in self.stats.items()]
+        summaries.sort(key=lambda entry: entry[order] or 0, reverse=True)
+        return {
+            'queries': sum(entry['calls'] for entry in summaries),
+            'seconds': sum(entry['total_seconds'] for entry in summaries),
+            'fingerprints': len(summaries),
+            'top': summaries[:top],
+        }
+
+
+def _explainable(key):
+    """Statements EXPLAIN accepts without running them (INSERT only in its INSERT ... SELECT form)"""
+    if key.startswith(('select', 'update', 'delete', 'with')):
+        return True
+    return key.startswith(('insert', 'replace')) and ' select ' in key and ' values ' not in key
+
+
+def _plain(value):
+    """EXPLAIN values as JSON-friendly types (the driver returns bytes for some columns)"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+
+# The process-wide tracer every TracedConnection records into
+TRACER = QueryTracer()
+
+
+class TracedCursor:
+    """
+    Cursor wrapper timing each statement from execute() until its result is
+    complete: immediately for writes and buffered reads, when the rows have
+    been fetched (or the cursor is closed) for unbuffered reads, so a
+    streamed SELECT is charged for its whole transfer.
+    """
+    def __init__(self, cursor, connection, tracer):
+        self._cursor = cursor
+        self._connection = connection
+        self._tracer = tracer
+        self._pending = None    # [statement, params, seconds so far] of an unfinished read
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        statement, params, seconds = pending
+        returned = bool(getattr(self._cursor, 'with_rows', False))
+        if self._tracer.record(statement, seconds, self._cursor.rowcount, returned) \
+                and not getattr(self._connection, 'unread_result', False):
+            self._tracer.capture_explain(self._connection, statement, params, seconds)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = self._cursor.execute(operation, params, *args, **kwargs)
+        except BaseException:
+            self._tracer.record(operation, time.perf_counter() - start, error=True)
+            raise
+        self._pending = [operation, params, time.perf_counter() - start]
+        if not getattr(self._connection, 'unread_result', False):
+            self._finish()
+        return result
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        except BaseException:
+            self._tracer.record(operation, time.perf_counter() - start, error=True)
+            raise
+        # A batch insert has no single plan to EXPLAIN
+        self._tracer.record(operation, time.perf_counter() - start, self._cursor.rowcount)
+        return result
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        try:
+            result = method(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+        if self._pending is not None and not getattr(self._connection, 'unread_result', False):
+            self._finish()
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """
+    Connection proxy whose cursors are TracedCursors; commits and rollbacks
+    are recorded as statements too, since each one is a server round trip.
+    Everything else is passed through to the driver's connection.
+    """
+    def __init__(self, connection, tracer=TRACER):
+        self._connection = connection
+        self._tracer = tracer
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._connection.cursor(*args, **kwargs), self._connection, self._tracer)
+
+    def _timed(self, statement, method):
+        start = time.perf_counter()
+        try:
+            method()
+        except BaseException:
+            self._tracer.record(statement, time.perf_counter() - start, error=True)
+            raise
+        self._tracer.record(statement, time.perf_counter() - start)
+
+    def commit(self):
+        self._timed('COMMIT', self._connection.commit)
+
+    def rollback(self):
+        self._timed('ROLLBACK', self._connection.rollback)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def trace_connection(connection):
+    """Wrap a driver connection when QUERY_TRACE is on, otherwise return it unchanged"""
+    return TracedConnection(connection) if QUERY_TRACE else connection
+
+
+def format_report(report):
+    """The report as text lines: one per fingerprint, with calls, time, rows and plan flags"""
+    lines = [f"{report['queries']} queries, {report['fingerprints']} distinct statements, "
+             f"{report['seconds']:.3f}s in the database",
+             f"{'total s':>9} {'calls':>8} {'mean ms':>9} {'p99 ms':>9} {'rows':>10}  statement"]
+    for entry in report['top']:
+        rows = entry['rows_returned'] + entry['rows_affected']
+        flags = []
+        if entry['slow']:
+            flags.append(f"{entry['slow']} slow")
+        if entry['full_scan']:
+            flags.append("FULL SCAN")
+        if entry['errors']:
+            flags.append(f"{entry['errors']} errors")
+        suffix = f"  [{', '.join(flags)}]" if flags else ''
+        lines.append(f"{entry['total_seconds']:>9.3f} {entry['calls']:>8} {entry['mean_ms']:>9.2f} "
+                     f"{entry['p99_ms']:>9.2f} {rows:>10}  {entry['fingerprint'][:120]}{suffix}")
+    return lines
+
+
+def report_queries(top=QUERY_TRACE_TOP, trace_file=None):
+    """
+    Log the top fingerprints by total time and by call count (round-trip
+    storms), and append the full report to QUERY_TRACE_FILE if set
+    """
+    by_time = TRACER.report(top)
+    if not by_time['queries']:
+        return
+    log.info(f"Top {top} statements by total time:")
+    for line in format_report(by_time):
+        log.info(line)
+    log.info(f"Top {top} statements by calls:")
+    for line in format_report(TRACER.report(top, order='calls'))[2:]:
+        log.info(line)
+
+    trace_file = trace_file or QUERY_TRACE_FILE
+    if trace_file:
+        record = {'script': os.path.basename(sys.argv[0]) or None, 'time': time.time(),
+                  **TRACER.report(len(TRACER.stats))}
+        try:
+            with open(trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            log.warning(f"Could not write query trace: {e}")
+
+
+def _report_at_exit():
+    # Worker processes (parallel_loader.py) report nothing of their own
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        report_queries()
+
+
+if QUERY_TRACE:
+    atexit.register(_report_at_exit)
@@ -0,0 +1,425 @@
+import argparse
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk_insert import employee_rows, format_insert_stats, DEFAULT_BATCH_SIZE
+from config import env
+from employee_objects import iter_employees
+from instrumentation import get_logger, increment
+from storage_backend import get_backend, MAX_SOURCE_ID
+
+log = get_logger(__name__)
+
+# Sharding settings (can be overridden in .env)
+SHARD_MAP_FILE = env('SHARD_MAP_FILE', 'shard_map.json')
+SHARD_VNODES = env('SHARD_VNODES', 64, int)                 # ring points per shard (hash scheme)
+SHARD_RANGE_SIZE = env('SHARD_RANGE_SIZE', 1000000, int)    # default source ids per shard (range scheme)
+SHARD_QUEUE_BATCHES = 4     # batches buffered per shard before the router waits for it
+
+SHARD_SCHEMES = ('range', 'hash')
+
+
+def shard_backend(spec):
+    """
+    Storage backend for a shard spec: 'sqlite:<path>' for an SQLite file or
+    'mysql:<database>' for a database on the configured MySQL server
+    """
+    name, _, target = spec.partition(':')
+    if name == 'sqlite':
+        return get_backend('sqlite', path=target or f"{spec}.db")
+    if name == 'mysql':
+        return get_backend('mysql', database=target or None)
+    raise ValueError(f"Unknown shard '{spec}', expected sqlite:<path> or mysql:<database>")
+
+
+def _hash(key):
+    """Stable 64-bit hash (Python's hash() of a str changes between processes)"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class RangeRouter:
+    """
+    Routes source ids by a range map: ranges is a list of (start, shard)
+    pairs, each shard owning the ids from its start up to the next start
+    """
+    scheme = 'range'
+
+    def __init__(self, ranges):
+        self.ranges = sorted((int(start), int(shard)) for start, shard in ranges)
+        self._starts = [start for start, _ in self.ranges]
+
+    def shard_for(self, source_id):
+        return self.ranges[max(bisect.bisect_right(self._starts, source_id) - 1, 0)][1]
+
+    def moved(self, low, high, shard):
+        """A new router with [low, high) assigned to shard"""
+        ranges = [(start, owner) for start, owner in self.ranges if not low <= start <= high]
+        ranges.append((low, shard))
+        if high < MAX_SOURCE_ID:
+            # Ids from high on keep the owner they had
+            ranges.append((high, self.shard_for(high)))
+        merged = []
+        for start, owner in sorted(ranges):
+            if not merged or merged[-1][1] != owner:
+                merged.append((start, owner))
+        return RangeRouter(merged)
+
+
+class HashRouter:
+    """
+    Consistent-hash ring with vnodes points per shard, keyed by the shard
+    specs, so adding a shard only moves the ids that land on its points
+    (about 1/N of them) and the others stay where they are
+    """
+    scheme = 'hash'
+
+    def __init__(self, shards, vnodes=SHARD_VNODES):
+        ring = sorted((_hash(f"{spec}#{point}"), index)
+                      for index, spec in enumerate(shards) for point in range(vnodes))
+        self._points = [point for point, _ in ring]
+        self._owners = [index for _, index in ring]
+
+    def shard_for(self, source_id):
+        slot = bisect.bisect(self._points, _hash(str(source_id)))
+        return self._owners[slot % len(self._owners)]
+
+
+def make_router(shard_map):
+    """Router described by a shard map"""
+    if shard_map['scheme'] == 'range':
+        return RangeRouter(shard_map['ranges'])
+    if shard_map['scheme'] == 'hash':
+        return HashRouter(shard_map['shards'], shard_map.get('vnodes', SHARD_VNODES))
+    raise ValueError(f"Unknown shard scheme '{shard_map['scheme']}', expected one of {SHARD_SCHEMES}")
+
+
+def new_shard_map(shards, scheme='hash', split_at=None, vnodes=SHARD_VNODES, range_size=SHARD_RANGE_SIZE):
+    """
+    Shard map for the given shard specs. The range scheme gives shard i the
+    ids from split_at[i - 1] (or i * range_size) up to the next shard's start.
+    """
+    if scheme not in SHARD_SCHEMES:
+        raise ValueError(f"Unknown shard scheme '{scheme}', expected one of {SHARD_SCHEMES}")
+    if not shards:
+        raise ValueError("A shard map needs at least one shard")
+    shard_map = {'scheme': scheme, 'shards': list(shards)}
+    if scheme == 'hash':
+        shard_map['vnodes'] = vnodes
+    else:
+        starts = [0] + list(split_at) if split_at else [index * range_size for index in range(len(shards))]
+        if len(starts) != len(shards) or starts != sorted(set(starts)):
+            raise ValueError("Range splits must be increasing and one fewer than the shards")
+        shard_map['ranges'] = [[start, index] for index, start in enumerate(starts)]
+    return shard_map
+
+
+def load_shard_map(path=SHARD_MAP_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_shard_map(shard_map, path=SHARD_MAP_FILE):
+    """Replace the shard map atomically, so a crash never leaves half a map"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(shard_map, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class _ShardWriter:
+    """
+    Feeds one shard's upsert from a bounded queue of batches on its own
+    thread, so every shard loads in parallel with the router
+    """
+    _DONE = object()
+
+    def __init__(self, executor, backend, batch_size, cancelled):
+        self.queue = queue.Queue(maxsize=SHARD_QUEUE_BATCHES)
+        self.cancelled = cancelled
+        self.future = executor.submit(backend.upsert, self._rows(), batch_size)
+
+    def _rows(self):
+        while True:
+            try:
+                batch = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.cancelled.is_set():
+                    raise RuntimeError("Sharded load cancelled")
+                continue
+            if batch is self._DONE:
+                return
+            yield from batch
+
+    def put(self, batch):
+        """Blocking put that raises the shard's own error if its writer has failed"""
+        while True:
+            try:
+                self.queue.put(batch, timeout=0.1)
+                return
+            except queue.Full:
+                if self.future.done():
+                    self.future.result()
+                    raise RuntimeError("Shard writer stopped early")
+
+    def close(self):
+        self.put(self._DONE)
+
+
+class ShardedEmployees:
+    """
+    The employees table split across several databases by source id.
+
+    A shard map (range map or consistent-hash ring, kept in SHARD_MAP_FILE)
+    decides which shard owns each source id. Loads are routed row by row
+    and written to every shard at once; reads and aggregates are scattered
+    to all shards in parallel and gathered here. emp_id is local to a shard;
+    source_id is the key that is unique across the cluster.
+    """
+    def __init__(self, shard_map):
+        self.shard_map = shard_map
+        self.backends = [shard_backend(spec) for spec in shard_map['shards']]
+        self.router = make_router(shard_map)
+
+    @classmethod
+    def from_file(cls, path=SHARD_MAP_FILE):
+        return cls(load_shard_map(path))
+
+    def _scatter(self, func):
+        """func(backend) on every shard at once; results in shard order"""
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+            return list(executor.map(func, self.backends))
+
+    def ensure_schema(self):
+        self._scatter(lambda backend: backend.ensure_schema())
+
+    def clear(self):
+        self._scatter(lambda backend: backend.clear())
+
+    def _fan_out(self, rows, router, batch_size):
+        """
+        Route rows (EMPLOYEE_COLUMNS tuples) with router and upsert each
+        shard's share on its own thread. Returns {shard index: upsert stats}
+        for the shards that were written to.
+        """
+        cancelled = threading.Event()
+        writers = {}
+        buffers = {}
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+            try:
+                for row in rows:
+                    shard = router.shard_for(row[0])
+                    buffer = buffers.get(shard)
+                    if buffer is None:
+                        buffer = buffers[shard] = []
+                        writers[shard] = _ShardWriter(executor, self.backends[shard], batch_size, cancelled)
+                    buffer.append(row)
+                    if len(buffer) >= batch_size:
+                        writers[shard].put(buffer)
+                        buffers[shard] = []
+                for shard, buffer in buffers.items():
+                    if buffer:
+                        writers[shard].put(buffer)
+                for writer in writers.values():
+                    writer.close()
+                return {shard: writer.future.result() for shard, writer in writers.items()}
+            except BaseException:
+                cancelled.set()
+                raise
+
+    def load(self, employees, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Upsert Employee objects into their shards. Returns bulk_insert()-style
+        stats for the whole load plus 'shards': {spec: stats}.
+        """
+        start = time.perf_counter()
+        per_shard = self._fan_out(employee_rows(employees), self.router, batch_size)
+        stats = {'rows': 0, 'batches': 0, 'commits': 0}
+        for shard_stats in per_shard.values():
+            for key in stats:
+                stats[key] += shard_stats[key]
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        stats['shards'] = {self.shard_map['shards'][shard]: shard_stats for shard, shard_stats in per_shard.items()}
+        increment('shard_rows', stats['rows'])
+        return stats
+
+    def get(self, source_id):
+        """The stored row (EMPLOYEE_COLUMNS) for a source id from its shard, or None"""
+        backend = self.backends[self.router.shard_for(source_id)]
+        # Read to the end so the cursor is finished before its connection goes back
+        rows = list(backend.iter_source_rows(source_id, source_id + 1))
+        return rows[0] if rows else None
+
+    def iter_rows(self, low=0, high=MAX_SOURCE_ID, chunk_size=10000):
+        """Every shard's rows of [low, high) merged into one stream in source id order"""
+        return heapq.merge(*(backend.iter_source_rows(low, high, chunk_size) for backend in self.backends),
+                           key=lambda row: row[0])
+
+    def totals(self):
+        """
+        Headcount and salary totals gathered from every shard:
+        {'all': {...}, 'shards': {spec: {...}}} with headcount, total_monthly,
+        total_yearly and avg_monthly
+        """
+        per_shard = self._scatter(lambda backend: backend.totals())
+        combined = {key: sum(figures[key] for figures in per_shard)
+                    for key in ('headcount', 'total_monthly', 'total_yearly')}
+        result = {'all': combined, 'shards': dict(zip(self.shard_map['shards'], per_shard))}
+        for figures in (combined, *per_shard):
+            headcount = figures['headcount']
+            figures['avg_monthly'] = round(figures['total_monthly'] / headcount, 2) if headcount else None
+        return result
+
+    def count(self):
+        return self.totals()['all']['headcount']
+
+    def _rebalance(self, shard_map, path, low=0, high=MAX_SOURCE_ID, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Move every row in [low, high) whose owner differs under shard_map.
+        Rows are copied to their new shards first, then the new map is saved,
+        then the copies left behind are deleted, so a source id is always
+        readable from the shard the current map points at. Loads should not
+        run while rows move. Returns {'moved': rows, 'seconds'}.
+        """
+        start = time.perf_counter()
+        old = ShardedEmployees(self.shard_map)
+        new = ShardedEmployees(shard_map)
+        moved = {}
+
+        for index, backend in enumerate(old.backends):
+            ids = moved[index] = array('q')
+
+            def leaving(index=index, backend=backend, ids=ids):
+                for row in backend.iter_source_rows(low, high):
+                    if new.router.shard_for(row[0]) != index:
+                        ids.append(row[0])
+                        yield row
+
+            new._fan_out(leaving(), new.router, batch_size)
+            if ids:
+                log.info(f"Copied {len(ids)} rows from {self.shard_map['shards'][index]}")
+
+        save_shard_map(shard_map, path)
+        self.shard_map, self.backends, self.router = shard_map, new.backends, new.router
+        for index, ids in moved.items():
+            if ids:
+                old.backends[index].delete_source_ids(ids, batch_size)
+        total = sum(len(ids) for ids in moved.values())
+        increment('shard_rows_moved', total)
+        return {'moved': total, 'seconds': time.perf_counter() - start}
+
+    def move_range(self, low, high, shard, path=SHARD_MAP_FILE):
+        """Give source ids [low, high) to shard (range scheme) and move their rows there"""
+        if self.shard_map['scheme'] != 'range':
+            raise ValueError("Only range-sharded maps can move id ranges; use add_shard with hash sharding")
+        if not 0 <= shard < len(self.backends) or not 0 <= low < high:
+            raise ValueError("Expected 0 <= low < high and an existing shard")
+        shard_map = dict(self.shard_map, ranges=[list(entry) for entry in self.router.moved(low, high, shard).ranges])
+        return self._rebalance(shard_map, path, low, high)
+
+    def add_shard(self, spec, path=SHARD_MAP_FILE):
+        """
+        Add a shard. On a hash ring it takes over its share of ids at once;
+        on a range map it stays empty until ranges are moved to it.
+        """
+        if spec in self.shard_map['shards']:
+            raise ValueError(f"Shard '{spec}' is already in the map")
+        shard_map = dict(self.shard_map, shards=self.shard_map['shards'] + [spec])
+        shard_backend(spec).ensure_schema()
+        return self._rebalance(shard_map, path)
+
+
+def main():
+    """
+    Create a shard map, load, query and rebalance sharded employees
+    """
+    parser = argparse.ArgumentParser(description="Shard the employees table across several databases")
+    parser.add_argument('--map', default=SHARD_MAP_FILE, help="shard map file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init', help="write a new shard map and create the shard schemas")
+    init.add_argument('shards', nargs='+', help="shard specs: sqlite:<path> or mysql:<database>")
+    init.add_argument('--scheme', choices=SHARD_SCHEMES, default='hash')
+    init.add_argument('--split-at', type=int, action='append',
+                      help="range scheme: first source id of the next shard (once per shard after the first)")
+    init.add_argument('--vnodes', type=int, default=SHARD_VNODES, help="hash scheme: ring points per shard")
+    init.add_argument('--force', action='store_true', help="replace an existing map (rows are not moved)")
+
+    load = commands.add_parser('load', help="route a feed to the shards")
+    load.add_argument('--json-file', default='employees.json', help="source file (envelope, NDJSON or gzip)")
+    load.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    load.add_argument('--full-reload', action='store_true', help="clear every shard before loading")
+
+    commands.add_parser('stats', help="headcount and salary totals per shard and overall")
+    get = commands.add_parser('get', help="look up one employee by source id")
+    get.add_argument('source_id', type=int)
+
+    move = commands.add_parser('move', help="range scheme: move source ids [low, high) to a shard")
+    move.add_argument('low', type=int)
+    move.add_argument('high', type=int)
+    move.add_argument('shard', type=int, help="index of the shard in the map")
+
+    add = commands.add_parser('add-shard', help="add a shard (hash scheme: rebalances the ring)")
+    add.add_argument('spec')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        if os.path.exists(args.map) and not args.force:
+            log.error(f"{args.map} already exists; use --force to replace it")
+            return 2
+        shard_map = new_shard_map(args.shards, args.scheme, args.split_at, args.vnodes)
+        ShardedEmployees(shard_map).ensure_schema()
+        save_shard_map(shard_map, args.map)
+        log.info(f"Wrote {args.map}: {len(args.shards)} shards by {args.scheme}")
+        return 0
+
+    cluster = ShardedEmployees.from_file(args.map)
+    errors = tuple({backend.Error for backend in cluster.backends})
+    try:
+        if args.command == 'load':
+            if args.full_reload:
+                cluster.clear()
+            stats = cluster.load(iter_employees(args.json_file), args.batch_size)
+            log.info(f"Sharded load: {format_insert_stats(stats)}")
+            for spec, shard_stats in stats['shards'].items():
+                log.info(f"  {spec}: {shard_stats['rows']} rows in {shard_stats['seconds']:.3f}s")
+        elif args.command == 'stats':
+            totals = cluster.totals()
+            print(f"{'shard':<32} {'headcount':>10} {'total monthly':>16} {'avg monthly':>12}")
+            for spec, figures in [*totals['shards'].items(), ('all', totals['all'])]:
+                average = f"{figures['avg_monthly']:.2f}" if figures['avg_monthly'] is not None else '-'
+                print(f"{spec:<32} {figures['headcount']:>10} {figures['total_monthly']:>16.2f} {average:>12}")
+        elif args.command == 'get':
+            row = cluster.get(args.source_id)
+            if row is None:
+                print(f"No employee with source id {args.source_id}")
+                return 1
+            source_id, name, monthly_salary, age, _ = row
+            shard = cluster.shard_map['shards'][cluster.router.shard_for(source_id)]
+            print(f"{source_id} | {name} | {monthly_salary} | {age}  (shard {shard})")
+        elif args.command == 'move':
+            result = cluster.move_range(args.low, args.high, args.shard, args.map)
+            log.info(f"Moved {result['moved']} rows in {result['seconds']:.3f}s")
+        elif args.command == 'add-shard':
+            result = cluster.add_shard(args.spec, args.map)
+            log.info(f"Added {args.spec}; moved {result['moved']} rows in {result['seconds']:.3f}s")
+    except ValueError as e:
+        log.error(str(e))
+        return 2
+    except errors as e:
+        log.error(f"Shard operation failed: {e}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
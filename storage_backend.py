@@ -0,0 +1,400 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from bulk_insert import (
+    bulk_insert, iter_batches, DEFAULT_BATCH_SIZE, DEFAULT_COMMIT_EVERY, DEFAULT_METHOD,
+    EMPLOYEE_COLUMNS, EMPLOYEE_UPDATE_COLUMNS
+)
+from config import env
+from database_connection import get_connection
+from instrumentation import increment, timer
+from lazy_imports import lazy_import
+
+mysql = lazy_import('mysql.connector')
+
+# Which backend the scripts use unless told otherwise (mysql or sqlite)
+STORAGE_BACKEND = env('STORAGE_BACKEND', 'mysql')
+
+# SQLite settings (can be overridden in .env)
+SQLITE_PATH = env('SQLITE_PATH', 'employees.db')
+SQLITE_CACHE_MB = env('SQLITE_CACHE_MB', 64, int)      # page cache per connection
+SQLITE_MMAP_MB = env('SQLITE_MMAP_MB', 256, int)       # database file mapped into memory
+
+# Columns returned by iter_rows(), in order (the export_employees.py layout)
+ROW_COLUMNS = ('emp_id', 'source_id', 'name', 'monthly_salary', 'age', 'yearly_salary')
+
+_SELECT_ROWS_QUERY = f"SELECT {', '.join(ROW_COLUMNS)} FROM employees ORDER BY emp_id"
+
+# Source rows (EMPLOYEE_COLUMNS) of a source id range, in source id order
+_SELECT_SOURCE_ROWS_QUERY = (
+    f"SELECT {', '.join(EMPLOYEE_COLUMNS)} FROM employees "
+    "WHERE source_id >= {placeholder} AND source_id < {placeholder} ORDER BY source_id"
+)
+
+# Largest source id a range query can be open-ended up to (source_id is an INT)
+MAX_SOURCE_ID = 2 ** 31
+
+CENT = Decimal('0.01')
+
+
+class StorageBackend:
+    """
+    Where employee rows are kept.
+
+    Every backend offers the same operations on the employees table:
+    connect() (a context manager yielding a native connection),
+    ensure_schema(), bulk_insert(rows), upsert(rows), iter_rows() (streamed
+    in chunks, never buffered whole), iter_source_rows(low, high) (the
+    stored rows of a source id range, shaped for upsert), delete_source_ids(),
+    count(), totals() and clear(). Rows are tuples ordered like
+    EMPLOYEE_COLUMNS, as produced by bulk_insert.employee_rows().
+    insert and upsert return the bulk_insert() stats dict, so
+    format_insert_stats() works with either. Database errors are raised as
+    the backend's Error class.
+    """
+    name = None
+    Error = Exception
+
+    def connect(self):
+        raise NotImplementedError
+
+    def ensure_schema(self):
+        raise NotImplementedError
+
+    def bulk_insert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        raise NotImplementedError
+
+    def upsert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        raise NotImplementedError
+
+    def iter_rows(self, chunk_size=10000):
+        raise NotImplementedError
+
+    def iter_source_rows(self, low=0, high=MAX_SOURCE_ID, chunk_size=10000):
+        raise NotImplementedError
+
+    def delete_source_ids(self, source_ids, batch_size=DEFAULT_BATCH_SIZE):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def totals(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MySQLBackend(StorageBackend):
+    """
+    The MySQL server behind database_connection.py, with the schema from
+    update_table_structure.py and the payroll summary kept up to date
+    """
+    name = 'mysql'
+
+    def __init__(self, database=None, method=DEFAULT_METHOD):
+        self.database = database
+        self.method = method
+
+    @property
+    def Error(self):
+        return mysql.connector.Error
+
+    def connect(self):
+        return get_connection(self.database)
+
+    def ensure_schema(self):
+        from update_table_structure import run_migrations
+        if self.database:
+            # A named database (a shard, say) may not have been created yet
+            with get_connection(database='') as connection:
+                cursor = connection.cursor()
+                cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{self.database}`")
+                cursor.close()
+        with self.connect() as connection:
+            return run_migrations(connection)
+
+    def _load(self, rows, batch_size, commit_every, method, update_columns):
+        from data_version import bump_data_version
+        from payroll_summary import rebuild_summary
+        with self.connect() as connection:
+            stats = bulk_insert(connection, rows, batch_size=batch_size, commit_every=commit_every,
+                                method=method, update_columns=update_columns)
+            if stats['rows']:
+                rebuild_summary(connection)
+                bump_data_version(connection)
+        return stats
+
+    def bulk_insert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        return self._load(rows, batch_size, commit_every, self.method, None)
+
+    def upsert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        method = 'values' if self.method == 'load_data' else self.method
+        return self._load(rows, batch_size, commit_every, method, EMPLOYEE_UPDATE_COLUMNS)
+
+    def iter_rows(self, chunk_size=10000):
+        with get_connection(self.database, read_only=True) as connection:
+            # Unbuffered: rows stay on the server socket until fetchmany() asks for them
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(_SELECT_ROWS_QUERY)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def iter_source_rows(self, low=0, high=MAX_SOURCE_ID, chunk_size=10000):
+        with self.connect() as connection:
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(_SELECT_SOURCE_ROWS_QUERY.format(placeholder='%s'), (low, high))
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yield from rows
+            finally:
+                cursor.close()
+
+    def delete_source_ids(self, source_ids, batch_size=DEFAULT_BATCH_SIZE):
+        from data_version import bump_data_version
+        from payroll_summary import rebuild_summary
+        deleted = 0
+        with self.connect() as connection:
+            cursor = connection.cursor()
+            # One committed statement per batch, so row locks are held briefly
+            for batch in iter_batches(source_ids, batch_size):
+                cursor.execute(
+                    f"DELETE FROM employees WHERE source_id IN ({', '.join(['%s'] * len(batch))})", batch
+                )
+                deleted += cursor.rowcount
+                connection.commit()
+            cursor.close()
+            if deleted:
+                rebuild_summary(connection)
+                bump_data_version(connection)
+        return deleted
+
+    def count(self):
+        return self.totals()['headcount']
+
+    def totals(self):
+        from payroll_summary import read_summary
+        with get_connection(self.database, read_only=True) as connection:
+            figures = read_summary(connection)['all']
+        return {key: figures[key] for key in ('headcount', 'total_monthly', 'total_yearly')}
+
+    def clear(self):
+        from data_version import bump_data_version
+        from payroll_summary import reset_summary
+        with self.connect() as connection:
+            cursor = connection.cursor()
+            # The table and its summary are emptied in the same transaction
+            cursor.execute("DELETE FROM employees")
+            reset_summary(cursor)
+            connection.commit()
+            cursor.close()
+            bump_data_version(connection)
+        return True
+
+
+_SQLITE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS employees (
+        emp_id INTEGER PRIMARY KEY,
+        source_id INTEGER UNIQUE,
+        name TEXT NOT NULL,
+        monthly_salary NUMERIC NOT NULL,
+        age INTEGER NOT NULL,
+        yearly_salary NUMERIC GENERATED ALWAYS AS (ROUND(monthly_salary * 12, 2)) STORED,
+        row_hash TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_employees_age ON employees (age)",
+    "CREATE INDEX IF NOT EXISTS idx_employees_monthly_salary ON employees (monthly_salary)",
+)
+
+_SQLITE_INSERT_QUERY = (
+    f"INSERT INTO employees ({', '.join(EMPLOYEE_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(EMPLOYEE_COLUMNS))})"
+)
+_SQLITE_UPSERT_QUERY = _SQLITE_INSERT_QUERY + (
+    " ON CONFLICT (source_id) DO UPDATE SET "
+    + ', '.join(f"{column} = excluded.{column}" for column in EMPLOYEE_UPDATE_COLUMNS)
+)
+
+
+def _sqlite_value(value):
+    # sqlite3 has no Decimal support; salaries go in as text and the NUMERIC
+    # column stores them as numbers
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def _sqlite_commit(cursor):
+    with timer('db_commit_seconds'):
+        cursor.execute("COMMIT")
+    increment('db_commits')
+
+
+def _money(value):
+    return None if value is None else Decimal(str(value)).quantize(CENT)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Embedded SQLite database in a single file, for local ingest and queries
+    without a server.
+
+    Tuned for bulk loading: write-ahead logging with synchronous=NORMAL (a
+    commit is an append to the WAL, not an fsync of the database), a large
+    page cache, memory-mapped reads and in-memory temp storage. Rows go in
+    through executemany() on one reused statement, which sqlite3 prepares
+    once per connection, in batch_size chunks with one transaction per
+    commit_every rows.
+    """
+    name = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, path=SQLITE_PATH, cache_mb=SQLITE_CACHE_MB, mmap_mb=SQLITE_MMAP_MB):
+        self.path = path
+        self.cache_mb = cache_mb
+        self.mmap_mb = mmap_mb
+
+    @contextmanager
+    def connect(self):
+        # isolation_level=None: transactions are opened explicitly with BEGIN
+        connection = sqlite3.connect(self.path, isolation_level=None, cached_statements=256)
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA temp_store = MEMORY")
+            connection.execute(f"PRAGMA cache_size = {-self.cache_mb * 1024}")
+            connection.execute(f"PRAGMA mmap_size = {self.mmap_mb * 1024 * 1024}")
+            yield connection
+        finally:
+            connection.close()
+
+    def ensure_schema(self):
+        with self.connect() as connection:
+            for query in _SQLITE_SCHEMA:
+                connection.execute(query)
+
+    def _load(self, query, rows, batch_size, commit_every):
+        stats = {'rows': 0, 'batches': 0, 'commits': 0}
+        pending = 0
+        start = time.perf_counter()
+
+        with self.connect() as connection:
+            cursor = connection.cursor()
+            try:
+                for batch in iter_batches(rows, batch_size):
+                    if not pending:
+                        cursor.execute("BEGIN")
+                    with timer('db_batch_seconds'):
+                        cursor.executemany(query, ([_sqlite_value(value) for value in row] for row in batch))
+                    stats['rows'] += len(batch)
+                    stats['batches'] += 1
+                    pending += len(batch)
+                    increment('db_rows', len(batch))
+                    increment('db_batches')
+
+                    if commit_every and pending >= commit_every:
+                        _sqlite_commit(cursor)
+                        stats['commits'] += 1
+                        pending = 0
+
+                if pending:
+                    _sqlite_commit(cursor)
+                    stats['commits'] += 1
+            except BaseException:
+                if connection.in_transaction:
+                    cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+        return stats
+
+    def bulk_insert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        return self._load(_SQLITE_INSERT_QUERY, rows, batch_size, commit_every)
+
+    def upsert(self, rows, batch_size=DEFAULT_BATCH_SIZE, commit_every=DEFAULT_COMMIT_EVERY):
+        return self._load(_SQLITE_UPSERT_QUERY, rows, batch_size, commit_every)
+
+    def iter_rows(self, chunk_size=10000):
+        with self.connect() as connection:
+            cursor = connection.execute(_SELECT_ROWS_QUERY)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                for emp_id, source_id, name, monthly_salary, age, yearly_salary in rows:
+                    yield emp_id, source_id, name, _money(monthly_salary), age, _money(yearly_salary)
+
+    def iter_source_rows(self, low=0, high=MAX_SOURCE_ID, chunk_size=10000):
+        with self.connect() as connection:
+            cursor = connection.execute(_SELECT_SOURCE_ROWS_QUERY.format(placeholder='?'), (low, high))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                for source_id, name, monthly_salary, age, row_hash in rows:
+                    yield source_id, name, _money(monthly_salary), age, row_hash
+
+    def delete_source_ids(self, source_ids, batch_size=DEFAULT_BATCH_SIZE):
+        deleted = 0
+        with self.connect() as connection:
+            connection.execute("BEGIN")
+            try:
+                for batch in iter_batches(source_ids, batch_size):
+                    deleted += connection.execute(
+                        f"DELETE FROM employees WHERE source_id IN ({', '.join(['?'] * len(batch))})", batch
+                    ).rowcount
+                connection.execute("COMMIT")
+            except BaseException:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def count(self):
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM employees").fetchone()[0]
+
+    def totals(self):
+        with self.connect() as connection:
+            headcount, total_monthly = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(monthly_salary), 0) FROM employees"
+            ).fetchone()
+        total_monthly = _money(total_monthly)
+        return {'headcount': headcount, 'total_monthly': total_monthly, 'total_yearly': total_monthly * 12}
+
+    def clear(self):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM employees")
+        return True
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def get_backend(name=None, **options):
+    """
+    Backend instance by name ('mysql' or 'sqlite'; STORAGE_BACKEND from .env
+    by default), with options passed to its constructor
+    """
+    name = name or STORAGE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}', expected one of {tuple(BACKENDS)}")
+    return BACKENDS[name](**options)
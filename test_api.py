@@ -0,0 +1,596 @@
+import argparse
+import asyncio
+import bisect
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from employee_api import EmployeeReadService, serve
+from generate_employees import synthetic_records, DEFAULT_SEED
+from instrumentation import get_logger
+
+log = get_logger(__name__)
+
+# Load-replay harness for employee_api.py. Not a pytest module: nothing in
+# here is named test_*, so collecting it runs nothing.
+
+REPLAY_LOG = 'replay.jsonl'
+REPLAY_MODES = ('closed', 'open')
+TARGETS = ('direct', 'http')
+DEFAULT_CLIENTS = 8
+DEFAULT_RATE = 200.0            # requests per second in open-loop mode
+MAX_IN_FLIGHT = 1000            # open-loop requests outstanding before arrivals are dropped
+STANDIN_ROWS = 10000            # employees in the stand-in database
+DEFAULT_TOLERANCE = 0.25        # allowed p99 / throughput regression against a baseline (25%)
+
+PERCENTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('p999', 0.999))
+
+_STANDIN_FILTERS = {
+    'min_age': lambda row, value: row['age'] >= value,
+    'max_age': lambda row, value: row['age'] <= value,
+    'min_salary': lambda row, value: row['monthly_salary'] >= value,
+    'max_salary': lambda row, value: row['monthly_salary'] <= value,
+}
+
+
+def load_request_log(path=REPLAY_LOG):
+    """
+    Read a request log: one JSON object per line, either a read
+    {"method": "GET", "path": "/employees/12", "headers": {...}} or a write
+    {"write": {"emp_id": 12, "monthly_salary": 5100}}. Lines that are neither
+    (or not JSON) are skipped. Returns (entries, skipped line count).
+    """
+    entries = []
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                skipped += 1
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get('write'), dict):
+                entries.append({'write': entry['write']})
+            elif isinstance(entry, dict) and isinstance(entry.get('path'), str):
+                entries.append({'method': entry.get('method', 'GET').upper(), 'path': entry['path'],
+                                'headers': {k.lower(): v for k, v in entry.get('headers', {}).items()}})
+            else:
+                skipped += 1
+    return entries, skipped
+
+
+def synthesize_request_log(path, count, rows=STANDIN_ROWS, seed=DEFAULT_SEED, write_ratio=0.01):
+    """
+    Write a deterministic request log of count entries in the employee read
+    mix: mostly lookups by id skewed towards a hot set (so the cache has
+    something to hit), keyset list pages with occasional filters, and
+    write_ratio writes. Returns the number of entries written.
+    """
+    rng = random.Random(seed)
+    hot = max(1, rows // 100)
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(count):
+            roll = rng.random()
+            if roll < write_ratio:
+                entry = {'write': {'emp_id': rng.randint(1, rows), 'monthly_salary': rng.randint(1000, 500000)}}
+            elif roll < 0.75:
+                emp_id = rng.randint(1, hot) if rng.random() < 0.8 else rng.randint(1, rows)
+                entry = {'method': 'GET', 'path': f"/employees/{emp_id}"}
+            else:
+                after = rng.choice((0, 0, 0, rng.randint(0, rows)))
+                query = f"after={after}&limit={rng.choice((10, 50, 100))}"
+                if rng.random() < 0.3:
+                    query += f"&min_age={rng.randint(18, 60)}"
+                entry = {'method': 'GET', 'path': f"/employees?{query}"}
+            f.write(json.dumps(entry) + '\n')
+    return count
+
+
+class StandInDatabase:
+    """
+    In-memory employees table with the same rows and data-version semantics
+    as MySQL, so the API can be load-tested without a server. latency adds a
+    fixed delay per query to mimic the network round trip.
+    """
+    def __init__(self, rows=STANDIN_ROWS, latency=0.0, seed=DEFAULT_SEED):
+        self.latency = latency
+        self.version = 1
+        self._lock = threading.Lock()
+        self.rows = []
+        for emp_id, record in enumerate(synthetic_records(rows, seed), 1):
+            salary = Decimal(record['employee_salary'])
+            self.rows.append({
+                'emp_id': emp_id, 'source_id': record['id'], 'name': record['employee_name'],
+                'monthly_salary': salary, 'age': int(record['employee_age']), 'yearly_salary': salary * 12,
+            })
+        self._ids = [row['emp_id'] for row in self.rows]
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, emp_id):
+        self._wait()
+        index = bisect.bisect_left(self._ids, emp_id)
+        if index < len(self._ids) and self._ids[index] == emp_id:
+            return dict(self.rows[index])
+        return None
+
+    def list(self, after, limit, filters):
+        self._wait()
+        page = []
+        for row in self.rows[bisect.bisect_right(self._ids, after):]:
+            if all(_STANDIN_FILTERS[name](row, value) for name, value in filters):
+                page.append(dict(row))
+                if len(page) == limit:
+                    break
+        return page
+
+    def write(self, emp_id, monthly_salary):
+        """Change one salary and bump the data version, like a loader would"""
+        self._wait()
+        row = self.get(emp_id)
+        if row is None:
+            return False
+        with self._lock:
+            stored = self.rows[bisect.bisect_left(self._ids, emp_id)]
+            stored['monthly_salary'] = Decimal(monthly_salary)
+            stored['yearly_salary'] = stored['monthly_salary'] * 12
+            self.version += 1
+        return True
+
+
+class StandInReadService(EmployeeReadService):
+    """EmployeeReadService reading from a StandInDatabase instead of the MySQL pool"""
+    def __init__(self, database, **options):
+        super().__init__(**options)
+        self.database = database
+
+    def _db_setup(self):
+        return self.database.version
+
+    def _db_version(self):
+        return self.database.version
+
+    def _db_get_employee(self, emp_id):
+        return self.database.get(emp_id)
+
+    def _db_list_employees(self, after, limit, filters):
+        return self.database.list(after, limit, filters)
+
+    async def write(self, emp_id, monthly_salary):
+        written = await self._run(self.database.write, emp_id, monthly_salary)
+        # Same effect as bump_data_version's listeners for a write in this process
+        self._expire_version_check()
+        return written
+
+
+class DirectTarget:
+    """Calls the service's request handler in-process (no sockets, no HTTP parsing)"""
+    name = 'direct'
+    supports_writes = True
+
+    def __init__(self, service):
+        self.service = service
+
+    async def start(self):
+        await self.service.start()
+
+    async def send(self, entry):
+        status, _, _ = await self.service.handle(entry['method'], entry['path'], entry['headers'])
+        return status
+
+    async def write(self, entry):
+        await self.service.write(entry['emp_id'], entry['monthly_salary'])
+
+    async def cache_stats(self):
+        return self.service.cache.stats()
+
+    async def close(self):
+        self.service.executor.shutdown(wait=False)
+
+
+class _Connection:
+    """One keep-alive HTTP/1.1 client connection"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method, path, host, headers):
+        head = [f"{method} {path} HTTP/1.1", f"Host: {host}"]
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        length = 0
+        keep_alive = True
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection':
+                keep_alive = value.strip().lower() != 'close'
+        body = await self.reader.readexactly(length) if length and method != 'HEAD' else b''
+        return status, body, keep_alive
+
+    def close(self):
+        self.writer.close()
+
+
+class HttpTarget:
+    """
+    Sends requests over keep-alive HTTP connections (reused across requests,
+    opened on demand) to a running API. With service set, that service is
+    first served in-process on a free local port; otherwise url must point
+    at a running employee_api.py.
+    """
+    name = 'http'
+
+    def __init__(self, url=None, service=None):
+        self.service = service
+        self.url = url
+        self._idle = []
+        self._server_task = None
+
+    @property
+    def supports_writes(self):
+        # The HTTP API is read-only; writes go to the stand-in database.
+        return self.service is not None
+
+    async def start(self):
+        if self.service is not None:
+            port = _free_port()
+            ready = asyncio.Event()
+            self._server_task = asyncio.create_task(serve('127.0.0.1', port, self.service, ready))
+            await ready.wait()
+            self.url = f"http://127.0.0.1:{port}"
+        parts = urlsplit(self.url)
+        self.host, self.port = parts.hostname, parts.port or 80
+
+    async def _request(self, method, path, headers=None):
+        connection = self._idle.pop() if self._idle else _Connection(
+            *await asyncio.open_connection(self.host, self.port))
+        try:
+            status, body, keep_alive = await connection.request(method, path, self.host, headers or {})
+        except BaseException:
+            connection.close()
+            raise
+        if keep_alive:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        return status, body
+
+    async def send(self, entry):
+        status, _ = await self._request(entry['method'], entry['path'], entry['headers'])
+        return status
+
+    async def write(self, entry):
+        await self.service.write(entry['emp_id'], entry['monthly_salary'])
+
+    async def cache_stats(self):
+        if self.service is not None:
+            return self.service.cache.stats()
+        status, body = await self._request('GET', '/stats')
+        return json.loads(body)['cache'] if status == HTTPStatus.OK else None
+
+    async def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle.clear()
+        if self._server_task is not None:
+            self._server_task.cancel()
+            try:
+                await self._server_task
+            except asyncio.CancelledError:
+                pass
+        if self.service is not None:
+            self.service.executor.shutdown(wait=False)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.writes = 0
+        self.skipped_writes = 0
+        self.dropped = 0
+
+    async def run(self, target, entry, scheduled=None):
+        """
+        Send one entry and record its latency. In open-loop mode latency is
+        measured from the scheduled arrival time, so time spent queued behind
+        a slow server counts (no coordinated omission).
+        """
+        if 'write' in entry and not target.supports_writes:
+            self.skipped_writes += 1
+            return
+        start = time.perf_counter() if scheduled is None else scheduled
+        try:
+            if 'write' in entry:
+                await target.write(entry['write'])
+                self.writes += 1
+                return
+            status = await target.send(entry)
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.errors[type(e).__name__] += 1
+            self.latencies.append(time.perf_counter() - start)
+            return
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[int(status)] += 1
+
+
+async def _closed_loop(target, entries, recorder, clients, total, deadline):
+    """clients workers, each sending its next request as soon as the previous one answered"""
+    position = 0
+
+    async def client():
+        nonlocal position
+        while position < total and (deadline is None or time.perf_counter() < deadline):
+            entry = entries[position % len(entries)]
+            position += 1
+            await recorder.run(target, entry)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+
+
+async def _open_loop(target, entries, recorder, rate, total, deadline, poisson=False, seed=DEFAULT_SEED):
+    """Requests arrive at rate per second whatever the server's speed (Poisson arrivals optional)"""
+    rng = random.Random(seed)
+    in_flight = set()
+    start = time.perf_counter()
+    scheduled = start
+    for position in range(total):
+        scheduled += rng.expovariate(rate) if poisson else 1 / rate
+        if deadline is not None and scheduled >= deadline:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= MAX_IN_FLIGHT:
+            recorder.dropped += 1
+            continue
+        task = asyncio.create_task(recorder.run(target, entries[position % len(entries)], scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _cache_delta(before, after):
+    if not before or not after:
+        return None
+    hits = after['hits'] - before['hits']
+    misses = after['misses'] - before['misses']
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+
+
+async def replay(target, entries, mode='closed', clients=DEFAULT_CLIENTS, rate=DEFAULT_RATE,
+                 requests=None, duration=None, poisson=False):
+    """
+    Replay entries against target (cycling through them) until requests
+    entries were sent or duration seconds passed; by default one pass.
+    mode 'closed' runs clients concurrent clients; 'open' issues requests at
+    a fixed rate per second. Returns the report: requests, seconds,
+    throughput, latency_ms (p50/p95/p99/p999/max/mean), statuses,
+    error_rate, errors, writes, skipped_writes, dropped and cache (hit
+    ratio of the API cache over the run).
+    """
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"Unknown replay mode '{mode}', expected one of {REPLAY_MODES}")
+    if not entries:
+        raise ValueError("Nothing to replay")
+    total = requests or (len(entries) if duration is None else sys.maxsize)
+
+    recorder = _Recorder()
+    await target.start()
+    try:
+        cache_before = await target.cache_stats()
+        start = time.perf_counter()
+        deadline = start + duration if duration is not None else None
+        if mode == 'closed':
+            await _closed_loop(target, entries, recorder, clients, total, deadline)
+        else:
+            await _open_loop(target, entries, recorder, rate, total, deadline, poisson)
+        elapsed = time.perf_counter() - start
+        cache_after = await target.cache_stats()
+    finally:
+        await target.close()
+
+    ordered = sorted(recorder.latencies)
+    count = len(ordered)
+    failures = sum(n for status, n in recorder.statuses.items() if status >= 500) + sum(recorder.errors.values())
+    latency = {name: _percentile(ordered, q) * 1000 if ordered else None for name, q in PERCENTILES}
+    latency['max'] = ordered[-1] * 1000 if ordered else None
+    latency['mean'] = sum(ordered) / count * 1000 if ordered else None
+    return {
+        'target': target.name,
+        'mode': mode,
+        'clients': clients if mode == 'closed' else None,
+        'rate': rate if mode == 'open' else None,
+        'requests': count,
+        'seconds': elapsed,
+        'throughput': count / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': latency,
+        'statuses': dict(sorted(recorder.statuses.items())),
+        'error_rate': failures / count if count else 0.0,
+        'errors': dict(recorder.errors),
+        'writes': recorder.writes,
+        'skipped_writes': recorder.skipped_writes,
+        'dropped': recorder.dropped,
+        'cache': _cache_delta(cache_before, cache_after),
+    }
+
+
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE, slack_ms=0.5):
+    """p99 latency or throughput worse than baseline by more than tolerance, or new errors"""
+    problems = []
+    if (report['mode'], report['target']) != (baseline['mode'], baseline['target']):
+        problems.append(f"baseline is a {baseline['mode']} loop on the {baseline['target']} target, "
+                        f"this run a {report['mode']} loop on the {report['target']} target")
+        return problems
+    p99, before_p99 = report['latency_ms']['p99'], baseline['latency_ms']['p99']
+    if p99 is not None and before_p99 is not None and p99 > before_p99 * (1 + tolerance) and p99 - before_p99 > slack_ms:
+        problems.append(f"p99 latency {p99:.2f} ms (baseline {before_p99:.2f} ms)")
+    if report['throughput'] < baseline['throughput'] * (1 - tolerance):
+        problems.append(f"throughput {report['throughput']:,.0f}/s (baseline {baseline['throughput']:,.0f}/s)")
+    if report['error_rate'] > baseline['error_rate']:
+        problems.append(f"error rate {report['error_rate']:.2%} (baseline {baseline['error_rate']:.2%})")
+    return problems
+
+
+def _start_local_api(port):
+    """Start employee_api.py (against the configured MySQL) and wait until it answers /health"""
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'employee_api.py'), '--port', str(port)])
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"employee_api.py exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b'GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if s.recv(64).startswith(b'HTTP/1.1 200'):
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("employee_api.py did not become ready")
+
+
+def _print_report(report):
+    latency = report['latency_ms']
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s "
+          f"({report['throughput']:,.0f}/s, {report['mode']} loop, {report['target']} target)")
+    if report['requests']:
+        print("latency ms: " + ', '.join(f"{name} {latency[name]:.2f}"
+                                         for name in ('p50', 'p95', 'p99', 'p999', 'max', 'mean')))
+    print(f"statuses: {report['statuses']}  error rate: {report['error_rate']:.2%}"
+          + (f"  errors: {report['errors']}" if report['errors'] else ''))
+    if report['cache']:
+        print(f"cache: {report['cache']['hits']} hits, {report['cache']['misses']} misses "
+              f"(hit ratio {report['cache']['hit_ratio']:.1%})")
+    if report['writes'] or report['skipped_writes']:
+        print(f"writes: {report['writes']} applied, {report['skipped_writes']} skipped")
+    if report['dropped']:
+        print(f"dropped arrivals: {report['dropped']} (more than {MAX_IN_FLIGHT} in flight)")
+
+
+def main():
+    """
+    Replay a request log against the employee API and report latency,
+    throughput, errors and cache hit ratio. Exits with status 1 on
+    regressions against --compare.
+    """
+    parser = argparse.ArgumentParser(description="Load-replay harness for employee_api.py")
+    parser.add_argument('--log', default=REPLAY_LOG, help="request log to replay (JSON lines)")
+    parser.add_argument('--synthesize', type=int, metavar='N',
+                        help="first write a synthetic log of N requests to --log")
+    parser.add_argument('--force', action='store_true', help="let --synthesize overwrite an existing --log")
+    parser.add_argument('--mode', choices=REPLAY_MODES, default='closed',
+                        help="closed: --clients concurrent clients; open: --rate arrivals per second")
+    parser.add_argument('--clients', type=int, default=DEFAULT_CLIENTS)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE)
+    parser.add_argument('--poisson', action='store_true', help="exponential inter-arrival times in open mode")
+    parser.add_argument('--requests', type=int, help="stop after this many requests (default: one pass)")
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    parser.add_argument('--target', choices=TARGETS, default='direct',
+                        help="direct: call the handler in-process; http: go through a socket")
+    parser.add_argument('--url', help="replay against a running API instead of the stand-in database")
+    parser.add_argument('--start-api', action='store_true',
+                        help="start employee_api.py on a free port (uses the configured MySQL)")
+    parser.add_argument('--rows', type=int, default=STANDIN_ROWS, help="employees in the stand-in database")
+    parser.add_argument('--db-latency', type=float, default=0.0, help="seconds added to every stand-in query")
+    parser.add_argument('--cache-size', type=int, help="API cache entries (0 disables caching)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--save', metavar='PATH', help="write the report as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="fail on regressions against this baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.synthesize:
+        if os.path.exists(args.log) and not args.force:
+            log.error(f"{args.log} already exists; pass --force to overwrite it or pick another --log")
+            return 2
+        synthesize_request_log(args.log, args.synthesize, args.rows)
+        log.info(f"Wrote {args.synthesize} synthetic requests to {args.log}")
+    entries, skipped = load_request_log(args.log)
+    if skipped:
+        log.warning(f"Skipped {skipped} lines of {args.log} that are not requests")
+    if not entries:
+        log.error(f"No requests to replay in {args.log}; create some with --synthesize N")
+        return 2
+
+    api_process = None
+    if args.url or args.start_api:
+        if args.start_api:
+            port = _free_port()
+            api_process = _start_local_api(port)
+            args.url = f"http://127.0.0.1:{port}"
+        target = HttpTarget(url=args.url)
+    else:
+        options = {} if args.cache_size is None else {'cache_size': max(args.cache_size, 0)}
+        service = StandInReadService(StandInDatabase(args.rows, args.db_latency), **options)
+        target = DirectTarget(service) if args.target == 'direct' else HttpTarget(service=service)
+
+    try:
+        report = asyncio.run(replay(target, entries, args.mode, args.clients, args.rate,
+                                    args.requests, args.duration, args.poisson))
+    finally:
+        if api_process is not None:
+            api_process.terminate()
+            api_process.wait()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    problems = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            problems = find_regressions(report, json.load(f), args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
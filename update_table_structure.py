@@ -1,106 +1,245 @@
-import mysql.connector
-from dotenv import load_dotenv
-import os
+import argparse
+import time
 
-# Load environment variables from .env file
-load_dotenv()
+from database_connection import get_connection
+from payroll_summary import SUMMARY_TABLE_QUERY, read_summary, recount_summary
+from instrumentation import get_logger
+from lazy_imports import lazy_import
 
-def connect_to_database():
+mysql = lazy_import('mysql.connector')
+log = get_logger(__name__)
+
+# Longest name migration 3 can keep once the column is a VARCHAR
+NAME_MAX_LENGTH = 255
+
+# Bookkeeping table recording which migrations have run
+MIGRATIONS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    duration_ms INT NOT NULL
+)
+"""
+
+
+def _columns(cursor):
+    """Map of column name -> (data type, extra) for the employees table"""
+    cursor.execute("""
+        SELECT COLUMN_NAME, DATA_TYPE, EXTRA FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'employees'
+    """)
+    return {name: (data_type.lower(), extra.lower()) for name, data_type, extra in cursor.fetchall()}
+
+
+def _indexes(cursor):
+    """Names of the indexes on the employees table"""
+    cursor.execute("""
+        SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'employees'
+    """)
+    return {row[0] for row in cursor.fetchall()}
+
+
+# Each migration checks the live schema first, so tables created by older
+# versions of the scripts are brought forward without redoing work.
+# ALGORITHM/LOCK clauses keep the table readable (and, where InnoDB allows
+# an in-place change, writable) while an ALTER runs.
+
+def _create_employees_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS employees (
+            emp_id INT AUTO_INCREMENT PRIMARY KEY,
+            name TEXT NOT NULL,
+            monthly_salary DECIMAL(10, 2) NOT NULL,
+            age INT NOT NULL,
+            yearly_salary DECIMAL(10, 2) NOT NULL
+        )
+    """)
+
+
+def _add_source_id_and_row_hash(cursor):
+    columns = _columns(cursor)
+    if 'source_id' not in columns:
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD COLUMN source_id INT NULL AFTER emp_id,
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+    if 'row_hash' not in columns:
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD COLUMN row_hash CHAR(32) NULL,
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+    if 'uq_employees_source_id' not in _indexes(cursor):
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD UNIQUE KEY uq_employees_source_id (source_id),
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+
+def _name_to_varchar(cursor):
+    if _columns(cursor)['name'][0] != 'varchar':
+        # Strict mode would abort the copy on the first longer name; report them all up front
+        cursor.execute("SELECT COUNT(*), MAX(CHAR_LENGTH(name)) FROM employees WHERE CHAR_LENGTH(name) > %s",
+                       (NAME_MAX_LENGTH,))
+        too_long, longest = cursor.fetchone()
+        if too_long:
+            cursor.execute("SELECT emp_id FROM employees WHERE CHAR_LENGTH(name) > %s ORDER BY emp_id LIMIT 10",
+                           (NAME_MAX_LENGTH,))
+            examples = ', '.join(str(row[0]) for row in cursor.fetchall())
+            raise mysql.connector.DataError(
+                f"Cannot store name as VARCHAR({NAME_MAX_LENGTH}): {too_long} employees have longer names "
+                f"(up to {longest} characters, e.g. emp_id {examples}). Shorten them and run the migrations again."
+            )
+        # Changing the column type rebuilds the table; readers are not blocked
+        cursor.execute(f"""
+            ALTER TABLE employees
+                MODIFY name VARCHAR({NAME_MAX_LENGTH}) NOT NULL,
+                ALGORITHM=COPY, LOCK=SHARED
+        """)
+    if 'idx_employees_name' not in _indexes(cursor):
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD INDEX idx_employees_name (name(32)),
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+
+def _add_range_indexes(cursor):
+    indexes = _indexes(cursor)
+    if 'idx_employees_age' not in indexes:
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD INDEX idx_employees_age (age),
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+    if 'idx_employees_monthly_salary' not in indexes:
+        cursor.execute("""
+            ALTER TABLE employees
+                ADD INDEX idx_employees_monthly_salary (monthly_salary),
+                ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+
+def _generate_yearly_salary(cursor):
+    if 'stored generated' not in _columns(cursor)['yearly_salary'][1]:
+        # Widened to DECIMAL(12, 2) so twelve months of the largest salary still fit
+        cursor.execute("""
+            ALTER TABLE employees
+                MODIFY yearly_salary DECIMAL(12, 2) AS (monthly_salary * 12) STORED NOT NULL,
+                ALGORITHM=COPY, LOCK=SHARED
+        """)
+
+
+def _create_payroll_summary(cursor):
+    cursor.execute(SUMMARY_TABLE_QUERY)
+    # Seed it from the rows already loaded; loaders keep it current from here
+    recount_summary(cursor)
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, "create employees table", _create_employees_table),
+    (2, "add source_id (unique) and row_hash for incremental sync", _add_source_id_and_row_hash),
+    (3, "store name as VARCHAR(255) with a prefix index", _name_to_varchar),
+    (4, "index age and monthly_salary for range queries", _add_range_indexes),
+    (5, "compute yearly_salary as a STORED generated column", _generate_yearly_salary),
+    (6, "add payroll_summary, maintained incrementally by the loaders", _create_payroll_summary),
+]
+
+
+def applied_versions(connection):
     """
-    Connect to MySQL database using credentials from .env file
+    Set of migration versions already recorded in schema_migrations
     """
-    try:
-        # Get credentials from environment variables
-        user = os.getenv('USER')
-        password = os.getenv('PASSWORD')
-        
-        # Default connection parameters
-        host = os.getenv('HOST', 'localhost')
-        database = os.getenv('DATABASE', 'employee_db')
-        port = os.getenv('PORT', 3306)
-        
-        print(f"Connecting to database: {database}")
-        
-        connection = mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port
+    cursor = connection.cursor()
+    cursor.execute(MIGRATIONS_TABLE_QUERY)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def pending_migrations(connection):
+    """
+    Migrations that have not been applied yet, in order
+    """
+    applied = applied_versions(connection)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def run_migrations(connection):
+    """
+    Apply every pending migration in order, recording each one as it completes.
+    Existing rows are never dropped. Returns the list of versions applied.
+    """
+    applied = []
+    cursor = connection.cursor()
+    for version, description, migrate in pending_migrations(connection):
+        log.info(f"Applying migration {version}: {description}...")
+        start = time.perf_counter()
+        migrate(cursor)
+        duration_ms = int((time.perf_counter() - start) * 1000)
+
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description, duration_ms) VALUES (%s, %s, %s)",
+            (version, description, duration_ms)
         )
-        
-        if connection.is_connected():
-            print("Successfully connected to MySQL database")
-            return connection
-            
+        connection.commit()
+        log.info(f"  done in {duration_ms} ms")
+        applied.append(version)
+    cursor.close()
+    return applied
+
+
+def update_table_structure(database=None):
+    """
+    Bring the employees table up to the latest schema without dropping it
+    """
+    try:
+        with get_connection(database) as connection:
+            applied = run_migrations(connection)
+            if applied:
+                log.info(f"Applied {len(applied)} migration(s); schema is at version {applied[-1]}")
+            else:
+                log.info("Schema is already up to date")
+
+            # Verify the data survived (headcount from the summary, not a scan)
+            count = read_summary(connection)['all']['headcount']
+            log.info(f"Total records in the employees table: {count}")
+            return True
+
     except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
+        log.error(f"Error updating table structure: {e}")
+        return False
+
 
-def update_table_structure():
+def show_status(database=None):
     """
-    Drop the old employees table and create a new one with the correct structure
+    Print which migrations have been applied and which are pending
     """
-    connection = connect_to_database()
-    
-    if connection:
-        try:
-            cursor = connection.cursor()
-            
-            # Drop the old table if it exists
-            cursor.execute("DROP TABLE IF EXISTS employees;")
-            print("Dropped old employees table if it existed")
-            
-            # Create the new employees table with the specified structure
-            create_table_query = """
-            CREATE TABLE employees (
-                emp_id INT AUTO_INCREMENT PRIMARY KEY,
-                name TEXT NOT NULL,
-                monthly_salary DECIMAL(10, 2) NOT NULL,
-                age INT NOT NULL,
-                yearly_salary DECIMAL(10, 2) NOT NULL
-            )
-            """
-            
-            cursor.execute(create_table_query)
-            connection.commit()
-            print("Created new employees table with correct structure:")
-            print("  - emp_id: integer primary key")
-            print("  - name: text")
-            print("  - monthly_salary: REAL")
-            print("  - age: integer")
-            print("  - yearly_salary: REAL")
-            
-            # Insert sample data
-            sample_employees = [
-                ("Tiger Nixon", 320800.00, 61, 320800.00 * 12),
-                ("Garrett Winters", 170750.00, 63, 170750.00 * 12),
-                ("Ashton Cox", 86000.00, 66, 86000.00 * 12),
-                ("Cedric Kelly", 433060.00, 22, 433060.00 * 12),
-                ("Airi Satou", 162700.00, 33, 162700.00 * 12)
-            ]
-            
-            # Insert sample data
-            insert_query = """
-            INSERT INTO employees (name, monthly_salary, age, yearly_salary) 
-            VALUES (%s, %s, %s, %s)
-            """
-            
-            for emp in sample_employees:
-                cursor.execute(insert_query, emp)
-            
-            connection.commit()
-            print(f"Successfully inserted {len(sample_employees)} employees into the new table")
-            
-            # Verify the data
-            cursor.execute("SELECT COUNT(*) FROM employees;")
-            count = cursor.fetchone()[0]
-            print(f"Total records in the new employees table: {count}")
-            
-        except mysql.connector.Error as e:
-            print(f"Error updating table structure: {e}")
-        
-        connection.close()
+    try:
+        with get_connection(database) as connection:
+            applied = applied_versions(connection)
+    except mysql.connector.Error as e:
+        log.error(f"Error reading migration status: {e}")
+        return False
+
+    for version, description, _ in MIGRATIONS:
+        state = 'applied' if version in applied else 'pending'
+        print(f"{version:>3}  {state:<8} {description}")
+    return True
+
 
 if __name__ == "__main__":
-    update_table_structure()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to the employees table")
+    parser.add_argument('--status', action='store_true', help="list applied and pending migrations only")
+    args = parser.parse_args()
+
+    if args.status:
+        show_status()
+    else:
+        update_table_structure()